@@ -1,7 +1,8 @@
 import torch
 from torch.autograd import Variable
 import numpy as np
-import pywt
+from filter_bank import get_filters, get_inv_filters
+from wt_engine import wt, iwt
 
 def load_UNET_checkpoint(model, optimizer, model_type, args):
     checkpoint = torch.load(args.output_dir + '/UNET_pixel_model_{}_itr{}.pth'.format(model_type, args.checkpoint), map_location=args.device)
@@ -31,56 +32,11 @@ def load_UNET_weights(model, model_type, args):
 
 
 ############### WT FUNCTIONS ###############
-def wt(vimg, filters, levels=1):
-    bs = vimg.shape[0]
-    h = vimg.size(2)
-    w = vimg.size(3)
-    vimg = vimg.reshape(-1, 1, h, w)
-    padded = torch.nn.functional.pad(vimg,(2,2,2,2))
-    res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]),stride=2)
-    if levels>1:
-        res[:,:1] = wt(res[:,:1], filters, levels-1)
-        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
-        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
-        res[:,1:] = res[:,1:]*1.
-    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
-    return res.reshape(bs, -1, h, w)
-
 def create_filters(device, wt_fn='bior2.2'):
-    w = pywt.Wavelet(wt_fn)
-    dec_hi = torch.Tensor(w.dec_hi[::-1]).to(device)
-    dec_lo = torch.Tensor(w.dec_lo[::-1]).to(device)
-    filters = torch.stack([dec_lo.unsqueeze(0)*dec_lo.unsqueeze(1),
-                           dec_lo.unsqueeze(0)*dec_hi.unsqueeze(1),
-                           dec_hi.unsqueeze(0)*dec_lo.unsqueeze(1),
-                           dec_hi.unsqueeze(0)*dec_hi.unsqueeze(1)], dim=0)
-    return filters
+    return get_filters(wt_fn, device)
 
 def create_inv_filters(device, wt_fn='bior2.2'):
-    w = pywt.Wavelet(wt_fn)
-
-    rec_hi = torch.Tensor(w.rec_hi).to(device)
-    rec_lo = torch.Tensor(w.rec_lo).to(device)
-    
-    inv_filters = torch.stack([rec_lo.unsqueeze(0)*rec_lo.unsqueeze(1),
-                               rec_lo.unsqueeze(0)*rec_hi.unsqueeze(1),
-                               rec_hi.unsqueeze(0)*rec_lo.unsqueeze(1),
-                               rec_hi.unsqueeze(0)*rec_hi.unsqueeze(1)], dim=0)
-
-    return inv_filters
-
-def iwt(vres, inv_filters, levels=1):
-    bs = vres.shape[0]
-    h = vres.size(2)
-    w = vres.size(3)
-    vres = vres.reshape(-1, 1, h, w)
-    res = vres.contiguous().view(-1, h//2, 2, w//2).transpose(1, 2).contiguous().view(-1, 4, h//2, w//2).clone()
-    if levels > 1:
-        res[:,:1] = iwt(res[:,:1], inv_filters, levels=levels-1)
-    res = torch.nn.functional.conv_transpose2d(res, Variable(inv_filters[:,None]),stride=2)
-    res = res[:,:,2:-2,2:-2] #removing padding
-
-    return res.reshape(bs, -1, h, w)
+    return get_inv_filters(wt_fn, device)
 
 ############### COLLATE & PAD FUNCTIONS ###############
 
@@ -1,5 +1,7 @@
 import torch
 import argparse
+from wt_engine import set_wt_backend, available_wt_backends
+from filter_bank import set_filter_cache_dir
 
 def parse_args():
     parser = argparse.ArgumentParser(description='UNet training for 128 level masks on whole dataset')
@@ -13,16 +15,30 @@ def parse_args():
                         help='Batch size for train dataset')
     parser.add_argument('--image_size', type=int, default=256, 
                         help='Image size for train dataset')
+    parser.add_argument('--patch_size', type=int, default=32,
+                        help='Size of the WT patches seen by the UNets, the image size must be a power of 2 multiple (default: %(default)s)')
     parser.add_argument('--workers', type=int, default=4, 
                         help='Number of workers for dataloader')                    
+    parser.add_argument('--worker_wt', action='store_true', default=False,
+                        help='Run the WT of each batch on the CPU in the dataloader workers instead of on the device')
+    parser.add_argument('--worker_threads', type=int, default=1,
+                        help='Torch threads of each dataloader worker with --worker_wt (default: %(default)s)')
     parser.add_argument('--mask_dim', type=int, default=64,
                         help='Dimension of mask trying to reconstruct (32 / 64 / 128')
     parser.add_argument('--dataset', type=str, default='imagenet',
                         help='Name of dataset to train on (imagenet, lsun-bedroom, lsun-church_outdoor, ...)')
+    parser.add_argument('--wt_fn', type=str, default='bior2.2',
+                        help='Wavelet of the WT/IWT filters (default: %(default)s)')
+    parser.add_argument('--wt_backend', type=str, default='dense', choices=available_wt_backends(),
+                        help='Backend used for all WT/IWT calls (default: %(default)s)')
+    parser.add_argument('--filter_cache_dir', type=str, default='',
+                        help='Directory caching the wavelet taps so that pywt is only needed once (default: %(default)s)')
 
     # Model arguments
     parser.add_argument('--lr', type=float, default=1e-4,
                         help='Learning rate')
+    parser.add_argument('--band_weights', type=float, nargs=3, default=None,
+                        help='Weights of the tr, bl and br mask losses (default: unweighted sum)')
 
     # Train arguments
     parser.add_argument('--num_epochs', type=int, default=300, 
@@ -50,6 +66,10 @@ def parse_args():
                         help='Path to load weights from (for evaluation) (default: %(default)s)')           
     parser.add_argument('--sample_file', type=str, default='',
                         help='Path to samples from BigGAN(default: %(default)s)')      
+    parser.add_argument('--coeff_bits', type=int, default=0, choices=[0, 8, 16],
+                        help='Store the eval masks and TL patches quantized to 8/16 bits and sparse coded, 0 for float32 hdf5 (default: %(default)s)')
+    parser.add_argument('--coeff_threshold', type=float, default=0.,
+                        help='HF coefficients below this are stored as 0 with --coeff_bits (default: %(default)s)')
 
     # Model weights for 128 and 256
     parser.add_argument('--model_128_weights', type=str, default='',
@@ -63,4 +83,8 @@ def parse_args():
     # Use GPU, if available
     args.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
+    # Select WT backend globally
+    set_wt_backend(args.wt_backend)
+    set_filter_cache_dir(args.filter_cache_dir)
+
     return args
\ No newline at end of file
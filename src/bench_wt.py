@@ -0,0 +1,1212 @@
+import os
+import time
+import tempfile
+import argparse
+import numpy as np
+import torch
+from torch.profiler import profile, ProfilerActivity
+
+from wt_engine import wt, iwt, available_wt_backends, get_backend_levels, _wt, _iwt
+from wt_utils import *
+from wt_codec import CODEC_BITS, encode_coeffs, decode_coeffs, compression_ratio
+from wt_reversible import wt_int, iwt_int, int_to_float_coeffs
+from losses import MultiPatchMSELoss
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Throughput benchmarks for the wavelet transform engine')
+
+    parser.add_argument('--bench', type=str, default='backends', choices=list(BENCHES),
+                        help='Benchmark to run')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[64, 128],
+                        help='Batch sizes to benchmark')
+    parser.add_argument('--image_sizes', type=int, nargs='+', default=[256, 512],
+                        help='Image sizes to benchmark')
+    parser.add_argument('--levels', type=int, default=3,
+                        help='Number of WT levels')
+    parser.add_argument('--patch_size', type=int, default=32,
+                        help='Patch size of the pyramid benchmark')
+    parser.add_argument('--tile', type=int, default=512,
+                        help='Tile size (coefficients per level) of the tiled benchmark')
+    parser.add_argument('--codec_thresholds', type=float, nargs='+', default=[0., 1e-3, 1e-2],
+                        help='HF thresholds of the codec benchmark')
+    parser.add_argument('--max_levels', type=int, default=4,
+                        help='Levels 1..max_levels are compared by the levels benchmark')
+    parser.add_argument('--backends', type=str, nargs='+', default=[b for b in available_wt_backends() if b != 'haar'],
+                        help='WT backends to compare (first one is the baseline), haar is compared by the haar benchmark')
+    parser.add_argument('--iters', type=int, default=10,
+                        help='Timed iterations per configuration')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='Untimed warmup iterations per configuration')
+    parser.add_argument('--compile_backend', type=str, default='inductor',
+                        help='torch.compile backend of the modules benchmark')
+    parser.add_argument('--data_dir', type=str, default='',
+                        help='Image folder for the precision benchmark, random 1/f (natural image like) images if empty')
+    parser.add_argument('--worker_threads', type=int, nargs='+', default=[1, 2, 4],
+                        help='Torch thread counts of a dataloader worker for the collate benchmark')
+    parser.add_argument('--max_workers', type=int, default=0,
+                        help='Largest thread pool of the parallel benchmark, 0 for all the cores')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='torch intra-op threads on CPU (0 keeps the default)')
+
+    args = parser.parse_args()
+
+    # Use GPU, if available
+    args.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+    return args
+
+
+def sync(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+# Average wall time of fn() in seconds
+def time_fn(fn, device, iters, warmup):
+    for _ in range(warmup):
+        fn()
+    sync(device)
+
+    start_time = time.time()
+    for _ in range(iters):
+        fn()
+    sync(device)
+
+    return (time.time() - start_time) / iters
+
+
+# Peak memory (bytes) allocated by fn() on top of what was allocated before the call, and total bytes allocated
+def peak_memory(fn, device):
+    if device.type == 'cuda':
+        sync(device)
+        base = torch.cuda.memory_allocated(device)
+        total = torch.cuda.memory_stats(device)['allocated_bytes.all.allocated']
+        torch.cuda.reset_peak_memory_stats(device)
+        fn()
+        sync(device)
+        total = torch.cuda.memory_stats(device)['allocated_bytes.all.allocated'] - total
+        return torch.cuda.max_memory_allocated(device) - base, total
+
+    # On CPU, replay the allocation/free events recorded by the profiler
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    events = [e for e in prof.profiler.kineto_results.events() if e.name() == '[memory]']
+    events = sorted(events, key=lambda e: e.start_ns())
+    cur = peak = total = 0
+    for e in events:
+        cur += e.nbytes()
+        peak = max(peak, cur)
+        total += max(e.nbytes(), 0)
+
+    return peak, total
+
+
+# Bytes allocated by fn() that are still alive once it returns: its result and everything its autograd graph saved
+def retained_memory(fn, device):
+    if device.type == 'cuda':
+        sync(device)
+        base = torch.cuda.memory_allocated(device)
+        res = fn()
+        sync(device)
+        return torch.cuda.memory_allocated(device) - base
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        res = fn()
+    events = [e for e in prof.profiler.kineto_results.events() if e.name() == '[memory]']
+
+    return sum(e.nbytes() for e in events)
+
+
+# First batch of an image folder, preprocessed as in the train/eval scripts
+def folder_images(data_dir, batch_size, image_size, device):
+    from torchvision import datasets, transforms
+    dataset = datasets.ImageFolder(data_dir, transform=transforms.Compose([
+                                   transforms.Resize(image_size),
+                                   transforms.CenterCrop(image_size),
+                                   transforms.ToTensor()]))
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=True)
+
+    return next(iter(loader))[0].to(device)
+
+
+################# RECURSIVE REFERENCE #################
+
+# Recursive multi-level WT/IWT as they were before the iterative implementation, kept as the levels benchmark baseline
+def wt_recursive(vimg, filters, levels=1, backend='dense'):
+    wt_level, _ = get_backend_levels(backend)
+    bs = vimg.shape[0]
+    h = vimg.size(2)
+    w = vimg.size(3)
+    vimg = vimg.reshape(-1, 1, h, w)
+    res = wt_level(vimg, filters)
+    if levels>1:
+        res[:,:1] = wt_recursive(res[:,:1], filters, levels-1, backend)
+        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
+        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
+        res[:,1:] = res[:,1:]*1.
+    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
+    return res.reshape(bs, -1, h, w)
+
+
+def iwt_recursive(vres, inv_filters, levels=1, backend='dense'):
+    _, iwt_level = get_backend_levels(backend)
+    bs = vres.shape[0]
+    h = vres.size(2)
+    w = vres.size(3)
+    vres = vres.reshape(-1, 1, h, w)
+    res = vres.contiguous().view(-1, h//2, 2, w//2).transpose(1, 2).contiguous().view(-1, 4, h//2, w//2).clone()
+    if levels > 1:
+        res[:,:1] = iwt_recursive(res[:,:1], inv_filters, levels=levels-1, backend=backend)
+    res = iwt_level(res, inv_filters)
+
+    return res.reshape(bs, -1, h, w)
+
+
+# wt_128_3quads/wt_256_3quads as chains of wt calls on already transformed quadrants, kept as the packets benchmark baseline
+def wt_128_3quads_chain(img, filters, levels, backend=None):
+    data = img.clone()
+    data = wt(data, filters, levels, backend)[:, :, :128, :128]
+    h = data.shape[2]
+    w = data.shape[3]
+
+    tr = wt(data[:, :, :h//2, w//2:], filters, levels=1, backend=backend)
+    bl = wt(data[:, :, h//2:, :w//2], filters, levels=1, backend=backend)
+    br = wt(data[:, :, h//2:, w//2:], filters, levels=1, backend=backend)
+
+    data[:, :, :h//2, w//2:] = tr
+    data[:, :, h//2:, :w//2] = bl
+    data[:, :, h//2:, w//2:] = br
+
+    return data
+
+
+def wt_256_3quads_chain(data, filters, levels, backend=None):
+    h = data.shape[2]
+    w = data.shape[3]
+
+    data = wt(data, filters, levels, backend)[:, :, :256, :256]
+    data[:, :, :64, 64:128] = wt(data[:, :, :64, 64:128], filters, levels=1, backend=backend)
+    data[:, :, 64:128, :64] = wt(data[:, :, 64:128, :64], filters, levels=1, backend=backend)
+    data[:, :, 64:128, 64:128] = wt(data[:, :, 64:128, 64:128], filters, levels=1, backend=backend)
+
+    data[:, :, :h//2, w//2:] = wt_128_3quads_chain(data[:, :, :h//2, w//2:], filters, levels=2, backend=backend)
+    data[:, :, h//2:, :w//2] = wt_128_3quads_chain(data[:, :, h//2:, :w//2], filters, levels=2, backend=backend)
+    data[:, :, h//2:, w//2:] = wt_128_3quads_chain(data[:, :, h//2:, w//2:], filters, levels=2, backend=backend)
+
+    return data
+
+
+# Decoder output => pixels chain of the eval loops before iwt_patches_256, kept as the recon benchmark baseline
+def reconstruct_256_chain(Y_128_patches, recon_mask_256_all, inv_filters, device):
+    Y_64_patches = Y_128_patches[:, :12]
+    recon_mask_128_tr, recon_mask_128_bl, recon_mask_128_br = split_masks_from_channels(Y_128_patches[:, 12:])
+    recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
+
+    recon_mask_128_tr_img = collate_channels_to_img(recon_mask_128_tr, device)
+    recon_mask_128_bl_img = collate_channels_to_img(recon_mask_128_bl, device)
+    recon_mask_128_br_img = collate_channels_to_img(recon_mask_128_br, device)
+
+    recon_mask_128_tr_img = iwt(recon_mask_128_tr_img, inv_filters, levels=1)
+    recon_mask_128_bl_img = iwt(recon_mask_128_bl_img, inv_filters, levels=1)
+    recon_mask_128_br_img = iwt(recon_mask_128_br_img, inv_filters, levels=1)
+
+    Y_64 = collate_channels_to_img(Y_64_patches, device)
+    recon_mask_128_iwt = collate_patches_to_img(Y_64, recon_mask_128_tr_img, recon_mask_128_bl_img, recon_mask_128_br_img, device)
+
+    recon_mask_256_tr_img = collate_16_channels_to_img(recon_mask_256_tr, device)
+    recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, device)
+    recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, device)
+
+    zeros = torch.zeros(recon_mask_256_tr_img.shape)
+
+    recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
+    recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
+    recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
+
+    recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img, device=device)
+    recon_mask_256_iwt[:, :, :128, :128] = recon_mask_128_iwt
+
+    return iwt(recon_mask_256_iwt, inv_filters, levels=3)
+
+
+# Quadrant slicing layouts of wt_utils before grid_to_patches/channels_to_grid, kept as the layout benchmark baseline
+def grid_to_patches_sliced(data, depth=1):
+    h = data.shape[2]
+    patches = torch.stack(get_4masks(data, h//2), dim=1)
+    if depth == 1:
+        return patches
+
+    return torch.cat([grid_to_patches_sliced(patches[:, q], depth-1) for q in range(4)], dim=1)
+
+
+def channels_to_grid_sliced(img_channels, depth=1, device='cpu'):
+    c = img_channels.shape[1] // 4
+    quads = [img_channels[:, q*c:(q+1)*c] for q in range(4)]
+    if depth > 1:
+        quads = [channels_to_grid_sliced(quad, depth-1, device) for quad in quads]
+
+    return collate_patches_to_img(*quads, device=device)
+
+
+# eval_unet256 reconstruction before CoefficientPyramid: masks collated to quadrants, inverted one by one and padded
+def reconstruct_masks_chain(Y_corner, recon_mask_all, inv_filters, size, levels, patch):
+    recon_mask_tr, recon_mask_bl, recon_mask_br = split_masks_from_channels(recon_mask_all)
+    depth = pyramid_levels(Y_corner.shape[2], patch)
+    quads = [iwt_pyramid(channels_to_grid(mask, depth), inv_filters, patch=patch) for mask in (recon_mask_tr, recon_mask_bl, recon_mask_br)]
+
+    return iwt_lowpass(collate_patches_to_img(Y_corner, *quads), inv_filters, size, levels)
+
+
+# wt_haar/iwt_haar of old/vae_models.py as they were before the haar backend, kept as the haar benchmark baseline
+def wt_haar_conv(vimg, filters, levels=1):
+    bs = vimg.shape[0]
+    h = vimg.size(2)
+    w = vimg.size(3)
+    vimg = vimg.reshape(-1, 1, h, w)
+    res = torch.nn.functional.conv2d(vimg, filters[:,None], stride=2)
+    if levels>1:
+        res[:,:1] = wt_haar_conv(res[:,:1], filters, levels-1)
+        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
+        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
+        res[:,1:] = res[:,1:]*1.
+    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
+
+    return res.reshape(bs, -1, h, w)
+
+
+def iwt_haar_conv(vres, inv_filters, levels=1):
+    bs = vres.shape[0]
+    h = vres.size(2)
+    w = vres.size(3)
+    vres = vres.reshape(-1, 1, h, w)
+    res = vres.contiguous().view(-1, h//2, 2, w//2).transpose(1, 2).contiguous().view(-1, 4, h//2, w//2).clone()
+    if levels > 1:
+        res[:,:1] = iwt_haar_conv(res[:,:1], inv_filters, levels=levels-1)
+    res = torch.nn.functional.conv_transpose2d(res, inv_filters[:,None], stride=2)
+
+    return res.reshape(bs, -1, h, w)
+
+
+################# BENCHMARKS #################
+
+# Compares WT/IWT throughput (images/s) of each backend against the first one
+def bench_backends(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+
+    print('device={} levels={} iters={}'.format(args.device, args.levels, args.iters))
+    print('{:>6} {:>6} {:>12} {:>12} {:>12} {:>9} {:>9}'.format('batch', 'size', 'backend', 'wt img/s', 'iwt img/s', 'wt x', 'iwt x'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size, device=args.device)
+                Y = wt(data, filters, args.levels)
+                base = None
+
+                for backend in args.backends:
+                    wt_time = time_fn(lambda: wt(data, filters, args.levels, backend), args.device, args.iters, args.warmup)
+                    iwt_time = time_fn(lambda: iwt(Y, inv_filters, args.levels, backend), args.device, args.iters, args.warmup)
+                    if base is None:
+                        base = (wt_time, iwt_time)
+
+                    print('{:>6} {:>6} {:>12} {:>12.1f} {:>12.1f} {:>8.2f}x {:>8.2f}x'.format(
+                        batch_size, image_size, backend, batch_size / wt_time, batch_size / iwt_time,
+                        base[0] / wt_time, base[1] / iwt_time))
+
+                del data, Y
+
+
+# Peak memory and wall time of the iterative wt/iwt against the recursive reference, for levels 1..max_levels
+def bench_levels(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+    backend = args.backends[0]
+    mb = 1024. * 1024.
+
+    print('device={} backend={} iters={} (memory in MB)'.format(args.device, backend, args.iters))
+    print('{:>6} {:>6} {:>4} {:>4} {:>10} {:>10} {:>11} {:>11} {:>9} {:>9} {:>8}'.format(
+        'batch', 'size', 'op', 'lvl', 'rec peak', 'iter peak', 'rec alloc', 'iter alloc', 'rec ms', 'iter ms', 'speedup'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size, device=args.device)
+
+                for levels in range(1, args.max_levels + 1):
+                    Y = wt(data, filters, levels, backend)
+                    ops = (('wt', lambda: wt_recursive(data, filters, levels, backend), lambda: wt(data, filters, levels, backend)),
+                           ('iwt', lambda: iwt_recursive(Y, inv_filters, levels, backend), lambda: iwt(Y, inv_filters, levels, backend)))
+
+                    for name, rec_fn, iter_fn in ops:
+                        rec_peak, rec_alloc = peak_memory(rec_fn, args.device)
+                        iter_peak, iter_alloc = peak_memory(iter_fn, args.device)
+                        rec_time = time_fn(rec_fn, args.device, args.iters, args.warmup)
+                        iter_time = time_fn(iter_fn, args.device, args.iters, args.warmup)
+
+                        print('{:>6} {:>6} {:>4} {:>4} {:>10.1f} {:>10.1f} {:>11.1f} {:>11.1f} {:>9.2f} {:>9.2f} {:>7.2f}x'.format(
+                            batch_size, image_size, name, levels, rec_peak / mb, iter_peak / mb,
+                            rec_alloc / mb, iter_alloc / mb, 1000 * rec_time, 1000 * iter_time, rec_time / iter_time))
+
+                    del Y
+                del data
+
+
+# Packet engine against the chained 3quads layouts on 256 x 256 images (max abs difference should be 0)
+def bench_packets(args):
+    filters = create_filters(device=args.device)
+    layouts = (('128_3quads', wt_128_3quads_chain, wt_128_3quads),
+               ('256_3quads', wt_256_3quads_chain, wt_256_3quads))
+
+    print('device={} levels={} iters={}'.format(args.device, args.levels, args.iters))
+    print('{:>6} {:>12} {:>12} {:>10} {:>10} {:>9} {:>10}'.format('batch', 'layout', 'backend', 'chain ms', 'packet ms', 'speedup', 'max diff'))
+
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            data = torch.rand(batch_size, 3, 256, 256, device=args.device)
+
+            for name, chain_fn, packet_fn in layouts:
+                for backend in args.backends:
+                    diff = (chain_fn(data, filters, args.levels, backend) - packet_fn(data, filters, args.levels, backend)).abs().max().item()
+                    chain_time = time_fn(lambda: chain_fn(data, filters, args.levels, backend), args.device, args.iters, args.warmup)
+                    packet_time = time_fn(lambda: packet_fn(data, filters, args.levels, backend), args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>12} {:>12} {:>10.2f} {:>10.2f} {:>8.2f}x {:>10.2e}'.format(
+                        batch_size, name, backend, 1000 * chain_time, 1000 * packet_time, chain_time / packet_time, diff))
+
+            del data
+
+
+# Fused iwt_patches_256 against the eval reconstruction chain, on random 128 level patches and 256 level masks
+def bench_recon(args):
+    inv_filters = create_inv_filters(device=args.device)
+    synthesis = create_packet_synthesis(inv_filters)
+
+    print('device={} iters={}'.format(args.device, args.iters))
+    print('{:>6} {:>10} {:>10} {:>9} {:>10}'.format('batch', 'chain ms', 'fused ms', 'speedup', 'max diff'))
+
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            Y_128_patches = torch.randn(batch_size, 48, 32, 32, device=args.device)
+            recon_mask_256_all = torch.randn(batch_size, 144, 32, 32, device=args.device)
+            chain_fn = lambda: reconstruct_256_chain(Y_128_patches, recon_mask_256_all, inv_filters, args.device)
+            fused_fn = lambda: iwt_patches_256(Y_128_patches, recon_mask_256_all, synthesis)
+
+            diff = (chain_fn() - fused_fn()).abs().max().item()
+            chain_time = time_fn(chain_fn, args.device, args.iters, args.warmup)
+            fused_time = time_fn(fused_fn, args.device, args.iters, args.warmup)
+
+            print('{:>6} {:>10.2f} {:>10.2f} {:>8.2f}x {:>10.2e}'.format(
+                batch_size, 1000 * chain_time, 1000 * fused_time, chain_time / fused_time, diff))
+
+            del Y_128_patches, recon_mask_256_all
+
+
+# Conv-free haar backend against the conv Haar WT/IWT, max diffs against the conv output and of the round trip
+def bench_haar(args):
+    filters = create_filters(device=args.device, wt_fn='haar')
+    inv_filters = create_inv_filters(device=args.device, wt_fn='haar')
+
+    print('device={} levels={} iters={}'.format(args.device, args.levels, args.iters))
+    print('{:>6} {:>6} {:>4} {:>10} {:>10} {:>9} {:>10} {:>10}'.format('batch', 'size', 'op', 'conv ms', 'haar ms', 'speedup', 'max diff', 'roundtrip'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size, device=args.device)
+                Y = wt_haar_conv(data, filters, args.levels)
+                roundtrip = (iwt(wt(data, filters, args.levels), inv_filters, args.levels) - data).abs().max().item()
+                ops = (('wt', lambda: wt_haar_conv(data, filters, args.levels), lambda: wt(data, filters, args.levels)),
+                       ('iwt', lambda: iwt_haar_conv(Y, inv_filters, args.levels), lambda: iwt(Y, inv_filters, args.levels)))
+
+                for name, conv_fn, haar_fn in ops:
+                    diff = (conv_fn() - haar_fn()).abs().max().item()
+                    conv_time = time_fn(conv_fn, args.device, args.iters, args.warmup)
+                    haar_time = time_fn(haar_fn, args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>4} {:>10.2f} {:>10.2f} {:>8.2f}x {:>10.2e} {:>10.2e}'.format(
+                        batch_size, image_size, name, 1000 * conv_time, 1000 * haar_time, conv_time / haar_time, diff, roundtrip))
+
+                del data, Y
+
+
+# gradcheck of the autograd functions, then peak memory of forward + backward against plain autograd through the transform
+# The lifting backend works in place and cannot be differentiated without the autograd functions
+def bench_autograd(args):
+    mb = 1024. * 1024.
+
+    print('gradcheck (float64, 2 x 2 x 16 x 16)')
+    for wt_fn, backends in (('bior2.2', args.backends), ('haar', ['haar'])):
+        filters = create_filters(device=args.device, wt_fn=wt_fn).double()
+        inv_filters = create_inv_filters(device=args.device, wt_fn=wt_fn).double()
+        for backend in backends:
+            for levels in range(1, args.levels + 1):
+                x = torch.randn(2, 2, 16, 16, dtype=torch.float64, device=args.device, requires_grad=True)
+                ok_wt = torch.autograd.gradcheck(lambda x: wt(x, filters, levels, backend), (x,))
+                ok_iwt = torch.autograd.gradcheck(lambda x: iwt(x, inv_filters, levels, backend), (x,))
+                print('{:>8} {:>10} {:>2} wt={} iwt={}'.format(wt_fn, backend, levels, ok_wt, ok_iwt))
+
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+
+    # saved: memory kept alive by the forward besides its output, peak and ms: forward + backward
+    print('device={} levels={} iters={} (memory in MB)'.format(args.device, args.levels, args.iters))
+    print('{:>6} {:>6} {:>10} {:>7} {:>11} {:>10} {:>10} {:>10} {:>9} {:>9} {:>8}'.format(
+        'batch', 'size', 'backend', 'op', 'plain saved', 'func saved', 'plain peak', 'func peak', 'plain ms', 'func ms', 'speedup'))
+
+    for image_size in args.image_sizes:
+        for batch_size in args.batch_sizes:
+            x = torch.rand(batch_size, 3, image_size, image_size, device=args.device, requires_grad=True)
+
+            for backend in args.backends:
+                ops = (('wt', lambda: _wt(x, filters, args.levels, backend), lambda: wt(x, filters, args.levels, backend)),
+                       ('iwt', lambda: _iwt(x, inv_filters, args.levels, backend), lambda: iwt(x, inv_filters, args.levels, backend)),
+                       ('wt+iwt', lambda: _iwt(_wt(x, filters, args.levels, backend), inv_filters, args.levels, backend),
+                        lambda: iwt(wt(x, filters, args.levels, backend), inv_filters, args.levels, backend)))
+
+                for name, plain_fn, func_fn in ops:
+                    def step(fn):
+                        x.grad = None
+                        fn().sum().backward()
+
+                    output = x.numel() * x.element_size()
+                    func_saved = retained_memory(func_fn, args.device) - output
+                    func_peak, _ = peak_memory(lambda: step(func_fn), args.device)
+                    func_time = time_fn(lambda: step(func_fn), args.device, args.iters, args.warmup)
+                    if backend == 'lifting':
+                        print('{:>6} {:>6} {:>10} {:>7} {:>11} {:>10.1f} {:>10} {:>10.1f} {:>9} {:>9.2f} {:>8}'.format(
+                            batch_size, image_size, backend, name, 'n/a', func_saved / mb, 'n/a', func_peak / mb,
+                            'n/a', 1000 * func_time, 'n/a'))
+                        continue
+
+                    plain_saved = retained_memory(plain_fn, args.device) - output
+                    plain_peak, _ = peak_memory(lambda: step(plain_fn), args.device)
+                    plain_time = time_fn(lambda: step(plain_fn), args.device, args.iters, args.warmup)
+                    print('{:>6} {:>6} {:>10} {:>7} {:>11.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>9.2f} {:>9.2f} {:>7.2f}x'.format(
+                        batch_size, image_size, backend, name, plain_saved / mb, func_saved / mb, plain_peak / mb, func_peak / mb,
+                        1000 * plain_time, 1000 * func_time, plain_time / func_time))
+
+            del x
+
+
+# WT modules in every layout against the functions, scripted and compiled with fullgraph=True (fails on any graph break)
+def bench_modules(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+    layouts = (('plain', args.levels, lambda x: wt(x, filters, args.levels), lambda y: iwt(y, inv_filters, args.levels)),
+               ('128_3quads', 2, lambda x: wt_128_3quads(x, filters, 2), lambda y: apply_iwt_quads_128(y, inv_filters)),
+               ('256_3quads', args.levels, lambda x: wt_256_3quads(x, filters, args.levels),
+                lambda y: iwt_packets(y, inv_filters, packets_256_3quads(256, args.levels))))
+
+    print('device={} levels={} iters={} compile={}'.format(args.device, args.levels, args.iters, args.compile_backend))
+    print('{:>6} {:>12} {:>4} {:>10} {:>10} {:>10} {:>11} {:>10}'.format(
+        'batch', 'layout', 'op', 'func ms', 'module ms', 'script ms', 'compiled ms', 'max diff'))
+
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            for layout, levels, wt_fn, iwt_fn in layouts:
+                size = 128 if layout == '128_3quads' else 256
+                data = torch.rand(batch_size, 3, size, size, device=args.device)
+                coeffs = wt_fn(data)
+                ops = (('wt', WaveletTransform(levels, layout=layout).to(args.device), wt_fn, data),
+                       ('iwt', InverseWaveletTransform(levels, layout=layout).to(args.device), iwt_fn, coeffs))
+
+                for name, module, fn, x in ops:
+                    scripted = torch.jit.script(module)
+                    compiled = torch.compile(module, fullgraph=True, backend=args.compile_backend)
+                    diff = max((fn(x) - m(x)).abs().max().item() for m in (module, scripted, compiled))
+                    times = [time_fn(lambda: f(x), args.device, args.iters, args.warmup) for f in (fn, module, scripted, compiled)]
+
+                    print('{:>6} {:>12} {:>4} {:>10.2f} {:>10.2f} {:>10.2f} {:>11.2f} {:>10.2e}'.format(
+                        batch_size, layout, name, *[1000 * t for t in times], diff))
+
+                del data, coeffs
+
+
+# Max/mean error of the coefficients wt(x) and of the reconstruction iwt(wt(x)) per dtype, backend and level, against the
+# same transforms in fp64 (iwt(wt(x)) differs from x at the borders whatever the precision, so x is not the reference)
+def bench_precision(args):
+    dtypes = (torch.float32, torch.float16, torch.bfloat16)
+    ref_filters = create_filters(device=args.device).double()
+    ref_inv_filters = create_inv_filters(device=args.device).double()
+
+    print('device={} data={}'.format(args.device, args.data_dir or '1/f noise'))
+    print('{:>6} {:>6} {:>9} {:>10} {:>4} {:>10} {:>10} {:>10} {:>10}'.format(
+        'batch', 'size', 'dtype', 'backend', 'lvl', 'wt max', 'wt mean', 'iwt max', 'iwt mean'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                if args.data_dir:
+                    data = folder_images(args.data_dir, batch_size, image_size, args.device)
+                else:
+                    data = natural_images(batch_size, image_size, args.device)
+
+                for levels in range(1, args.max_levels + 1):
+                    ref_Y = wt(data.double(), ref_filters, levels, 'dense')
+                    ref_recon = iwt(ref_Y, ref_inv_filters, levels, 'dense')
+
+                    for dtype in dtypes:
+                        filters = create_filters(device=args.device).to(dtype)
+                        inv_filters = create_inv_filters(device=args.device).to(dtype)
+                        for backend in args.backends:
+                            Y = wt(data.to(dtype), filters, levels, backend)
+                            wt_err = (Y.double() - ref_Y).abs()
+                            iwt_err = (iwt(Y, inv_filters, levels, backend).double() - ref_recon).abs()
+
+                            print('{:>6} {:>6} {:>9} {:>10} {:>4} {:>10.2e} {:>10.2e} {:>10.2e} {:>10.2e}'.format(
+                                batch_size, image_size, str(dtype).split('.')[1], backend, levels,
+                                wt_err.max().item(), wt_err.mean().item(), iwt_err.max().item(), iwt_err.mean().item()))
+
+                del data
+
+
+# Grouped backend against the dense one, on NCHW and channels_last batches, for the transforms of the train loops:
+# wt_128_3quads (train_unet_128.py), wt_256_3quads (train_unet_256_real.py) and the plain wt/iwt around them
+def bench_grouped(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+    ops = (('wt', lambda x, backend: wt(x, filters, args.levels, backend)),
+           ('iwt', lambda x, backend: iwt(x, inv_filters, args.levels, backend)),
+           ('128_3quads', lambda x, backend: wt_128_3quads(x, filters, args.levels, backend)),
+           ('256_3quads', lambda x, backend: wt_256_3quads(x, filters, args.levels, backend)))
+
+    print('device={} levels={} iters={}'.format(args.device, args.levels, args.iters))
+    print('{:>6} {:>6} {:>11} {:>10} {:>12} {:>16} {:>8} {:>8} {:>10}'.format(
+        'batch', 'size', 'op', 'dense ms', 'grouped ms', 'grouped NHWC ms', 'NCHW x', 'NHWC x', 'max diff'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size, device=args.device)
+                data_nhwc = data.contiguous(memory_format=torch.channels_last)
+
+                for name, fn in ops:
+                    diff = max((fn(data, 'dense') - fn(x, 'grouped')).abs().max().item() for x in (data, data_nhwc))
+                    dense_time = time_fn(lambda: fn(data, 'dense'), args.device, args.iters, args.warmup)
+                    grouped_time = time_fn(lambda: fn(data, 'grouped'), args.device, args.iters, args.warmup)
+                    nhwc_time = time_fn(lambda: fn(data_nhwc, 'grouped'), args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>11} {:>10.2f} {:>12.2f} {:>16.2f} {:>7.2f}x {:>7.2f}x {:>10.2e}'.format(
+                        batch_size, image_size, name, 1000 * dense_time, 1000 * grouped_time, 1000 * nhwc_time,
+                        dense_time / grouped_time, dense_time / nhwc_time, diff))
+
+                del data, data_nhwc
+
+
+# Cost per pixel of wt_pyramid/iwt_pyramid as the image size grows, for the pyramids used by the decoders:
+#   scaled     whole image, patch = size / 8 (the 256 x 256 layout scaled up, fixed tree depth)
+#   patch      whole image with patch_size patches (the tree gets one level deeper per doubling)
+#   stage      top-left 8 * patch_size of the image (the 256 stage on bigger images, LL-only levels above it)
+def bench_pyramid(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+
+    print('device={} patch={} iters={} (ns per input pixel)'.format(args.device, patch, args.iters))
+    print('{:>6} {:>6} {:>8} {:>6} {:>6} {:>6} {:>10} {:>10} {:>10}'.format(
+        'batch', 'size', 'pyramid', 'target', 'patch', 'levels', 'wt ns/px', 'iwt ns/px', 'plain ns/px'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            configs = (('scaled', image_size, image_size // 8),
+                       ('patch', image_size, patch),
+                       ('stage', min(8 * patch, image_size), patch))
+
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size, device=args.device)
+                pixels = data.numel()
+
+                for name, target, pyramid_patch in configs:
+                    levels = pyramid_levels(image_size, pyramid_patch)
+                    Y = wt_pyramid(data, filters, target, pyramid_patch)
+                    wt_time = time_fn(lambda: wt_pyramid(data, filters, target, pyramid_patch), args.device, args.iters, args.warmup)
+                    iwt_time = time_fn(lambda: iwt_pyramid(Y, inv_filters, image_size, pyramid_patch), args.device, args.iters, args.warmup)
+                    plain_time = time_fn(lambda: wt(data, filters, levels), args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>8} {:>6} {:>6} {:>6} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                        batch_size, image_size, name, target, pyramid_patch, levels,
+                        1e9 * wt_time / pixels, 1e9 * iwt_time / pixels, 1e9 * plain_time / pixels))
+
+                    del Y
+                del data
+
+
+# Tiled wt/iwt against the untiled transform, on tensors and on .npy memmaps (peak is the torch memory, in MB)
+def bench_tiled(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+    mb = 1024. * 1024.
+
+    print('device={} levels={} tile={} iters={}'.format(args.device, args.levels, args.tile, args.iters))
+    print('{:>6} {:>6} {:>4} {:>9} {:>10} {:>9} {:>10}'.format('batch', 'size', 'op', 'mode', 'ms', 'peak MB', 'max diff'))
+
+    with torch.no_grad(), tempfile.TemporaryDirectory() as tmp_dir:
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                shape = (batch_size, 3, image_size, image_size)
+                data = torch.rand(shape)
+                Y = wt(data.to(args.device), filters, args.levels).cpu()
+                recon = iwt(Y.to(args.device), inv_filters, args.levels).cpu()
+
+                src = np.lib.format.open_memmap(os.path.join(tmp_dir, 'src.npy'), 'w+', np.float32, shape)
+                src[:] = data.numpy()
+                coeffs = np.lib.format.open_memmap(os.path.join(tmp_dir, 'coeffs.npy'), 'w+', np.float32, shape)
+                coeffs[:] = Y.numpy()
+                out = np.lib.format.open_memmap(os.path.join(tmp_dir, 'out.npy'), 'w+', np.float32, shape)
+
+                ops = (('wt', 'untiled', lambda: wt(data.to(args.device), filters, args.levels).cpu(), Y),
+                       ('wt', 'tiled', lambda: wt_tiled(data, filters, args.levels, tile=args.tile), Y),
+                       ('wt', 'memmap', lambda: wt_tiled(src, filters, args.levels, out=out, tile=args.tile), Y),
+                       ('iwt', 'untiled', lambda: iwt(Y.to(args.device), inv_filters, args.levels).cpu(), recon),
+                       ('iwt', 'tiled', lambda: iwt_tiled(Y, inv_filters, args.levels, tile=args.tile), recon),
+                       ('iwt', 'memmap', lambda: iwt_tiled(coeffs, inv_filters, args.levels, out=out, tile=args.tile), recon))
+
+                for name, mode, fn, ref in ops:
+                    diff = (torch.as_tensor(np.asarray(fn())) - ref).abs().max().item()
+                    peak, _ = peak_memory(fn, args.device)
+                    run_time = time_fn(fn, args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>4} {:>9} {:>10.2f} {:>9.1f} {:>10.2e}'.format(
+                        batch_size, image_size, name, mode, 1000 * run_time, peak / mb, diff))
+
+                del data, Y, recon, src, coeffs, out
+
+
+# Compression ratio (against float32) and PSNR (pixels in [0, 1]) of the coefficient codec, for what the biggan evals store:
+#   tl       pixels of the top-left 2 * patch_size of the WT (tl_64)
+#   masks    plain WT of the image with its top-left 2 * patch_size zeroed (recon_masks / real_masks), PSNR after iwt
+def bench_codec(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+    tl_size = 2 * args.patch_size
+
+    print('device={} levels={} data={}'.format(args.device, args.levels, args.data_dir or '1/f noise'))
+    print('{:>6} {:>6} {:>6} {:>5} {:>9} {:>8} {:>9} {:>10} {:>10}'.format(
+        'batch', 'size', 'data', 'bits', 'threshold', 'ratio', 'PSNR dB', 'enc ms', 'dec ms'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                if args.data_dir:
+                    data = folder_images(args.data_dir, batch_size, image_size, args.device)
+                else:
+                    data = natural_images(batch_size, image_size, args.device)
+
+                Y = wt(data, filters, args.levels)
+                tl = iwt(Y[:, :, :tl_size, :tl_size], inv_filters, levels=1)
+                masks = Y.clone()
+                masks[:, :, :tl_size, :tl_size] = 0
+                payloads = (('tl', tl, 0, lambda x: x),
+                            ('masks', masks, args.levels, lambda x: iwt(x, inv_filters, args.levels)))
+
+                for name, coeffs, levels, to_pixels in payloads:
+                    pixels = to_pixels(coeffs)
+                    for bits in CODEC_BITS:
+                        for threshold in args.codec_thresholds:
+                            code = encode_coeffs(coeffs, levels, bits, threshold)
+                            mse = ((to_pixels(decode_coeffs(code)) - pixels) ** 2).mean().item()
+                            enc_time = time_fn(lambda: encode_coeffs(coeffs, levels, bits, threshold), args.device, args.iters, args.warmup)
+                            dec_time = time_fn(lambda: decode_coeffs(code), args.device, args.iters, args.warmup)
+
+                            print('{:>6} {:>6} {:>6} {:>5} {:>9.0e} {:>7.2f}x {:>9.2f} {:>10.2f} {:>10.2f}'.format(
+                                batch_size, image_size, name, bits, threshold, compression_ratio(code),
+                                10 * np.log10(1. / max(mse, 1e-20)), 1000 * enc_time, 1000 * dec_time))
+
+                del data, Y, tl, masks
+
+
+################# REVERSIBLE #################
+
+# Integer 5/3 of uint8 images: lossless round trip, coefficient range and size, and the cost of the float layout on demand
+def bench_reversible(args):
+    filters = create_filters(device=args.device)
+
+    print('device={} levels={} data={}'.format(args.device, args.levels, args.data_dir or '1/f noise'))
+    print('{:>6} {:>6} {:>9} {:>7} {:>7} {:>10} {:>10} {:>10} {:>10} {:>11}'.format(
+        'batch', 'size', 'lossless', 'max |c|', 'size', 'wt_int ms', 'iwt_int ms', 'float ms', 'wt ms', 'float err'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                if args.data_dir:
+                    data = folder_images(args.data_dir, batch_size, image_size, args.device)
+                else:
+                    data = natural_images(batch_size, image_size, args.device)
+                img = torch.round(data * 255).to(torch.uint8)
+                pixels = img.float() / 255
+
+                coeffs = wt_int(img, args.levels)
+                lossless = torch.equal(iwt_int(coeffs, args.levels), img)
+                err = (int_to_float_coeffs(coeffs, filters, args.levels) - wt(pixels, filters, args.levels)).abs().max().item()
+                int_time = time_fn(lambda: wt_int(img, args.levels), args.device, args.iters, args.warmup)
+                inv_time = time_fn(lambda: iwt_int(coeffs, args.levels), args.device, args.iters, args.warmup)
+                float_time = time_fn(lambda: int_to_float_coeffs(coeffs, filters, args.levels), args.device, args.iters, args.warmup)
+                wt_time = time_fn(lambda: wt(pixels, filters, args.levels), args.device, args.iters, args.warmup)
+
+                print('{:>6} {:>6} {:>9} {:>7} {:>6.2f}x {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f} {:>11.1e}'.format(
+                    batch_size, image_size, str(lossless), coeffs.abs().max().item(),
+                    coeffs.element_size() / pixels.element_size(), 1000 * int_time, 1000 * inv_time,
+                    1000 * float_time, 1000 * wt_time, err))
+
+                del data, img, pixels, coeffs
+
+
+################# PARTIAL #################
+
+# LL band of a levels WT one level at a time, every level computing and dropping the 3 other sub-bands
+def lowpass_levels(data, filters, levels):
+    for _ in range(levels):
+        h = data.size(2)
+        w = data.size(3)
+        data = wt(data, filters, levels=1)[:, :, :h//2, :w//2]
+
+    return data
+
+
+# Sub-band selective forward transforms against computing everything and cropping:
+#   ll      LL band of args.levels (the TL patch of eval_tl): full wt + crop, per-level LL, composed low-pass (wt_lowpass)
+#   128     wt_128_3quads: full wt + crop + split, per-level LL + split, composed low-pass + split (wt_packets fused=True)
+def bench_partial(args):
+    filters = create_filters(device=args.device)
+
+    print('device={} levels={} iters={}'.format(args.device, args.levels, args.iters))
+    print('{:>6} {:>6} {:>5} {:>10} {:>10} {:>10} {:>8} {:>10}'.format(
+        'batch', 'size', 'case', 'full ms', 'level ms', 'fused ms', 'speedup', 'max diff'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size, device=args.device)
+                ll_size = image_size >> args.levels
+                crop = pyramid_levels(image_size, 128)
+                spec_128 = packets_128_3quads(image_size, args.levels)
+                for _ in range(crop):
+                    spec_128 = spec_128[0]
+                split_128 = lambda x: wt_packets(x, filters, spec_128)
+                cases = (('ll', lambda: wt(data, filters, args.levels)[:, :, :ll_size, :ll_size],
+                                lambda: lowpass_levels(data, filters, args.levels),
+                                lambda: wt_lowpass(data, filters, args.levels)),
+                         ('128', lambda: split_128(wt(data, filters, crop)[:, :, :128, :128]),
+                                 lambda: split_128(lowpass_levels(data, filters, crop)),
+                                 lambda: wt_packets(data, filters, packets_128_3quads(image_size, args.levels), fused=True)))
+
+                for name, full_fn, level_fn, fused_fn in cases:
+                    diff = (fused_fn() - full_fn()).abs().max().item()
+                    full_time = time_fn(full_fn, args.device, args.iters, args.warmup)
+                    level_time = time_fn(level_fn, args.device, args.iters, args.warmup)
+                    fused_time = time_fn(fused_fn, args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>5} {:>10.2f} {:>10.2f} {:>10.2f} {:>7.2f}x {:>10.1e}'.format(
+                        batch_size, image_size, name, 1000 * full_time, 1000 * level_time, 1000 * fused_time,
+                        level_time / fused_time, diff))
+
+                del data
+
+
+################# SPARSE INVERSE #################
+
+# iwt of zero padded frames (the low images and the padded masks of the train/eval scripts) against iwt_lowpass, which
+# inverts the corner through zero sub-bands (bit-identical, 'exact') or, fused, upsamples it with the composed synthesis
+# cascade (max diff)
+def bench_sparse(args):
+    inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+
+    print('device={} patch={} iters={}'.format(args.device, patch, args.iters))
+    print('{:>6} {:>6} {:>6} {:>6} {:>12} {:>12} {:>10} {:>8} {:>6} {:>10}'.format(
+        'batch', 'size', 'corner', 'levels', 'padded ms', 'lowpass ms', 'fused ms', 'speedup', 'exact', 'max diff'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            levels = pyramid_levels(image_size, patch)
+            for batch_size in args.batch_sizes:
+                for corner in (2*patch, 4*patch):
+                    Y = torch.randn(batch_size, 3, corner, corner, device=args.device)
+                    padded_fn = lambda: iwt(zero_pad(Y, image_size, args.device), inv_filters, levels=levels)
+                    lowpass_fn = lambda: iwt_lowpass(Y, inv_filters, image_size, levels)
+                    fused_fn = lambda: iwt_lowpass(Y, inv_filters, image_size, levels, fused=True)
+
+                    padded = padded_fn()
+                    exact = torch.equal(lowpass_fn(), padded)
+                    diff = (fused_fn() - padded).abs().max().item()
+                    padded_time = time_fn(padded_fn, args.device, args.iters, args.warmup)
+                    lowpass_time = time_fn(lowpass_fn, args.device, args.iters, args.warmup)
+                    fused_time = time_fn(fused_fn, args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>6} {:>6} {:>12.2f} {:>12.2f} {:>10.2f} {:>7.2f}x {:>6} {:>10.1e}'.format(
+                        batch_size, image_size, corner, levels, 1000 * padded_time, 1000 * lowpass_time,
+                        1000 * fused_time, padded_time / fused_time, str(exact), diff))
+
+                    del Y, padded
+
+
+################# ROI #################
+
+# Cost of iwt_roi as a function of the ROI size (a centered square) against the full iwt, diff to the full iwt crop
+def bench_roi(args):
+    inv_filters = create_inv_filters(device=args.device)
+
+    print('device={} levels={} iters={}'.format(args.device, args.levels, args.iters))
+    print('{:>6} {:>6} {:>6} {:>10} {:>10} {:>8} {:>10}'.format('batch', 'size', 'roi', 'full ms', 'roi ms', 'speedup', 'max diff'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                Y = wt(natural_images(batch_size, image_size, args.device), create_filters(device=args.device), args.levels)
+                full_fn = lambda: iwt(Y, inv_filters, levels=args.levels)
+                full = full_fn()
+                full_time = time_fn(full_fn, args.device, args.iters, args.warmup)
+
+                roi = 8
+                while roi <= image_size:
+                    top = (image_size - roi) // 2
+                    roi_fn = lambda: iwt_roi(Y, inv_filters, args.levels, top, top, roi, roi)
+                    diff = (roi_fn() - full[:, :, top:top+roi, top:top+roi]).abs().max().item()
+                    roi_time = time_fn(roi_fn, args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>6} {:>10.2f} {:>10.2f} {:>7.2f}x {:>10.1e}'.format(
+                        batch_size, image_size, roi, 1000 * full_time, 1000 * roi_time, full_time / roi_time, diff))
+                    roi *= 2
+
+                del Y, full
+
+
+################# COLLATE #################
+
+# CPU cost of the worker-side WT of the train loops (wt_pyramid to 4 * patch) per image: one transform per image as in
+# ImagenetDataAugDataset.__getitem__, against one batched transform per batch as WTCollate, at a worker's thread count
+def bench_collate(args):
+    cpu = torch.device('cpu')
+    filters = create_filters(device=cpu)
+    patch = args.patch_size
+    threads = torch.get_num_threads()
+
+    print('device=cpu patch={} iters={} (ms per image)'.format(patch, args.iters))
+    print('{:>6} {:>6} {:>8} {:>10} {:>10} {:>8}'.format('batch', 'size', 'threads', 'per image', 'batched', 'speedup'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size)
+                target = min(4 * patch, image_size)
+
+                for worker_threads in args.worker_threads:
+                    torch.set_num_threads(worker_threads)
+                    image_time = time_fn(lambda: [wt_pyramid(img[None], filters, target, patch) for img in data], cpu, args.iters, args.warmup)
+                    batch_time = time_fn(lambda: wt_pyramid(data, filters, target, patch), cpu, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>8} {:>10.3f} {:>10.3f} {:>7.2f}x'.format(
+                        batch_size, image_size, worker_threads, 1000 * image_time / batch_size, 1000 * batch_time / batch_size,
+                        image_time / batch_time))
+
+                del data
+
+    torch.set_num_threads(threads)
+
+
+################# PARALLEL #################
+
+# Scaling of the sharded WTExecutor over 1 to max_workers threads (1 intra-op thread each), against a single wt/iwt call
+# with as many intra-op threads
+def bench_parallel(args):
+    cpu = torch.device('cpu')
+    filters = create_filters(device=cpu)
+    inv_filters = create_inv_filters(device=cpu)
+    max_workers = args.max_workers or os.cpu_count() or 1
+    threads = torch.get_num_threads()
+
+    print('device=cpu levels={} iters={} cores={}'.format(args.levels, args.iters, os.cpu_count()))
+    print('{:>6} {:>6} {:>7} {:>10} {:>10} {:>12} {:>12} {:>10}'.format(
+        'batch', 'size', 'threads', 'wt ms', 'iwt ms', 'pool wt ms', 'pool iwt ms', 'max diff'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size)
+                Y = wt(data, filters, args.levels)
+
+                for workers in range(1, max_workers + 1):
+                    torch.set_num_threads(workers)
+                    wt_time = time_fn(lambda: wt(data, filters, args.levels), cpu, args.iters, args.warmup)
+                    iwt_time = time_fn(lambda: iwt(Y, inv_filters, args.levels), cpu, args.iters, args.warmup)
+                    torch.set_num_threads(threads)
+
+                    with WTExecutor(workers, intra_threads=1) as executor:
+                        diff = max((executor.wt(data, filters, args.levels) - Y).abs().max().item(),
+                                   (executor.iwt(Y, inv_filters, args.levels) - iwt(Y, inv_filters, args.levels)).abs().max().item())
+                        pool_wt_time = time_fn(lambda: executor.wt(data, filters, args.levels), cpu, args.iters, args.warmup)
+                        pool_iwt_time = time_fn(lambda: executor.iwt(Y, inv_filters, args.levels), cpu, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>7} {:>10.2f} {:>10.2f} {:>12.2f} {:>12.2f} {:>10.1e}'.format(
+                        batch_size, image_size, workers, 1000 * wt_time, 1000 * iwt_time,
+                        1000 * pool_wt_time, 1000 * pool_iwt_time, diff))
+
+                del data, Y
+
+    torch.set_num_threads(threads)
+
+
+################# AUGMENT #################
+
+# Flips/rotations of cached coefficients against the transform of the flipped/rotated images (transform-then-augment against
+# augment-then-transform, asserted in tests/test_wt_augment.py), and against the approximate pixel round trip iwt, augment
+# the pixels, wt (not exact at the borders)
+def bench_augment(args):
+    filters = create_filters(device=args.device)
+    inv_filters = create_inv_filters(device=args.device)
+    ops = [('flip_w', lambda Y, spec: flip_coeffs(Y, filters, spec, -1), lambda x: x.flip(-1)),
+           ('flip_h', lambda Y, spec: flip_coeffs(Y, filters, spec, -2), lambda x: x.flip(-2)),
+           ('transpose', lambda Y, spec: transpose_coeffs(Y, spec), lambda x: x.transpose(-2, -1)),
+           ('rot90', lambda Y, spec: rot90_coeffs(Y, filters, spec, 1), lambda x: torch.rot90(x, 1, (-2, -1)))]
+
+    print('device={} levels={} data={}'.format(args.device, args.levels, args.data_dir or '1/f noise'))
+    print('{:>6} {:>6} {:>8} {:>10} {:>9} {:>9} {:>10} {:>9} {:>10}'.format(
+        'batch', 'size', 'layout', 'op', 'max err', 'iwt err', 'coeffs ms', 'pixels ms', 'speedup'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            layouts = [('wt', packets_wt(args.levels)), ('pyramid', packets_pyramid(image_size, None, args.patch_size))]
+            for batch_size in args.batch_sizes:
+                if args.data_dir:
+                    data = folder_images(args.data_dir, batch_size, image_size, args.device)
+                else:
+                    data = natural_images(batch_size, image_size, args.device)
+
+                for layout, spec in layouts:
+                    Y = wt_packets(data, filters, spec)
+                    for name, coeff_op, pixel_op in ops:
+                        target = wt_packets(pixel_op(data), filters, spec)
+                        pixel_fn = lambda: wt_packets(pixel_op(iwt_packets(Y, inv_filters, spec)), filters, spec)
+                        diff = (coeff_op(Y, spec) - target).abs().max().item()
+                        iwt_diff = (pixel_fn() - target).abs().max().item()
+                        coeff_time = time_fn(lambda: coeff_op(Y, spec).contiguous(), args.device, args.iters, args.warmup)
+                        pixel_time = time_fn(pixel_fn, args.device, args.iters, args.warmup)
+
+                        print('{:>6} {:>6} {:>8} {:>10} {:>9.1e} {:>9.1e} {:>10.2f} {:>9.2f} {:>9.1f}x'.format(
+                            batch_size, image_size, layout, name, diff, iwt_diff, 1000 * coeff_time, 1000 * pixel_time,
+                            pixel_time / coeff_time))
+
+                    del Y
+
+                del data
+
+
+################# LAYOUT #################
+
+# Grid <-> patch/channel layouts of 4, 16 and 64 patches against the quadrant slicing versions (max abs difference should be 0)
+def bench_layout(args):
+    print('device={} patch={}'.format(args.device, args.patch_size))
+    print('{:>6} {:>6} {:>8} {:>16} {:>10} {:>10} {:>8} {:>6}'.format(
+        'batch', 'size', 'patches', 'layout', 'sliced ms', 'permute ms', 'speedup', 'diff'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            for batch_size in args.batch_sizes:
+                data = torch.rand(batch_size, 3, image_size, image_size, device=args.device)
+                for depth in range(1, pyramid_levels(image_size, args.patch_size) + 1):
+                    channels = grid_to_channels(data, depth)
+                    layouts = [('grid_to_patches', lambda: grid_to_patches_sliced(data, depth), lambda: grid_to_patches(data, depth)),
+                               ('channels_to_grid', lambda: channels_to_grid_sliced(channels, depth, args.device),
+                                lambda: channels_to_grid(channels, depth, args.device))]
+
+                    for name, sliced_fn, permute_fn in layouts:
+                        diff = (sliced_fn() - permute_fn()).abs().max().item()
+                        sliced_time = time_fn(sliced_fn, args.device, args.iters, args.warmup)
+                        permute_time = time_fn(permute_fn, args.device, args.iters, args.warmup)
+
+                        print('{:>6} {:>6} {:>8} {:>16} {:>10.2f} {:>10.2f} {:>7.2f}x {:>6.0e}'.format(
+                            batch_size, image_size, 4**depth, name, 1000 * sliced_time, 1000 * permute_time,
+                            sliced_time / permute_time, diff))
+
+                    del channels
+
+                del data
+
+
+################# POOL #################
+
+# Frame path of eval_biggan_unet_128_256 for one batch of decoder outputs: input patches, 256 packet layout, host copies
+def eval_frames_256(Y_64, recon_mask_128_all, recon_mask_256_all, pool=None):
+    patch = Y_64.shape[2] // 2
+    if pool is None:
+        Y_64_patches = torch.cat(get_4masks(Y_64, patch), dim=1)
+        Y_128_patches = torch.cat((Y_64_patches, recon_mask_128_all), dim=1)
+        Y_256 = collate_patches_256(Y_128_patches, recon_mask_256_all)
+        return Y_256.cpu(), Y_128_patches.cpu()
+
+    Y_64_patches = torch.cat(get_4masks(Y_64, patch), dim=1, out=pool.empty(
+        (Y_64.shape[0], 4*Y_64.shape[1], patch, patch), Y_64.dtype, Y_64.device))
+    Y_128_patches = torch.cat((Y_64_patches, recon_mask_128_all), dim=1, out=pool.empty(
+        (Y_64.shape[0], 16*Y_64.shape[1], patch, patch), Y_64.dtype, Y_64.device))
+    Y_256 = collate_patches_256(Y_128_patches, recon_mask_256_all, pool=pool)
+
+    return pool.copy(Y_256), pool.copy(Y_128_patches)
+
+
+# Frames allocated per batch by the eval frame path without and with a FramePool (0 after the first batch with the pool)
+def bench_pool(args):
+    mb = 2.**20
+
+    print('device={} patch={}'.format(args.device, args.patch_size))
+    print('{:>6} {:>6} {:>12} {:>12} {:>9} {:>9} {:>9} {:>9}'.format(
+        'batch', 'patch', 'plain allocs', 'pool allocs', 'plain MB', 'pool MB', 'plain ms', 'pool ms'))
+
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            patch = args.patch_size
+            Y_64 = torch.rand(batch_size, 3, 2*patch, 2*patch, device=args.device)
+            recon_mask_128_all = torch.randn(batch_size, 36, patch, patch, device=args.device)
+            recon_mask_256_all = torch.randn(batch_size, 144, patch, patch, device=args.device)
+            args_frames = (Y_64, recon_mask_128_all, recon_mask_256_all)
+
+            # The first batch allocates the frames the plain path allocates on every batch
+            pool = FramePool()
+            eval_frames_256(*args_frames, pool=pool)
+            first_allocs, first_bytes = pool.step()
+            for _ in range(max(1, args.warmup)):
+                eval_frames_256(*args_frames, pool=pool)
+                pool.step()
+            allocs, nbytes = pool.allocations, pool.allocated_bytes
+
+            plain_time = time_fn(lambda: eval_frames_256(*args_frames), args.device, args.iters, args.warmup)
+            pool_time = time_fn(lambda: (eval_frames_256(*args_frames, pool=pool), pool.step()), args.device, args.iters, args.warmup)
+
+            print('{:>6} {:>6} {:>12} {:>12} {:>9.1f} {:>9.1f} {:>9.2f} {:>9.2f}'.format(
+                batch_size, patch, first_allocs, allocs, first_bytes / mb, nbytes / mb, 1000 * plain_time, 1000 * pool_time))
+            print(pool)
+
+            del Y_64, recon_mask_128_all, recon_mask_256_all, pool
+
+
+################# COEFFICIENT PYRAMID #################
+
+# Decoder stage reconstruction through a CoefficientPyramid (masks written into one buffer, a single iwt_packets) against
+# the collate/iwt/pad chain it replaces in the eval loops (max abs difference should be 0)
+def bench_coeff_pyramid(args):
+    inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+
+    print('device={} patch={}'.format(args.device, patch))
+    print('{:>6} {:>6} {:>7} {:>9} {:>12} {:>8} {:>8}'.format('batch', 'size', 'target', 'chain ms', 'pyramid ms', 'speedup', 'diff'))
+
+    with torch.no_grad():
+        for image_size in args.image_sizes:
+            levels = pyramid_levels(image_size, patch)
+            for batch_size in args.batch_sizes:
+                for target in (4*patch, 8*patch):
+                    if target > image_size:
+                        continue
+                    spec = packets_masks(image_size, target, patch)
+                    Y_corner = torch.randn(batch_size, 3, target//2, target//2, device=args.device)
+                    recon_mask_all = torch.randn(batch_size, 3 * 3 * (target // 2 // patch)**2, patch, patch, device=args.device)
+                    pool = FramePool()
+
+                    def pyramid_fn():
+                        Y = CoefficientPyramid.empty(batch_size, 3, target, spec, args.device, pool=pool)
+                        recon_img = Y.set_corner(Y_corner).set_mask_channels(target, recon_mask_all, patch).iwt(inv_filters)
+                        pool.step()
+                        return recon_img
+
+                    chain_fn = lambda: reconstruct_masks_chain(Y_corner, recon_mask_all, inv_filters, image_size, levels, patch)
+                    diff = (pyramid_fn() - chain_fn()).abs().max().item()
+                    chain_time = time_fn(chain_fn, args.device, args.iters, args.warmup)
+                    pyramid_time = time_fn(pyramid_fn, args.device, args.iters, args.warmup)
+
+                    print('{:>6} {:>6} {:>7} {:>9.2f} {:>12.2f} {:>7.2f}x {:>8.1e}'.format(
+                        batch_size, image_size, target, 1000 * chain_time, 1000 * pyramid_time, chain_time / pyramid_time, diff))
+
+                    del Y_corner, recon_mask_all, pool
+
+
+################# LOSS #################
+
+# Loss of the train loops before MultiPatchMSELoss: 3 mse_loss calls per patch
+def multi_patch_loss_loop(Y, recon_mask_all, patch):
+    depth = pyramid_levels(Y.shape[2] // 2, patch)
+    real_masks = [grid_to_patches(mask, depth) for mask in get_3masks(Y, Y.shape[2] // 2)]
+    recon_masks = [mask.reshape(mask.shape[0], -1, 3, patch, patch) for mask in split_masks_from_channels(recon_mask_all)]
+
+    loss = 0
+    for j in range(real_masks[0].shape[1]):
+        for real, recon in zip(real_masks, recon_masks):
+            loss += torch.nn.functional.mse_loss(recon[:, j], real[:, j])
+
+    return loss
+
+
+# Forward + backward of the per-patch loop against the fused loss, for the 128 (4 patches) and 256 (16 patches) level masks
+# (rel diff: relative difference of the scalars, a few ulps; grad diff should be 0)
+def bench_loss(args):
+    patch = args.patch_size
+    criterion = MultiPatchMSELoss().to(args.device)
+
+    print('device={} patch={}'.format(args.device, patch))
+    print('{:>6} {:>7} {:>8} {:>8} {:>9} {:>8} {:>9} {:>9}'.format('batch', 'target', 'patches', 'loop ms', 'fused ms', 'speedup', 'rel diff', 'grad diff'))
+
+    for batch_size in args.batch_sizes:
+        for target in (4*patch, 8*patch):
+            Y = torch.randn(batch_size, 3, target, target, device=args.device)
+            patches = (target // 2 // patch)**2
+            recon_mask_all = torch.randn(batch_size, 3 * patches * 3, patch, patch, device=args.device, requires_grad=True)
+
+            def loop_fn():
+                loss = multi_patch_loss_loop(Y, recon_mask_all, patch)
+                return loss, torch.autograd.grad(loss, recon_mask_all)[0]
+
+            def fused_fn():
+                loss = criterion(recon_mask_all, CoefficientPyramid(Y, None).mask_channels(target, patch))
+                return loss, torch.autograd.grad(loss, recon_mask_all)[0]
+
+            loop_loss, loop_grad = loop_fn()
+            fused_loss, fused_grad = fused_fn()
+            rel_diff = abs(loop_loss.item() - fused_loss.item()) / loop_loss.item()
+            grad_diff = (loop_grad - fused_grad).abs().max().item()
+            loop_time = time_fn(loop_fn, args.device, args.iters, args.warmup)
+            fused_time = time_fn(fused_fn, args.device, args.iters, args.warmup)
+
+            print('{:>6} {:>7} {:>8} {:>8.2f} {:>9.2f} {:>7.2f}x {:>9.1e} {:>9.1e}'.format(
+                batch_size, target, 3 * patches, 1000 * loop_time, 1000 * fused_time, loop_time / fused_time, rel_diff, grad_diff))
+
+            del Y, recon_mask_all
+
+
+################# DISPATCH #################
+
+# --bench name => benchmark (the choices of --bench). Their max diff columns are informative, the equivalences are asserted
+# by the tests of each module (tests/test_<module>.py)
+BENCHES = {
+    'backends': bench_backends,
+    'levels': bench_levels,
+    'packets': bench_packets,
+    'recon': bench_recon,
+    'haar': bench_haar,
+    'autograd': bench_autograd,
+    'modules': bench_modules,
+    'precision': bench_precision,
+    'grouped': bench_grouped,
+    'pyramid': bench_pyramid,
+    'tiled': bench_tiled,
+    'codec': bench_codec,
+    'reversible': bench_reversible,
+    'partial': bench_partial,
+    'sparse': bench_sparse,
+    'roi': bench_roi,
+    'collate': bench_collate,
+    'parallel': bench_parallel,
+    'augment': bench_augment,
+    'layout': bench_layout,
+    'pool': bench_pool,
+    'coeff_pyramid': bench_coeff_pyramid,
+    'loss': bench_loss,
+}
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    BENCHES[args.bench](args)
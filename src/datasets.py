@@ -16,7 +16,7 @@ import torchvision.transforms as transforms
 import h5py
 from collections.abc import Iterable
 import pickle
-from wt_utils import get_3masks
+from wt_utils import get_3masks, get_filters, wt_pyramid
 
 ####################################################################
 # DATASET HELPER
@@ -66,6 +66,53 @@ def create_dataset(ds_name, path, transform, classes=None):
     return dataset
 
 
+####################################################################
+# BATCHED WT COLLATE
+####################################################################
+
+# collate_fn running the WT of the train loops on the CPU, once per batch inside the DataLoader workers
+# Batches are (pixels, packed coefficients) with the coefficients of wt_pyramid(pixels, filters, target, patch) in place
+# of the labels, computed with the wavelet and backend of the device path (passed explicitly: spawned workers do not
+# inherit the global backend)
+# Each worker runs its transforms on threads torch threads (workers * threads should not exceed the CPU cores)
+# With pin_memory the batch is pinned here, which needs CUDA in the process running the collate: the main process, not
+# the forked workers of a process that already initialized CUDA (create_collate_fn decides it from args)
+class WTCollate(object):
+    def __init__(self, target, patch=32, wt_fn='bior2.2', backend=None, threads=1, pin_memory=False):
+        self.target = target
+        self.patch = patch
+        self.wt_fn = wt_fn
+        self.backend = backend
+        self.threads = threads
+        self.pin_memory = pin_memory
+
+    def __call__(self, batch):
+        # The thread count is per process, it is only changed inside the workers
+        if torch.utils.data.get_worker_info() is not None and torch.get_num_threads() != self.threads:
+            torch.set_num_threads(self.threads)
+
+        data, _ = torch.utils.data.default_collate(batch)
+        with torch.no_grad():
+            coeffs = wt_pyramid(data, get_filters(self.wt_fn, 'cpu'), self.target, self.patch, backend=self.backend)
+
+        if self.pin_memory:
+            data = data.pin_memory()
+            coeffs = coeffs.pin_memory()
+
+        return data, coeffs
+
+
+# collate_fn of the train loaders: WTCollate with --worker_wt, else the default collate (coefficients computed on the device)
+# Batches for a CUDA device are pinned by the collate when it runs in the main process (--workers 0); with workers, the
+# loaders' pin_memory thread pins them in the main process
+def create_collate_fn(args, target):
+    if not args.worker_wt:
+        return None
+    pin_memory = args.device.type == 'cuda' and args.workers == 0
+
+    return WTCollate(target, args.patch_size, args.wt_fn, args.wt_backend, args.worker_threads, pin_memory)
+
+
 ####################################################################
 # CUSTOM DATASET OBJECTS
 ####################################################################
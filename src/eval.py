@@ -6,6 +6,15 @@ from tqdm import tqdm, trange
 import h5py
 
 from wt_utils import *
+from wt_codec import CoeffFile
+
+# hdf5 file for float32 coefficients, or with --coeff_bits a directory of quantized sparse batches (see wt_codec.py)
+def coeff_file(path, levels, args):
+    if args.coeff_bits:
+        return CoeffFile(path, levels, args.coeff_bits, args.coeff_threshold)
+
+    return h5py.File(path + '.hdf5', 'w')
+
 
 # Run model through dataloader and save all images
 def eval_unet128(model, data_loader, data_type, args):
@@ -14,68 +23,54 @@ def eval_unet128(model, data_loader, data_type, args):
     # Create filters
     filters = create_filters(device=args.device)
     inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
 
     # Create hdf5 dataset
     f1 = h5py.File(args.output_dir + data_type + '/recon_img.hdf5', 'w')
     f2 = h5py.File(args.output_dir + data_type + '/real_img.hdf5', 'w')
     f3 = h5py.File(args.output_dir + data_type + '/low_64_img.hdf5', 'w')
 
-    recon_dataset = f1.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    real_dataset = f2.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    low_dataset = f3.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
+    recon_dataset = f1.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    real_dataset = f2.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    low_dataset = f3.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
 
     counter = 0
+    pool = FramePool()
 
     for data, _ in tqdm(data_loader):
         if counter >= 50000:
             break
         data = data.to(args.device)
     
-        Y = wt_128_3quads(data, filters, levels=3)
+        Y = CoefficientPyramid.from_image(data, filters, packets_pyramid(args.image_size, 4*patch, patch))
 
         # Get real 1st level masks
-        Y_64 = Y[:, :, :64, :64]
-        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
-        Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
+        Y_64 = Y.corner(2*patch)
+        Y_64_patches = Y.channels(2*patch, patch)
 
         with torch.no_grad():
             # Run through 128 mask network and get reconstructed image
             recon_mask_all = model(Y_64_patches)
-            recon_mask_tr, recon_mask_bl, recon_mask_br = split_masks_from_channels(recon_mask_all)
 
-        Y_real = wt(data, filters, levels=3)
+        Y_real = wt(data, filters, levels=levels)
         
-        real_img_128_padded = Y_real[:, :, :128, :128]
-        real_img_128_padded = zero_pad(real_img_128_padded, 256, args.device)
-        real_img_128_padded = iwt(real_img_128_padded, inv_filters, levels=3)
-
-        # Collate all masks concatenated by channel to an image (slice up and put into a square)
-        recon_mask_tr_img = collate_channels_to_img(recon_mask_tr, args.device)
-        recon_mask_bl_img = collate_channels_to_img(recon_mask_bl, args.device)   
-        recon_mask_br_img = collate_channels_to_img(recon_mask_br, args.device)
-        
-        recon_mask_tr_img = iwt(recon_mask_tr_img, inv_filters, levels=1)
-        recon_mask_bl_img = iwt(recon_mask_bl_img, inv_filters, levels=1)    
-        recon_mask_br_img = iwt(recon_mask_br_img, inv_filters, levels=1) 
+        real_img_128_padded = Y_real[:, :, :4*patch, :4*patch]
+        real_img_128_padded = iwt_lowpass(real_img_128_padded, inv_filters, args.image_size, levels)
 
-        zeros = torch.zeros(recon_mask_tr_img.shape)
-        
-        recon_mask_iwt = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
-        
-        recon_mask_padded = zero_pad(recon_mask_iwt, 256, args.device)
-        recon_mask_padded[:, :, :64, :64] = Y_64
-        recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
-    
         # Reconstructed image with only 128x128
-        Y_64_low = zero_pad(Y_64, 256, args.device)
-        Y_64_low = iwt(Y_64_low, inv_filters, levels=3)    
+        Y_64_low = iwt_lowpass(Y_64, inv_filters, args.image_size, levels)    
+
+        # Write the reconstructed masks over the real ones and invert the whole pyramid at once
+        recon_img = Y.set_mask_channels(4*patch, recon_mask_all, patch).iwt(inv_filters)
         
         # Save image into hdf5
         batch_size = recon_img.shape[0]
-        recon_dataset[counter: counter+batch_size] = recon_img.cpu()
-        real_dataset[counter: counter+batch_size] = data.cpu()
-        low_dataset[counter: counter+batch_size] = Y_64_low.cpu()
+        recon_dataset[counter: counter+batch_size] = pool.copy(recon_img)
+        real_dataset[counter: counter+batch_size] = pool.copy(data)
+        low_dataset[counter: counter+batch_size] = pool.copy(Y_64_low)
         counter += batch_size
+        pool.step()
 
         # Save images
         # for j in range(recon_img.shape[0]):
@@ -97,17 +92,21 @@ def eval_unet256(model, data_loader, data_type, args):
     # Create filters
     filters = create_filters(device=args.device)
     inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    spec = packets_masks(args.image_size, 8*patch, patch)
 
     # Create hdf5 dataset
     f1 = h5py.File(args.output_dir + data_type + '/recon_img.hdf5', 'w')
     f2 = h5py.File(args.output_dir + data_type + '/real_img.hdf5', 'w')
     f3 = h5py.File(args.output_dir + data_type + '/low_128_img.hdf5', 'w')
 
-    recon_dataset = f1.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    real_dataset = f2.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    low_dataset = f3.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
+    recon_dataset = f1.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    real_dataset = f2.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    low_dataset = f3.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
 
     counter = 0
+    pool = FramePool()
 
     with torch.no_grad():
         for data, _ in tqdm(data_loader):
@@ -115,56 +114,31 @@ def eval_unet256(model, data_loader, data_type, args):
                 break
             data = data.to(args.device)
         
-            Y = wt_256_3quads(data, filters, levels=3)
-
-            # Get real 1st level masks
-            Y_64 = Y[:, :, :64, :64]
-            real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
-            Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
-
-            # Get real 2nd level masks (128 level)
-            real_mask_128_tr, real_mask_128_bl, real_mask_128_br = get_3masks(Y[:, :, :128, :128], 64)
+            Y = CoefficientPyramid.from_image(data, filters, packets_pyramid(args.image_size, 8*patch, patch))
 
-            # Divide into 32 x 32 patches
-            real_mask_128_tr = collate_channels_from_grid(real_mask_128_tr)
-            real_mask_128_bl = collate_channels_from_grid(real_mask_128_bl)
-            real_mask_128_br = collate_channels_from_grid(real_mask_128_br)
-
-            # Creating input with real masks up to 128 level
-            Y_128_patches = torch.cat((Y_64_patches, real_mask_128_tr, real_mask_128_bl, real_mask_128_br), dim=1)
+            # Creating input with real masks up to 128 level (the 64 level patches, then the 128 level masks)
+            Y_128_patches = Y.channels(4*patch, patch)
 
             # Run through 128 mask network and get reconstructed image
             recon_mask_256_all = model(Y_128_patches)
-            recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
 
-            Y_real = wt(data, filters, levels=3)
-            Y_128 = Y_real[:, :, :128, :128]
-            
+            Y_real = wt(data, filters, levels=levels)
+            Y_128 = Y_real[:, :, :4*patch, :4*patch]
 
-            # Collate all masks concatenated by channel to an image (slice up and put into a square)
-            recon_mask_256_tr_img = collate_16_channels_to_img(recon_mask_256_tr, args.device)
-            recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
-            recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
-            
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
-            
-            recon_mask_256_iwt = collate_patches_to_img(Y_128, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
-            
-            recon_mask_padded = zero_pad(recon_mask_256_iwt, 256, args.device)
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            # Real 128 level WT with the reconstructed masks around it, inverted at once
+            recon = CoefficientPyramid.empty(data.shape[0], data.shape[1], 8*patch, spec, data.device, data.dtype, pool)
+            recon_img = recon.set_corner(Y_128).set_mask_channels(8*patch, recon_mask_256_all, patch).iwt(inv_filters)
         
             # Reconstructed image with only 128x128
-            Y_128_low = zero_pad(Y_128, 256, args.device)
-            Y_128_low = iwt(Y_128_low, inv_filters, levels=3)
+            Y_128_low = iwt_lowpass(Y_128, inv_filters, args.image_size, levels)
 
             # Save image into hdf5
             batch_size = recon_img.shape[0]
-            recon_dataset[counter: counter+batch_size] = recon_img.cpu()
-            real_dataset[counter: counter+batch_size] = data.cpu()
-            low_dataset[counter: counter+batch_size] = Y_128_low.cpu()
+            recon_dataset[counter: counter+batch_size] = pool.copy(recon_img)
+            real_dataset[counter: counter+batch_size] = pool.copy(data)
+            low_dataset[counter: counter+batch_size] = pool.copy(Y_128_low)
             counter += batch_size
+            pool.step()
 
 
     f1.close()
@@ -179,13 +153,16 @@ def eval_unet_128_256(model_128, model_256, data_loader, data_type, args):
     # Create filters
     filters = create_filters(device=args.device)
     inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    synthesis = create_packet_synthesis(inv_filters, size=8*patch)
 
     # Create hdf5 dataset
     f1 = h5py.File(args.output_dir + data_type + '/recon_img.hdf5', 'w')
     f2 = h5py.File(args.output_dir + data_type + '/real_img.hdf5', 'w')
 
-    recon_dataset = f1.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    real_dataset = f2.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
+    recon_dataset = f1.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    real_dataset = f2.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
 
     counter = 0
 
@@ -196,11 +173,11 @@ def eval_unet_128_256(model_128, model_256, data_loader, data_type, args):
 
             data = data.to(args.device)
         
-            Y = wt_256_3quads(data, filters, levels=3)
+            Y = wt_pyramid(data, filters, 8*patch, patch)
 
             # Get real 1st level masks
-            Y_64 = Y[:, :, :64, :64]
-            real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+            Y_64 = Y[:, :, :2*patch, :2*patch]
+            real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
             Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
             # Run through unet 128
@@ -211,36 +188,11 @@ def eval_unet_128_256(model_128, model_256, data_loader, data_type, args):
 
             # Run through unet 256
             recon_mask_256_all = model_256(Y_128_patches)
-            recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
 
-            # Collate al masks constructed by first 128 level
-            recon_mask_128_tr_img = collate_channels_to_img(recon_mask_128_tr, args.device)
-            recon_mask_128_bl_img = collate_channels_to_img(recon_mask_128_bl, args.device)
-            recon_mask_128_br_img = collate_channels_to_img(recon_mask_128_br, args.device)
-            
-            recon_mask_128_tr_img = iwt(recon_mask_128_tr_img, inv_filters, levels=1)
-            recon_mask_128_bl_img = iwt(recon_mask_128_bl_img, inv_filters, levels=1)   
-            recon_mask_128_br_img = iwt(recon_mask_128_br_img, inv_filters, levels=1)
-            
-            Y_64 = wt(data, filters, levels=3)[:, :, :64, :64]
-            recon_mask_128_iwt = collate_patches_to_img(Y_64, recon_mask_128_tr_img, recon_mask_128_bl_img, recon_mask_128_br_img)
-
-            # Collate all masks concatenated by channel to an image (slice up and put into a square)
-            recon_mask_256_tr_img = collate_16_channels_to_img(recon_mask_256_tr, args.device)
-            recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
-            recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
-
-            zeros = torch.zeros(recon_mask_256_tr_img.shape)
-            
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
-            
-            recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img, device=args.device)
-            
-            # IWT to reconstruct iamge
-            recon_mask_256_iwt[:, :, :128, :128] = recon_mask_128_iwt
-            recon_img = iwt(recon_mask_256_iwt, inv_filters, levels=3)
+            # Reconstruct the top-left 8*patch of the image from the 128 level patches and the 256 level masks in one pass,
+            # the levels above it (image sizes over 8*patch) have no masks
+            recon_img = iwt_patches_256(Y_128_patches, recon_mask_256_all, synthesis)
+            recon_img = iwt_lowpass(recon_img, inv_filters, args.image_size, levels - 3)
         
             # Save image into hdf5
             batch_size = recon_img.shape[0]
@@ -257,15 +209,19 @@ def eval_biggan_unet128(model, data_loader, args):
     # Create filters
     filters = create_filters(device=args.device)
     inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    spec = packets_masks(args.image_size, 4*patch, patch)
 
     # Create hdf5 dataset
     f1 = h5py.File(args.output_dir + '/recon_img.hdf5', 'w')
     f2 = h5py.File(args.output_dir + '/sample_img.hdf5', 'w')
 
-    recon_dataset = f1.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    sample_dataset = f2.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
+    recon_dataset = f1.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    sample_dataset = f2.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
 
     counter = 0
+    pool = FramePool()
 
     for data in tqdm(data_loader):
         if counter >= 50000:
@@ -273,39 +229,25 @@ def eval_biggan_unet128(model, data_loader, args):
         data = data.to(args.device)
     
         Y_64 = wt(data, filters, levels=1)
-        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
         Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
         with torch.no_grad():
             # Run through 128 mask network and get reconstructed image
             recon_mask_all = model(Y_64_patches)
-            recon_mask_tr, recon_mask_bl, recon_mask_br = split_masks_from_channels(recon_mask_all)
 
-        # Collate all masks concatenated by channel to an image (slice up and put into a square)
-        recon_mask_tr_img = collate_channels_to_img(recon_mask_tr, args.device)
-        recon_mask_bl_img = collate_channels_to_img(recon_mask_bl, args.device)   
-        recon_mask_br_img = collate_channels_to_img(recon_mask_br, args.device)
-        
-        recon_mask_tr_img = iwt(recon_mask_tr_img, inv_filters, levels=1)
-        recon_mask_bl_img = iwt(recon_mask_bl_img, inv_filters, levels=1)    
-        recon_mask_br_img = iwt(recon_mask_br_img, inv_filters, levels=1) 
+        # Pyramid of the sample with the reconstructed masks, inverted at once
+        Y = CoefficientPyramid.empty(data.shape[0], data.shape[1], 4*patch, spec, data.device, data.dtype, pool)
+        recon_img = Y.set_corner(Y_64).set_mask_channels(4*patch, recon_mask_all, patch).iwt(inv_filters)
 
-        zeros = torch.zeros(recon_mask_tr_img.shape)
-        
-        recon_mask_iwt = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
-        
-        recon_mask_padded = zero_pad(recon_mask_iwt, 256, args.device)
-        recon_mask_padded[:, :, :64, :64] = Y_64
-        recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
-
-        sample_padded = zero_pad(Y_64, 256, args.device)
-        sample_img = iwt(sample_padded, inv_filters, levels=3)
+        sample_img = iwt_lowpass(Y_64, inv_filters, args.image_size, levels)
     
         # Save image into hdf5
         batch_size = recon_img.shape[0]
-        recon_dataset[counter: counter+batch_size] = recon_img.cpu()
-        sample_dataset[counter: counter+batch_size] = sample_img.cpu()
+        recon_dataset[counter: counter+batch_size] = pool.copy(recon_img)
+        sample_dataset[counter: counter+batch_size] = pool.copy(sample_img)
         counter += batch_size
+        pool.step()
 
     f1.close()
     f2.close()
@@ -319,19 +261,23 @@ def eval_biggan_unet_128_256(model_128, model_256, data_loader, args):
     # Create filters
     filters = create_filters(device=args.device)
     inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    synthesis = create_packet_synthesis(inv_filters, size=8*patch)
 
     # Create hdf5 dataset
     f1 = h5py.File(args.output_dir + '/recon_img.hdf5', 'w')
     f2 = h5py.File(args.output_dir + '/low_img.hdf5', 'w')
-    f3 = h5py.File(args.output_dir + '/recon_masks.hdf5', 'w')
-    f4 = h5py.File(args.output_dir + '/tl_64.hdf5', 'w')
+    f3 = coeff_file(args.output_dir + '/recon_masks', 3, args)
+    f4 = coeff_file(args.output_dir + '/tl_64', 0, args)
 
-    recon_dataset = f1.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    low_dataset = f2.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    recon_masks_dataset = f3.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    tl_dataset = f4.create_dataset('data', shape=(50000, 3, 64, 64), dtype=np.float32, fillvalue=0)
+    recon_dataset = f1.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    low_dataset = f2.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    recon_masks_dataset = f3.create_dataset('data', shape=(50000, 3, 8*patch, 8*patch), dtype=np.float32, fillvalue=0)
+    tl_dataset = f4.create_dataset('data', shape=(50000, 3, 2*patch, 2*patch), dtype=np.float32, fillvalue=0)
 
     counter = 0
+    pool = FramePool()
 
     with torch.no_grad():
         for data in tqdm(data_loader):
@@ -340,61 +286,40 @@ def eval_biggan_unet_128_256(model_128, model_256, data_loader, args):
 
             data = data.to(args.device)
         
-            Y_64 = wt(data, filters, levels=1)
-            real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
-            Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
+            Y_64 = wt(data, filters, levels=1, out=pool.empty(data.shape, data.dtype, data.device))
+            real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
+            Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1,
+                                     out=pool.empty((data.shape[0], 4*data.shape[1], patch, patch), data.dtype, data.device))
 
             # Run through unet 128
             recon_mask_128_all = model_128(Y_64_patches)
             recon_mask_128_tr, recon_mask_128_bl, recon_mask_128_br = split_masks_from_channels(recon_mask_128_all)
 
-            Y_128_patches = torch.cat((Y_64_patches, recon_mask_128_tr, recon_mask_128_bl, recon_mask_128_br), dim=1)
+            Y_128_patches = torch.cat((Y_64_patches, recon_mask_128_tr, recon_mask_128_bl, recon_mask_128_br), dim=1,
+                                      out=pool.empty((data.shape[0], 16*data.shape[1], patch, patch), data.dtype, data.device))
 
             # Run through unet 256
             recon_mask_256_all = model_256(Y_128_patches)
-            recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
 
-            # Collate al masks constructed by first 128 level
-            recon_mask_128_tr_img = collate_channels_to_img(recon_mask_128_tr, args.device)
-            recon_mask_128_bl_img = collate_channels_to_img(recon_mask_128_bl, args.device)
-            recon_mask_128_br_img = collate_channels_to_img(recon_mask_128_br, args.device)
-            
-            recon_mask_128_tr_img = iwt(recon_mask_128_tr_img, inv_filters, levels=1)
-            recon_mask_128_bl_img = iwt(recon_mask_128_bl_img, inv_filters, levels=1)   
-            recon_mask_128_br_img = iwt(recon_mask_128_br_img, inv_filters, levels=1)
-            
-            recon_mask_128_iwt = collate_patches_to_img(Y_64, recon_mask_128_tr_img, recon_mask_128_bl_img, recon_mask_128_br_img)
-
-            # Collate all masks concatenated by channel to an image (slice up and put into a square)
-            recon_mask_256_tr_img = collate_16_channels_to_img(recon_mask_256_tr, args.device)
-            recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
-            recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
+            # Collate all masks into the 256 packet layout, reconstruct the image in one pass and keep the plain WT masks
+            Y_256 = collate_patches_256(Y_128_patches, recon_mask_256_all, pool=pool)
+            recon_img = synthesize_packets(Y_256, synthesis, depth=3)
+            recon_img = iwt_lowpass(recon_img, inv_filters, args.image_size, levels - 3)
+            recon_mask_256_iwt = iwt_packets(Y_256, inv_filters, packets_tree(3), target=packets_wt(3))
 
-            zeros = torch.zeros(recon_mask_256_tr_img.shape)
-            
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
-            
-            recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img, device=args.device)
-            
-            # IWT to reconstruct iamge
-            recon_mask_256_iwt[:, :, :128, :128] = recon_mask_128_iwt
-            recon_img = iwt(recon_mask_256_iwt, inv_filters, levels=3)
-
-            low_padded = zero_pad(Y_64, 256, args.device)
-            low_img = iwt(low_padded, inv_filters, levels=3)
+            low_img = iwt_lowpass(Y_64, inv_filters, args.image_size, levels)
         
             # Save image into hdf5
             batch_size = recon_img.shape[0]
 
-            recon_dataset[counter: counter+batch_size] = recon_img.cpu()
-            low_dataset[counter: counter+batch_size] = low_img.cpu()
-            tl_dataset[counter: counter+batch_size] = iwt(Y_64, inv_filters, levels=1).cpu()
+            recon_dataset[counter: counter+batch_size] = pool.copy(recon_img)
+            low_dataset[counter: counter+batch_size] = pool.copy(low_img)
+            tl_dataset[counter: counter+batch_size] = pool.copy(iwt(Y_64, inv_filters, levels=1))
 
-            recon_mask_256_iwt[:, :, :64, :64].fill_(0)
-            recon_masks_dataset[counter: counter+batch_size] = recon_mask_256_iwt.cpu()
+            recon_mask_256_iwt[:, :, :2*patch, :2*patch].fill_(0)
+            recon_masks_dataset[counter: counter+batch_size] = pool.copy(recon_mask_256_iwt)
             counter += batch_size
+            pool.step()
 
     f1.close()
     f2.close()
@@ -410,25 +335,29 @@ def eval_pretrained_biggan_unet_128_256(model_128, model_256, data_loader, args)
     # Create filters
     filters = create_filters(device=args.device)
     inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    synthesis = create_packet_synthesis(inv_filters, size=8*patch)
 
     # Create hdf5 dataset
     f1 = h5py.File(args.output_dir + '/recon_img.hdf5', 'w')
     f2 = h5py.File(args.output_dir + '/sample_img.hdf5', 'w')
     f3 = h5py.File(args.output_dir + '/low_img.hdf5', 'w')
-    f4 = h5py.File(args.output_dir + '/recon_masks.hdf5', 'w')
-    f5 = h5py.File(args.output_dir + '/real_masks.hdf5', 'w')
-    f6 = h5py.File(args.output_dir + '/tl_64.hdf5', 'w')
+    f4 = coeff_file(args.output_dir + '/recon_masks', 3, args)
+    f5 = coeff_file(args.output_dir + '/real_masks', levels, args)
+    f6 = coeff_file(args.output_dir + '/tl_64', 0, args)
     f7 = h5py.File(args.output_dir + '/resized_64.hdf5', 'w')
 
-    recon_dataset = f1.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    sample_dataset = f2.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    low_dataset = f3.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    recon_masks_dataset = f4.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    real_masks_dataset = f5.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    tl_dataset = f6.create_dataset('data', shape=(50000, 3, 64, 64), dtype=np.float32, fillvalue=0)
-    resized_dataset = f7.create_dataset('data', shape=(50000, 3, 64, 64), dtype=np.float32, fillvalue=0)
+    recon_dataset = f1.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    sample_dataset = f2.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    low_dataset = f3.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    recon_masks_dataset = f4.create_dataset('data', shape=(50000, 3, 8*patch, 8*patch), dtype=np.float32, fillvalue=0)
+    real_masks_dataset = f5.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    tl_dataset = f6.create_dataset('data', shape=(50000, 3, 2*patch, 2*patch), dtype=np.float32, fillvalue=0)
+    resized_dataset = f7.create_dataset('data', shape=(50000, 3, 2*patch, 2*patch), dtype=np.float32, fillvalue=0)
 
     counter = 0
+    pool = FramePool()
 
     with torch.no_grad():
         for data in tqdm(data_loader):
@@ -437,70 +366,49 @@ def eval_pretrained_biggan_unet_128_256(model_128, model_256, data_loader, args)
 
             data = data.to(args.device)
 
-            resized = F.interpolate(data, 64, mode='bilinear')
+            resized = F.interpolate(data, 2*patch, mode='bilinear')
         
-            Y = wt(data, filters, levels=3)
-            Y_64 = Y[:, :, :64, :64]
-            real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
-            Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
+            Y = wt(data, filters, levels=levels)
+            Y_64 = Y[:, :, :2*patch, :2*patch]
+            real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
+            Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1,
+                                     out=pool.empty((data.shape[0], 4*data.shape[1], patch, patch), data.dtype, data.device))
 
             # Run through unet 128
             recon_mask_128_all = model_128(Y_64_patches)
             recon_mask_128_tr, recon_mask_128_bl, recon_mask_128_br = split_masks_from_channels(recon_mask_128_all)
 
-            Y_128_patches = torch.cat((Y_64_patches, recon_mask_128_tr, recon_mask_128_bl, recon_mask_128_br), dim=1)
+            Y_128_patches = torch.cat((Y_64_patches, recon_mask_128_tr, recon_mask_128_bl, recon_mask_128_br), dim=1,
+                                      out=pool.empty((data.shape[0], 16*data.shape[1], patch, patch), data.dtype, data.device))
 
             # Run through unet 256
             recon_mask_256_all = model_256(Y_128_patches)
-            recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
-
-            # Collate al masks constructed by first 128 level
-            recon_mask_128_tr_img = collate_channels_to_img(recon_mask_128_tr, args.device)
-            recon_mask_128_bl_img = collate_channels_to_img(recon_mask_128_bl, args.device)
-            recon_mask_128_br_img = collate_channels_to_img(recon_mask_128_br, args.device)
-            
-            recon_mask_128_tr_img = iwt(recon_mask_128_tr_img, inv_filters, levels=1)
-            recon_mask_128_bl_img = iwt(recon_mask_128_bl_img, inv_filters, levels=1)   
-            recon_mask_128_br_img = iwt(recon_mask_128_br_img, inv_filters, levels=1)
-            
-            recon_mask_128_iwt = collate_patches_to_img(Y_64, recon_mask_128_tr_img, recon_mask_128_bl_img, recon_mask_128_br_img)
-
-            # Collate all masks concatenated by channel to an image (slice up and put into a square)
-            recon_mask_256_tr_img = collate_16_channels_to_img(recon_mask_256_tr, args.device)
-            recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
-            recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
-
-            zeros = torch.zeros(recon_mask_256_tr_img.shape)
-            
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
-            
-            recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img, device=args.device)
 
-            # IWT to reconstruct iamge
-            recon_mask_256_iwt[:, :, :128, :128] = recon_mask_128_iwt
-            recon_img = iwt(recon_mask_256_iwt, inv_filters, levels=3)
+            # Collate all masks into the 256 packet layout, reconstruct the image in one pass and keep the plain WT masks
+            Y_256 = collate_patches_256(Y_128_patches, recon_mask_256_all, pool=pool)
+            recon_img = synthesize_packets(Y_256, synthesis, depth=3)
+            recon_img = iwt_lowpass(recon_img, inv_filters, args.image_size, levels - 3)
+            recon_mask_256_iwt = iwt_packets(Y_256, inv_filters, packets_tree(3), target=packets_wt(3))
 
-            low_padded = zero_pad(Y_64, 256, args.device)
-            low_img = iwt(low_padded, inv_filters, levels=3)
+            low_img = iwt_lowpass(Y_64, inv_filters, args.image_size, levels)
         
             # Save image into hdf5
             batch_size = recon_img.shape[0]
-            recon_dataset[counter: counter+batch_size] = recon_img.cpu()
-            sample_dataset[counter: counter+batch_size] = data.cpu()
-            low_dataset[counter: counter+batch_size] = low_img.cpu()
+            recon_dataset[counter: counter+batch_size] = pool.copy(recon_img)
+            sample_dataset[counter: counter+batch_size] = pool.copy(data)
+            low_dataset[counter: counter+batch_size] = pool.copy(low_img)
             
-            tl_dataset[counter: counter+batch_size] = iwt(Y_64, inv_filters, levels=1).cpu()
+            tl_dataset[counter: counter+batch_size] = pool.copy(iwt(Y_64, inv_filters, levels=1))
 
             # Save masks
-            recon_mask_256_iwt[:, :, :64, :64].fill_(0)
-            Y[:, :, :64, :64].fill_(0)
-            recon_masks_dataset[counter: counter+batch_size] = recon_mask_256_iwt.cpu()
-            real_masks_dataset[counter: counter+batch_size] = Y.cpu()
-            resized_dataset[counter: counter+batch_size] = resized.cpu()
+            recon_mask_256_iwt[:, :, :2*patch, :2*patch].fill_(0)
+            Y[:, :, :2*patch, :2*patch].fill_(0)
+            recon_masks_dataset[counter: counter+batch_size] = pool.copy(recon_mask_256_iwt)
+            real_masks_dataset[counter: counter+batch_size] = pool.copy(Y)
+            resized_dataset[counter: counter+batch_size] = pool.copy(resized)
             
             counter += batch_size
+            pool.step()
 
     f1.close()
     f2.close()
@@ -517,14 +425,16 @@ def eval_tl(data_loader, data_type, args):
     # Create filters
     filters = create_filters(device=args.device)
     inv_filters = create_inv_filters(device=args.device)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
 
     # Create hdf5 dataset
     f1 = h5py.File(args.output_dir + data_type + '/real_tl_img.hdf5', 'w')
     f2 = h5py.File(args.output_dir + data_type + '/resized_img.hdf5', 'w')
 
-    # recon_dataset = f1.create_dataset('data', shape=(50000, 3, 256, 256), dtype=np.float32, fillvalue=0)
-    real_dataset = f1.create_dataset('data', shape=(50000, 3, 64, 64), dtype=np.float32, fillvalue=0)
-    resized_dataset = f2.create_dataset('data', shape=(50000, 3, 64, 64), dtype=np.float32, fillvalue=0)
+    # recon_dataset = f1.create_dataset('data', shape=(50000, 3, args.image_size, args.image_size), dtype=np.float32, fillvalue=0)
+    real_dataset = f1.create_dataset('data', shape=(50000, 3, 2*patch, 2*patch), dtype=np.float32, fillvalue=0)
+    resized_dataset = f2.create_dataset('data', shape=(50000, 3, 2*patch, 2*patch), dtype=np.float32, fillvalue=0)
 
     counter = 0
 
@@ -533,15 +443,16 @@ def eval_tl(data_loader, data_type, args):
             break
         data = data.to(args.device)
 
-        resized = F.interpolate(data, 64, mode='bilinear')
+        resized = F.interpolate(data, 2*patch, mode='bilinear')
     
-        Y = wt(data, filters, levels=3)
+        # Only the TL patch is kept; the stored patches stay bit-identical to the crop of wt (no fused low-pass)
+        Y = wt_crop(data, filters, 2*patch, levels)
 
         # Get real 1st level masks
-        Y_64 = iwt(Y[:, :, :64, :64], inv_filters, levels=1)
+        Y_64 = iwt(Y, inv_filters, levels=1)
         
-        # Y_64_padded = zero_pad(Y_64, 256, args.device)
-        # Y_64_padded = iwt(Y_64_padded, inv_filters, levels=3)
+        # Y_64_padded = zero_pad(Y_64, args.image_size, args.device)
+        # Y_64_padded = iwt(Y_64_padded, inv_filters, levels=levels)
     
         # Save image into hdf5
         batch_size = Y_64.shape[0]
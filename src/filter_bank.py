@@ -0,0 +1,106 @@
+import os
+import torch
+
+# Process-wide registry of WT filters: (kind, wt_fn, device, dtype) => (filters, version when cached)
+_FILTERS = {}
+
+# 1D taps of each wavelet: wt_fn => {'dec_lo', 'dec_hi', 'rec_lo', 'rec_hi'}
+_TAPS = {}
+
+# Directory where the taps are stored once read from pywt (see set_filter_cache_dir), None to always ask pywt
+_FILTER_CACHE_DIR = None
+
+
+def set_filter_cache_dir(cache_dir):
+    global _FILTER_CACHE_DIR
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    _FILTER_CACHE_DIR = cache_dir or None
+
+
+def clear_filter_cache():
+    _FILTERS.clear()
+    _TAPS.clear()
+
+
+################# TAPS #################
+
+def _taps_file(wt_fn):
+    return os.path.join(_FILTER_CACHE_DIR, 'wavelet_{}.pt'.format(wt_fn))
+
+
+# 1D taps of wt_fn, from memory, then from the on-disk cache, then from pywt (only imported here)
+def wavelet_taps(wt_fn='bior2.2'):
+    if wt_fn in _TAPS:
+        return _TAPS[wt_fn]
+
+    if _FILTER_CACHE_DIR is not None and os.path.exists(_taps_file(wt_fn)):
+        taps = torch.load(_taps_file(wt_fn))
+    else:
+        import pywt
+        w = pywt.Wavelet(wt_fn)
+        taps = {'dec_lo': list(w.dec_lo), 'dec_hi': list(w.dec_hi), 'rec_lo': list(w.rec_lo), 'rec_hi': list(w.rec_hi)}
+
+        if _FILTER_CACHE_DIR is not None:
+            torch.save(taps, _taps_file(wt_fn))
+
+    _TAPS[wt_fn] = taps
+
+    return taps
+
+
+################# FILTERS #################
+
+def _canonical_device(device):
+    device = torch.device(device)
+    if device.type == 'cuda' and device.index is None:
+        device = torch.device('cuda', torch.cuda.current_device())
+
+    return device
+
+
+# Stack of the 4 outer products (lo x lo, lo x hi, hi x lo, hi x hi), same layout as wt/iwt expect
+def _outer_filters(lo, hi):
+    return torch.stack([lo.unsqueeze(0)*lo.unsqueeze(1),
+                        lo.unsqueeze(0)*hi.unsqueeze(1),
+                        hi.unsqueeze(0)*lo.unsqueeze(1),
+                        hi.unsqueeze(0)*hi.unsqueeze(1)], dim=0)
+
+
+def _build_filters(kind, wt_fn, device, dtype):
+    taps = wavelet_taps(wt_fn)
+    # Products are taken in fp32 (fp64 for fp64 filters) on CPU, so the values do not depend on the device
+    build_dtype = torch.float64 if dtype == torch.float64 else torch.float32
+
+    if kind == 'dec':
+        lo = torch.tensor(taps['dec_lo'][::-1], dtype=build_dtype)
+        hi = torch.tensor(taps['dec_hi'][::-1], dtype=build_dtype)
+    else:
+        lo = torch.tensor(taps['rec_lo'], dtype=build_dtype)
+        hi = torch.tensor(taps['rec_hi'], dtype=build_dtype)
+
+    return _outer_filters(lo, hi).to(device=device, dtype=dtype)
+
+
+# Cached filters, shared by every caller: they must not be modified in place (clone them first)
+def _get_filters(kind, wt_fn, device, dtype):
+    key = (kind, wt_fn, _canonical_device(device), dtype)
+
+    if key in _FILTERS:
+        filters, version = _FILTERS[key]
+        if filters._version != version:
+            raise RuntimeError('Cached {} filters for {} were modified in place, clone them before editing'.format(kind, wt_fn))
+        return filters
+
+    filters = _build_filters(kind, wt_fn, key[2], dtype)
+    _FILTERS[key] = (filters, filters._version)
+
+    return filters
+
+
+def get_filters(wt_fn='bior2.2', device='cpu', dtype=torch.float32):
+    return _get_filters('dec', wt_fn, device, dtype)
+
+
+def get_inv_filters(wt_fn='bior2.2', device='cpu', dtype=torch.float32):
+    return _get_filters('rec', wt_fn, device, dtype)
@@ -0,0 +1,76 @@
+import torch
+
+# Preallocated frames for the collate/pad helpers and the host copies of the eval loops, reused from one batch to the next
+# Every request within a step gets its own frame, keyed by (shape, dtype, device), and step() hands them all out again:
+# a frame is only valid until the next step(). After the first batch of a loop no frame is allocated anymore, which the
+# allocations/allocated_bytes of the last step show (0 in steady state)
+# Host frames are pinned when CUDA is available, so the device to host copies of the results do not go through a staging buffer
+
+################# FRAME POOL #################
+
+class FramePool(object):
+    def __init__(self, pin_memory=None):
+        self.pin_memory = torch.cuda.is_available() if pin_memory is None else pin_memory
+        self.frames = {}
+        self.used = {}
+        self.steps = 0
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.step_allocations = 0
+        self.step_bytes = 0
+        self.warm_allocations = 0
+
+    def __repr__(self):
+        return 'FramePool(frames={}, MB={:.1f}, steps={}, allocations after the first step={})'.format(
+            sum(len(frames) for frames in self.frames.values()), self.pool_bytes() / 2**20, self.steps, self.warm_allocations)
+
+    # Bytes held by the pool
+    def pool_bytes(self):
+        return sum(frame.numel() * frame.element_size() for frames in self.frames.values() for frame in frames)
+
+    # Uninitialized frame, distinct from the other frames handed out in the current step
+    def empty(self, shape, dtype=torch.float32, device='cpu'):
+        device = torch.device(device)
+        key = (tuple(shape), dtype, device)
+        frames = self.frames.setdefault(key, [])
+        index = self.used.get(key, 0)
+        self.used[key] = index + 1
+
+        if index == len(frames):
+            pin = self.pin_memory and device.type == 'cpu'
+            frames.append(torch.empty(shape, dtype=dtype, device=device, pin_memory=pin))
+            self.step_allocations += 1
+            self.step_bytes += frames[-1].numel() * frames[-1].element_size()
+
+        return frames[index]
+
+    def zeros(self, shape, dtype=torch.float32, device='cpu'):
+        return self.empty(shape, dtype, device).zero_()
+
+    # Copy of x on device (the host by default) in a pooled frame, x itself when it already is there
+    def copy(self, x, device='cpu'):
+        if x.device == torch.device(device):
+            return x
+
+        return self.empty(x.shape, x.dtype, device).copy_(x)
+
+    # Ends a batch: every frame is available again, returns the (allocations, bytes) of the batch
+    def step(self):
+        stats = (self.step_allocations, self.step_bytes)
+        if self.steps:
+            self.warm_allocations += self.step_allocations
+        self.allocations, self.allocated_bytes = stats
+        self.steps += 1
+        self.step_allocations = 0
+        self.step_bytes = 0
+        self.used.clear()
+
+        return stats
+
+
+# Frame for a helper: from the pool when there is one, a new tensor otherwise
+def new_frame(shape, dtype, device, pool=None, zero=False):
+    if pool is None:
+        return torch.zeros(shape, dtype=dtype, device=device) if zero else torch.empty(shape, dtype=dtype, device=device)
+
+    return pool.zeros(shape, dtype, device) if zero else pool.empty(shape, dtype, device)
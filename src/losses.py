@@ -1,5 +1,6 @@
 import torch
 from torch import nn as nn
+import torch.nn.functional as F
 import torchvision.models as models
 
 class PerceptualLoss(nn.Module):
@@ -37,4 +38,51 @@ class PerceptualLoss(nn.Module):
             real_features = self.model(real)
         
         return self.loss(fake_features, real_features)
-    
+
+
+class MultiPatchMSELoss(nn.Module):
+    """
+    Sum over the patches of the 3 masks (tr, bl, br) of the MSE of each patch, computed on the packed decoder output
+    (B, 3 * patches * channels, patch, patch) with a single reduction instead of 3 mse_loss calls per patch
+    The patch MSEs are those of the loop and are added in its order (tr, bl, br of patch 0, then of patch 1, ...), so the
+    unweighted loss is the scalar of the loop, bit for bit
+    Optional weights of the 3 masks (sub-bands) and of the patches, a per-level weight is band_weights scaled by it.
+    The unweighted (3, patches) MSEs of the last call are kept in patch_losses for logging
+    """
+    BANDS = ('tr', 'bl', 'br')
+
+    def __init__(self, band_weights=None, patch_weights=None, channels=3):
+        super(MultiPatchMSELoss, self).__init__()
+        self.channels = channels
+        weights = None
+        if band_weights is not None:
+            weights = torch.as_tensor(band_weights, dtype=torch.float32).view(3, 1)
+        if patch_weights is not None:
+            patch_weights = torch.as_tensor(patch_weights, dtype=torch.float32).view(1, -1)
+            weights = patch_weights if weights is None else weights * patch_weights
+        self.register_buffer('weights', weights)
+        self.patch_losses = None
+
+    def forward(self, recon, real):
+        # Errors regrouped patch by patch (3, patches, B * channels * patch * patch): each row is reduced in the order of
+        # mse_loss on a single patch, so every patch MSE is bit-identical to the per-patch loop
+        bs = recon.shape[0]
+        err = F.mse_loss(recon, real, reduction='none').reshape(bs, 3, -1, self.channels * recon.shape[2] * recon.shape[3])
+        losses = err.permute(1, 2, 0, 3).reshape(3, err.shape[2], -1).mean(dim=2)
+        self.patch_losses = losses.detach()
+
+        if self.weights is not None:
+            losses = losses * self.weights
+
+        # Sequential sum in the order of the loop: 3 * patches scalar adds, a pairwise sum() would round differently
+        values = losses.t().reshape(-1).unbind()
+        loss = values[0]
+        for value in values[1:]:
+            loss = loss + value
+
+        return loss
+
+    # Per-mask sums (tr, bl, br) of the last patch_losses, a detached (3,) tensor on the device: convert it (a host sync)
+    # only on the steps that log it
+    def band_losses(self):
+        return self.patch_losses.sum(dim=1)
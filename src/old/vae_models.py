@@ -6,7 +6,8 @@ from torch.nn import functional as F
 from torchvision.utils import save_image
 from utils.utils import zero_mask, zero_pad, postprocess_low_freq
 import numpy as np
-import pywt
+from filter_bank import get_filters, get_inv_filters
+from wt_engine import wt, iwt
 
 def truncated_normal_(tensor, mean=0, std=0.02):
     size = tensor.shape
@@ -29,62 +30,13 @@ def weights_init(m):
         for sub_m in m:
             weights_init(sub_m)
 
-def iwt(vres, inv_filters, levels=1):
-    bs = vres.shape[0]
-    h = vres.size(2)
-    w = vres.size(3)
-    vres = vres.reshape(-1, 1, h, w)
-    res = vres.contiguous().view(-1, h//2, 2, w//2).transpose(1, 2).contiguous().view(-1, 4, h//2, w//2).clone()
-    if levels > 1:
-        res[:,:1] = iwt(res[:,:1], inv_filters, levels=levels-1)
-    res = torch.nn.functional.conv_transpose2d(res, Variable(inv_filters[:,None]),stride=2)
-    res = res[:,:,2:-2,2:-2] #removing padding
-
-    return res.reshape(bs, -1, h, w)
-
+# Conv-free Haar IWT (no padding, nothing cropped), see wt_level_haar in wt_engine.py
 def iwt_haar(vres, inv_filters, levels=1):
-    bs = vres.shape[0]
-    h = vres.size(2)
-    w = vres.size(3)
-    vres = vres.reshape(-1, 1, h, w)
-    res = vres.contiguous().view(-1, h//2, 2, w//2).transpose(1, 2).contiguous().view(-1, 4, h//2, w//2).clone()
-    if levels > 1:
-        res[:,:1] = iwt_haar(res[:,:1], inv_filters, levels=levels-1)
-    res = torch.nn.functional.conv_transpose2d(res, Variable(inv_filters[:,None]),stride=2)
-
-    return res.reshape(bs, -1, h, w)
-
-def wt(vimg, filters, levels=1):
-    bs = vimg.shape[0]
-    h = vimg.size(2)
-    w = vimg.size(3)
-    vimg = vimg.reshape(-1, 1, h, w)
-    padded = torch.nn.functional.pad(vimg,(2,2,2,2))
-    res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]),stride=2)
-    if levels>1:
-        res[:,:1] = wt(res[:,:1], filters, levels-1)
-        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
-        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
-        res[:,1:] = res[:,1:]*1.
-    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
-
-    return res.reshape(bs, -1, h, w)
+    return iwt(vres, inv_filters, levels, backend='haar')
 
+# Conv-free Haar WT (no padding), see wt_level_haar in wt_engine.py
 def wt_haar(vimg, filters, levels=1):
-    bs = vimg.shape[0]
-    h = vimg.size(2)
-    w = vimg.size(3)
-    vimg = vimg.reshape(-1, 1, h, w)
-    padded = torch.nn.functional.pad(vimg,(0,0,0,0))
-    res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]),stride=2)
-    if levels>1:
-        res[:,:1] = wt_haar(res[:,:1], filters, levels-1)
-        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
-        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
-        res[:,1:] = res[:,1:]*1.
-    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
-
-    return res.reshape(bs, -1, h, w)
+    return wt(vimg, filters, levels, backend='haar')
 
 def get_upsampling_layer(name, res, bottleneck_dim=100):
     layer = None
@@ -124,7 +76,8 @@ class WT(nn.Module):
         self.wt = wt
         
     def forward(self, input):
-        return self.wt(input, filters=self.filters, levels=self.num_wt)
+        filters = self.filters if self.filters is not None else get_filters(device=input.device, dtype=input.dtype)
+        return self.wt(input, filters=filters, levels=self.num_wt)
 
     def set_filters(self, filters):
         self.filters = filters     
@@ -142,7 +95,8 @@ class IWT(nn.Module):
         self.iwt = iwt
 
     def forward(self, input):
-        return self.iwt(input, inv_filters=self.inv_filters, levels=self.num_iwt)
+        inv_filters = self.inv_filters if self.inv_filters is not None else get_inv_filters(device=input.device, dtype=input.dtype)
+        return self.iwt(input, inv_filters=inv_filters, levels=self.num_iwt)
     
     def set_filters(self, filters):
         self.inv_filters = filters
@@ -4031,15 +3985,7 @@ class FullVAE_512(nn.Module):
         self.devices = devices
 
         # Setting up filters for loss function of WTVAE model
-        w = pywt.Wavelet('bior2.2')
-        dec_hi = torch.Tensor(w.dec_hi[::-1]).to(devices[0]) 
-        dec_lo = torch.Tensor(w.dec_lo[::-1]).to(devices[0])
-        rec_hi = torch.Tensor(w.rec_hi).to(devices[0])
-        rec_lo = torch.Tensor(w.rec_lo).to(devices[0])
-        filters = torch.stack([dec_lo.unsqueeze(0)*dec_lo.unsqueeze(1),
-                               dec_lo.unsqueeze(0)*dec_hi.unsqueeze(1),
-                               dec_hi.unsqueeze(0)*dec_lo.unsqueeze(1),
-                               dec_hi.unsqueeze(0)*dec_hi.unsqueeze(1)], dim=0)
+        filters = get_filters('bior2.2', devices[0])
 
         self.wt_model = wt_model.to(devices[0])
         self.wt_model.set_device(devices[0])
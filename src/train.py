@@ -5,50 +5,58 @@ import wandb
 from tqdm import tqdm, trange
 
 from wt_utils import *
+from losses import MultiPatchMSELoss
+
+# Packed coefficients (wt_pyramid to target) of a batch: computed by the dataloader workers with --worker_wt (see WTCollate),
+# else on the device. A loader without the WTCollate hands out the labels in place of the coefficients, which is an error
+def batch_coeffs(data, coeffs, filters, target, args):
+    if not args.worker_wt:
+        return wt_pyramid(data, filters, target, args.patch_size)
+
+    shape = (data.shape[0], data.shape[1], target, target)
+    if not torch.is_tensor(coeffs) or coeffs.shape != shape:
+        got = tuple(coeffs.shape) if torch.is_tensor(coeffs) else type(coeffs)
+        raise ValueError('--worker_wt expects coefficients of shape {}, got {} (loader built without create_collate_fn?)'.format(shape, got))
+
+    return coeffs.to(args.device, non_blocking=True)
+
 
 # Train function for UNet 128 (64->128) without data augmentation
 def train_unet128(epoch, state_dict, model, optimizer, train_loader, valid_loader, args, logger):
     model.train()
 
-    filters = create_filters(device=args.device)
-    inv_filters = create_inv_filters(device=args.device)
+    filters = create_filters(device=args.device, wt_fn=args.wt_fn)
+    inv_filters = create_inv_filters(device=args.device, wt_fn=args.wt_fn)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    spec = packets_pyramid(args.image_size, 4*patch, patch)
+    criterion = MultiPatchMSELoss(args.band_weights).to(args.device)
 
-    for data, _ in tqdm(train_loader):
+    for data, coeffs in tqdm(train_loader):
         start_time = time.time()
         optimizer.zero_grad()
 
         data = data.to(args.device)
     
-        Y = wt_128_3quads(data, filters, levels=3)
+        Y = batch_coeffs(data, coeffs, filters, 4*patch, args)
 
         # Get real 1st level masks
-        Y_64 = Y[:, :, :64, :64]
-        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+        Y_64 = Y[:, :, :2*patch, :2*patch]
+        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
         Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
         # Get real 2nd level masks
-        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
 
-        # Divide into 32 x 32 patches
-        real_mask_tr_patches = create_patches_from_grid(real_mask_tr)
-        real_mask_bl_patches = create_patches_from_grid(real_mask_bl)
-        real_mask_br_patches = create_patches_from_grid(real_mask_br)
+        # Real masks in the channel layout of the network output
+        real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
         # Run through 128 mask network and get reconstructed image
         recon_mask_all = model(Y_64_patches)
         recon_mask_tr, recon_mask_bl, recon_mask_br = split_masks_from_channels(recon_mask_all)
     
-        # Reshape channel-wise concatenated patches to new dimension
-        recon_mask_tr_patches = recon_mask_tr.reshape(recon_mask_tr.shape[0], -1, 3, 32, 32)
-        recon_mask_bl_patches = recon_mask_bl.reshape(recon_mask_bl.shape[0], -1, 3, 32, 32)
-        recon_mask_br_patches = recon_mask_br.reshape(recon_mask_br.shape[0], -1, 3, 32, 32)
-        
         # Calculate loss
-        loss = 0
-        for j in range(real_mask_tr_patches.shape[1]):
-            loss += F.mse_loss(real_mask_tr_patches[:,j], recon_mask_tr_patches[:,j])
-            loss += F.mse_loss(real_mask_bl_patches[:,j], recon_mask_bl_patches[:,j])
-            loss += F.mse_loss(real_mask_br_patches[:,j], recon_mask_br_patches[:,j])
+        loss = criterion(recon_mask_all, real_mask_channels)
             
         loss.backward()
         optimizer.step()
@@ -60,46 +68,46 @@ def train_unet128(epoch, state_dict, model, optimizer, train_loader, valid_loade
         # Update logger & wandb
         logger.update(state_dict['itr'], loss.cpu().item(), itr_time)
         wandb.log({'train_loss': loss.item()}, commit=False)
+        if not state_dict['itr'] % args.log_every:
+            band_losses = criterion.band_losses().tolist()
+            wandb.log({'train_loss_' + band: value for band, value in zip(criterion.BANDS, band_losses)}, commit=False)
         wandb.log({'train_itr_time': itr_time}, commit=True)    
 
         # Save images, logger, weights on save_every interval
         if not state_dict['itr'] % args.save_every:
-            Y_real = wt(data, filters, levels=3)
-            zeros = torch.zeros(real_mask_tr.shape)
+            Y_real = wt(data, filters, levels=levels)
 
-            # Real mask -- in 32x32 patches
-            real_mask = collate_patches_to_img(zeros, real_mask_tr, real_mask_bl, real_mask_br)
+            # Real mask -- in patch x patch patches
+            real_mask = collate_patches_to_img(None, real_mask_tr, real_mask_bl, real_mask_br)
             
             # Real mask -- IWT'ed
             real_mask_tr_iwt = iwt(real_mask_tr, inv_filters, levels=1)
             real_mask_bl_iwt = iwt(real_mask_bl, inv_filters, levels=1)
             real_mask_br_iwt = iwt(real_mask_br, inv_filters, levels=1)
-            real_mask_iwt = collate_patches_to_img(zeros, real_mask_tr_iwt, real_mask_bl_iwt, real_mask_br_iwt)
+            real_mask_iwt = collate_patches_to_img(None, real_mask_tr_iwt, real_mask_bl_iwt, real_mask_br_iwt)
             
-            real_img_128_padded = Y_real[:, :, :128, :128]
-            real_img_128_padded = zero_pad(real_img_128_padded, 256, args.device)
-            real_img_128_padded = iwt(real_img_128_padded, inv_filters, levels=3)
+            real_img_128_padded = Y_real[:, :, :4*patch, :4*patch]
+            real_img_128_padded = iwt_lowpass(real_img_128_padded, inv_filters, args.image_size, levels)
 
             # Collate all masks concatenated by channel to an image (slice up and put into a square)
             recon_mask_tr_img = collate_channels_to_img(recon_mask_tr, args.device)
             recon_mask_bl_img = collate_channels_to_img(recon_mask_bl, args.device)   
             recon_mask_br_img = collate_channels_to_img(recon_mask_br, args.device)
 
-            recon_mask = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
+            recon_mask = collate_patches_to_img(None, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
             
             recon_mask_tr_img = iwt(recon_mask_tr_img, inv_filters, levels=1)
             recon_mask_bl_img = iwt(recon_mask_bl_img, inv_filters, levels=1)    
             recon_mask_br_img = iwt(recon_mask_br_img, inv_filters, levels=1) 
             
-            recon_mask_iwt = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
+            recon_mask_iwt = collate_patches_to_img(None, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
             
-            recon_mask_padded = zero_pad(recon_mask_iwt, 256, args.device)
-            recon_mask_padded[:, :, :64, :64] = Y_64
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            recon_mask_padded = recon_mask_iwt.to(args.device, copy=True)
+            recon_mask_padded[:, :, :2*patch, :2*patch] = Y_64
+            recon_img = iwt_lowpass(recon_mask_padded, inv_filters, args.image_size, levels)
             
             # Reconstructed image with only 64x64
-            Y_64_low = zero_pad(Y_64, 256, args.device)
-            Y_64_low = iwt(Y_64_low, inv_filters, levels=3)
+            Y_64_low = iwt_lowpass(Y_64, inv_filters, args.image_size, levels)
             
             # Save images
             save_image(real_mask.cpu(), args.output_dir + 'real_mask_itr{}.png'.format(state_dict['itr']))
@@ -128,39 +136,28 @@ def train_unet128(epoch, state_dict, model, optimizer, train_loader, valid_loade
             val_losses = []
 
             with torch.no_grad(): 
-                for data, _ in tqdm(valid_loader):
+                for data, coeffs in tqdm(valid_loader):
                     data = data.to(args.device)
                 
-                    Y = wt_128_3quads(data, filters, levels=3)
+                    Y = batch_coeffs(data, coeffs, filters, 4*patch, args)
 
                     # Get real 1st level masks
-                    Y_64 = Y[:, :, :64, :64]
-                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+                    Y_64 = Y[:, :, :2*patch, :2*patch]
+                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
                     Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
                     # Get real 2nd level masks
-                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
 
-                    # Divide into 32 x 32 patches
-                    real_mask_tr_patches = create_patches_from_grid(real_mask_tr)
-                    real_mask_bl_patches = create_patches_from_grid(real_mask_bl)
-                    real_mask_br_patches = create_patches_from_grid(real_mask_br)
+                    # Real masks in the channel layout of the network output
+                    real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
                     # Run through 128 mask network and get reconstructed image
                     recon_mask_all = model(Y_64_patches)
                     recon_mask_tr, recon_mask_bl, recon_mask_br = split_masks_from_channels(recon_mask_all)
                 
-                    # Reshape channel-wise concatenated patches to new dimension
-                    recon_mask_tr_patches = recon_mask_tr.reshape(recon_mask_tr.shape[0], -1, 3, 32, 32)
-                    recon_mask_bl_patches = recon_mask_bl.reshape(recon_mask_bl.shape[0], -1, 3, 32, 32)
-                    recon_mask_br_patches = recon_mask_br.reshape(recon_mask_br.shape[0], -1, 3, 32, 32)
-                    
                     # Calculate loss
-                    loss = 0
-                    for j in range(real_mask_tr_patches.shape[1]):
-                        loss += F.mse_loss(recon_mask_tr_patches[:, j], real_mask_tr_patches[:, j])
-                        loss += F.mse_loss(recon_mask_bl_patches[:, j], real_mask_bl_patches[:, j])
-                        loss += F.mse_loss(recon_mask_br_patches[:, j], real_mask_br_patches[:, j])
+                    loss = criterion(recon_mask_all, real_mask_channels)
 
                     val_losses.append(loss.item())
 
@@ -180,29 +177,31 @@ def train_unet128_refine(epoch, state_dict, model_128, model, optimizer, train_l
     model.train()
     model_128.eval()
 
-    filters = create_filters(device=args.device)
-    inv_filters = create_inv_filters(device=args.device)
+    filters = create_filters(device=args.device, wt_fn=args.wt_fn)
+    inv_filters = create_inv_filters(device=args.device, wt_fn=args.wt_fn)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    spec = packets_pyramid(args.image_size, 4*patch, patch)
+    criterion = MultiPatchMSELoss(args.band_weights).to(args.device)
 
-    for data, _ in tqdm(train_loader):
+    for data, coeffs in tqdm(train_loader):
         start_time = time.time()
         optimizer.zero_grad()
 
         data = data.to(args.device)
     
-        Y = wt_128_3quads(data, filters, levels=3)
+        Y = batch_coeffs(data, coeffs, filters, 4*patch, args)
 
         # Get real 1st level masks
-        Y_64 = Y[:, :, :64, :64]
-        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+        Y_64 = Y[:, :, :2*patch, :2*patch]
+        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
         Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
         # Get real 2nd level masks
-        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
 
-        # Divide into 32 x 32 patches
-        real_mask_tr_patches = create_patches_from_grid(real_mask_tr)
-        real_mask_bl_patches = create_patches_from_grid(real_mask_bl)
-        real_mask_br_patches = create_patches_from_grid(real_mask_br)
+        # Real masks in the channel layout of the network output
+        real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
         # Run through 128 mask network and get reconstructed image
         with torch.no_grad():
@@ -212,17 +211,8 @@ def train_unet128_refine(epoch, state_dict, model_128, model, optimizer, train_l
         refined_recon_mask_all = model(recon_mask_all)
         refined_recon_mask_tr, refined_recon_mask_bl, refined_recon_mask_br = split_masks_from_channels(refined_recon_mask_all)
     
-        # Reshape channel-wise concatenated patches to new dimension
-        refined_recon_mask_tr_patches = refined_recon_mask_tr.reshape(refined_recon_mask_tr.shape[0], -1, 3, 32, 32)
-        refined_recon_mask_bl_patches = refined_recon_mask_bl.reshape(refined_recon_mask_bl.shape[0], -1, 3, 32, 32)
-        refined_recon_mask_br_patches = refined_recon_mask_br.reshape(refined_recon_mask_br.shape[0], -1, 3, 32, 32)
-        
         # Calculate loss
-        loss = 0
-        for j in range(real_mask_tr_patches.shape[1]):
-            loss += F.mse_loss(refined_recon_mask_tr_patches[:, j], real_mask_tr_patches[:, j])
-            loss += F.mse_loss(refined_recon_mask_bl_patches[:, j], real_mask_bl_patches[:, j])
-            loss += F.mse_loss(refined_recon_mask_br_patches[:, j], real_mask_br_patches[:, j])
+        loss = criterion(refined_recon_mask_all, real_mask_channels)
             
         loss.backward()
         optimizer.step()
@@ -234,62 +224,62 @@ def train_unet128_refine(epoch, state_dict, model_128, model, optimizer, train_l
         # Update logger & wandb
         logger.update(state_dict['itr'], loss.cpu().item(), itr_time)
         wandb.log({'train_loss': loss.item()}, commit=False)
+        if not state_dict['itr'] % args.log_every:
+            band_losses = criterion.band_losses().tolist()
+            wandb.log({'train_loss_' + band: value for band, value in zip(criterion.BANDS, band_losses)}, commit=False)
         wandb.log({'train_itr_time': itr_time}, commit=True)    
 
         # Save images, logger, weights on save_every interval
         if not state_dict['itr'] % args.save_every:
-            Y_real = wt(data, filters, levels=3)
-            zeros = torch.zeros(real_mask_tr.shape)
+            Y_real = wt(data, filters, levels=levels)
 
-            # Real mask -- in 32x32 patches
-            real_mask = collate_patches_to_img(zeros, real_mask_tr, real_mask_bl, real_mask_br)
+            # Real mask -- in patch x patch patches
+            real_mask = collate_patches_to_img(None, real_mask_tr, real_mask_bl, real_mask_br)
             
             # Real mask -- IWT'ed
             real_mask_tr_iwt = iwt(real_mask_tr, inv_filters, levels=1)
             real_mask_bl_iwt = iwt(real_mask_bl, inv_filters, levels=1)
             real_mask_br_iwt = iwt(real_mask_br, inv_filters, levels=1)
-            real_mask_iwt = collate_patches_to_img(zeros, real_mask_tr_iwt, real_mask_bl_iwt, real_mask_br_iwt)
+            real_mask_iwt = collate_patches_to_img(None, real_mask_tr_iwt, real_mask_bl_iwt, real_mask_br_iwt)
             
-            real_img_128_padded = Y_real[:, :, :128, :128]
-            real_img_128_padded = zero_pad(real_img_128_padded, 256, args.device)
-            real_img_128_padded = iwt(real_img_128_padded, inv_filters, levels=3)
+            real_img_128_padded = Y_real[:, :, :4*patch, :4*patch]
+            real_img_128_padded = iwt_lowpass(real_img_128_padded, inv_filters, args.image_size, levels)
 
             # Collate all masks concatenated by channel to an image (slice up and put into a square)
             recon_mask_tr_img = collate_channels_to_img(recon_mask_tr, args.device)
             recon_mask_bl_img = collate_channels_to_img(recon_mask_bl, args.device)   
             recon_mask_br_img = collate_channels_to_img(recon_mask_br, args.device)
 
-            recon_mask = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
+            recon_mask = collate_patches_to_img(None, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
             
             recon_mask_tr_img = iwt(recon_mask_tr_img, inv_filters, levels=1)
             recon_mask_bl_img = iwt(recon_mask_bl_img, inv_filters, levels=1)    
             recon_mask_br_img = iwt(recon_mask_br_img, inv_filters, levels=1) 
             
-            recon_mask_iwt = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
+            recon_mask_iwt = collate_patches_to_img(None, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
 
             refined_recon_mask_tr_img = collate_channels_to_img(refined_recon_mask_tr, args.device)
             refined_recon_mask_bl_img = collate_channels_to_img(refined_recon_mask_bl, args.device)   
             refined_recon_mask_br_img = collate_channels_to_img(refined_recon_mask_br, args.device)
 
-            refined_recon_mask = collate_patches_to_img(zeros, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
+            refined_recon_mask = collate_patches_to_img(None, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
             
             refined_recon_mask_tr_img = iwt(refined_recon_mask_tr_img, inv_filters, levels=1)
             refined_recon_mask_bl_img = iwt(refined_recon_mask_bl_img, inv_filters, levels=1)    
             refined_recon_mask_br_img = iwt(refined_recon_mask_br_img, inv_filters, levels=1) 
             
-            refined_recon_mask_iwt = collate_patches_to_img(zeros, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
+            refined_recon_mask_iwt = collate_patches_to_img(None, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
 
-            recon_mask_padded = zero_pad(recon_mask_iwt, 256, args.device)
-            recon_mask_padded[:, :, :64, :64] = Y_64
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            recon_mask_padded = recon_mask_iwt.to(args.device, copy=True)
+            recon_mask_padded[:, :, :2*patch, :2*patch] = Y_64
+            recon_img = iwt_lowpass(recon_mask_padded, inv_filters, args.image_size, levels)
 
-            refined_recon_mask_padded = zero_pad(refined_recon_mask_iwt, 256, args.device)
-            refined_recon_mask_padded[:, :, :64, :64] = Y_64
-            refined_recon_img = iwt(refined_recon_mask_padded, inv_filters, levels=3)
+            refined_recon_mask_padded = refined_recon_mask_iwt.to(args.device, copy=True)
+            refined_recon_mask_padded[:, :, :2*patch, :2*patch] = Y_64
+            refined_recon_img = iwt_lowpass(refined_recon_mask_padded, inv_filters, args.image_size, levels)
             
             # Reconstructed image with only 64x64
-            Y_64_low = zero_pad(Y_64, 256, args.device)
-            Y_64_low = iwt(Y_64_low, inv_filters, levels=3)
+            Y_64_low = iwt_lowpass(Y_64, inv_filters, args.image_size, levels)
             
             # Save images
             save_image(real_mask.cpu(), args.output_dir + 'real_mask_itr{}.png'.format(state_dict['itr']))
@@ -322,23 +312,21 @@ def train_unet128_refine(epoch, state_dict, model_128, model, optimizer, train_l
             val_losses = []
 
             with torch.no_grad(): 
-                for data, _ in tqdm(valid_loader):
+                for data, coeffs in tqdm(valid_loader):
                     data = data.to(args.device)
                 
-                    Y = wt_128_3quads(data, filters, levels=3)
+                    Y = batch_coeffs(data, coeffs, filters, 4*patch, args)
 
                     # Get real 1st level masks
-                    Y_64 = Y[:, :, :64, :64]
-                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+                    Y_64 = Y[:, :, :2*patch, :2*patch]
+                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
                     Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
                     # Get real 2nd level masks
-                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
 
-                    # Divide into 32 x 32 patches
-                    real_mask_tr_patches = create_patches_from_grid(real_mask_tr)
-                    real_mask_bl_patches = create_patches_from_grid(real_mask_bl)
-                    real_mask_br_patches = create_patches_from_grid(real_mask_br)
+                    # Real masks in the channel layout of the network output
+                    real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
                     # Run through 128 mask network and get reconstructed image
                     with torch.no_grad():
@@ -348,17 +336,8 @@ def train_unet128_refine(epoch, state_dict, model_128, model, optimizer, train_l
                     refined_recon_mask_all = model(recon_mask_all)
                     refined_recon_mask_tr, refined_recon_mask_bl, refined_recon_mask_br = split_masks_from_channels(refined_recon_mask_all)
                 
-                    # Reshape channel-wise concatenated patches to new dimension
-                    refined_recon_mask_tr_patches = refined_recon_mask_tr.reshape(refined_recon_mask_tr.shape[0], -1, 3, 32, 32)
-                    refined_recon_mask_bl_patches = refined_recon_mask_bl.reshape(refined_recon_mask_bl.shape[0], -1, 3, 32, 32)
-                    refined_recon_mask_br_patches = refined_recon_mask_br.reshape(refined_recon_mask_br.shape[0], -1, 3, 32, 32)
-                    
                     # Calculate loss
-                    loss = 0
-                    for j in range(real_mask_tr_patches.shape[1]):
-                        loss += F.mse_loss(refined_recon_mask_tr_patches[:, j], real_mask_tr_patches[:, j])
-                        loss += F.mse_loss(refined_recon_mask_bl_patches[:, j], real_mask_bl_patches[:, j])
-                        loss += F.mse_loss(refined_recon_mask_br_patches[:, j], real_mask_br_patches[:, j])
+                    loss = criterion(refined_recon_mask_all, real_mask_channels)
 
                     val_losses.append(loss.item())
 
@@ -370,58 +349,55 @@ def train_unet128_refine(epoch, state_dict, model_128, model, optimizer, train_l
             model.train()
 
             # Save validation images
-            Y_real = wt(data, filters, levels=3)
-            zeros = torch.zeros(real_mask_tr.shape)
+            Y_real = wt(data, filters, levels=levels)
 
-            # Real mask -- in 32x32 patches
-            real_mask = collate_patches_to_img(zeros, real_mask_tr, real_mask_bl, real_mask_br)
+            # Real mask -- in patch x patch patches
+            real_mask = collate_patches_to_img(None, real_mask_tr, real_mask_bl, real_mask_br)
             
             # Real mask -- IWT'ed
             real_mask_tr_iwt = iwt(real_mask_tr, inv_filters, levels=1)
             real_mask_bl_iwt = iwt(real_mask_bl, inv_filters, levels=1)
             real_mask_br_iwt = iwt(real_mask_br, inv_filters, levels=1)
-            real_mask_iwt = collate_patches_to_img(zeros, real_mask_tr_iwt, real_mask_bl_iwt, real_mask_br_iwt)
+            real_mask_iwt = collate_patches_to_img(None, real_mask_tr_iwt, real_mask_bl_iwt, real_mask_br_iwt)
             
-            real_img_128_padded = Y_real[:, :, :128, :128]
-            real_img_128_padded = zero_pad(real_img_128_padded, 256, args.device)
-            real_img_128_padded = iwt(real_img_128_padded, inv_filters, levels=3)
+            real_img_128_padded = Y_real[:, :, :4*patch, :4*patch]
+            real_img_128_padded = iwt_lowpass(real_img_128_padded, inv_filters, args.image_size, levels)
 
             # Collate all masks concatenated by channel to an image (slice up and put into a square)
             recon_mask_tr_img = collate_channels_to_img(recon_mask_tr, args.device)
             recon_mask_bl_img = collate_channels_to_img(recon_mask_bl, args.device)   
             recon_mask_br_img = collate_channels_to_img(recon_mask_br, args.device)
 
-            recon_mask = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
+            recon_mask = collate_patches_to_img(None, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
             
             recon_mask_tr_img = iwt(recon_mask_tr_img, inv_filters, levels=1)
             recon_mask_bl_img = iwt(recon_mask_bl_img, inv_filters, levels=1)    
             recon_mask_br_img = iwt(recon_mask_br_img, inv_filters, levels=1) 
             
-            recon_mask_iwt = collate_patches_to_img(zeros, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
+            recon_mask_iwt = collate_patches_to_img(None, recon_mask_tr_img, recon_mask_bl_img, recon_mask_br_img)
 
             refined_recon_mask_tr_img = collate_channels_to_img(refined_recon_mask_tr, args.device)
             refined_recon_mask_bl_img = collate_channels_to_img(refined_recon_mask_bl, args.device)   
             refined_recon_mask_br_img = collate_channels_to_img(refined_recon_mask_br, args.device)
 
-            refined_recon_mask = collate_patches_to_img(zeros, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
+            refined_recon_mask = collate_patches_to_img(None, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
             
             refined_recon_mask_tr_img = iwt(refined_recon_mask_tr_img, inv_filters, levels=1)
             refined_recon_mask_bl_img = iwt(refined_recon_mask_bl_img, inv_filters, levels=1)    
             refined_recon_mask_br_img = iwt(refined_recon_mask_br_img, inv_filters, levels=1) 
             
-            refined_recon_mask_iwt = collate_patches_to_img(zeros, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
+            refined_recon_mask_iwt = collate_patches_to_img(None, refined_recon_mask_tr_img, refined_recon_mask_bl_img, refined_recon_mask_br_img)
 
-            recon_mask_padded = zero_pad(recon_mask_iwt, 256, args.device)
-            recon_mask_padded[:, :, :64, :64] = Y_64
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            recon_mask_padded = recon_mask_iwt.to(args.device, copy=True)
+            recon_mask_padded[:, :, :2*patch, :2*patch] = Y_64
+            recon_img = iwt_lowpass(recon_mask_padded, inv_filters, args.image_size, levels)
 
-            refined_recon_mask_padded = zero_pad(refined_recon_mask_iwt, 256, args.device)
-            refined_recon_mask_padded[:, :, :64, :64] = Y_64
-            refined_recon_img = iwt(refined_recon_mask_padded, inv_filters, levels=3)
+            refined_recon_mask_padded = refined_recon_mask_iwt.to(args.device, copy=True)
+            refined_recon_mask_padded[:, :, :2*patch, :2*patch] = Y_64
+            refined_recon_img = iwt_lowpass(refined_recon_mask_padded, inv_filters, args.image_size, levels)
             
             # Reconstructed image with only 64x64
-            Y_64_low = zero_pad(Y_64, 256, args.device)
-            Y_64_low = iwt(Y_64_low, inv_filters, levels=3)
+            Y_64_low = iwt_lowpass(Y_64, inv_filters, args.image_size, levels)
             
             # Save images
             save_image(real_mask.cpu(), args.output_dir + 'val_real_mask_itr{}.png'.format(state_dict['itr']))
@@ -449,29 +425,31 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
     model.train()
     model_128.eval()
 
-    filters = create_filters(device=args.device)
-    inv_filters = create_inv_filters(device=args.device)
+    filters = create_filters(device=args.device, wt_fn=args.wt_fn)
+    inv_filters = create_inv_filters(device=args.device, wt_fn=args.wt_fn)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    spec = packets_pyramid(args.image_size, 8*patch, patch)
+    criterion = MultiPatchMSELoss(args.band_weights).to(args.device)
 
-    for data, _ in tqdm(train_loader):
+    for data, coeffs in tqdm(train_loader):
         start_time = time.time()
         optimizer.zero_grad()
 
         data = data.to(args.device)
     
-        Y = wt_256_3quads(data, filters, levels=3)
+        Y = batch_coeffs(data, coeffs, filters, 8*patch, args)
 
         # Get real 1st level masks
-        Y_64 = Y[:, :, :64, :64]
-        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+        Y_64 = Y[:, :, :2*patch, :2*patch]
+        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
         Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
         # Get real 2nd level masks
-        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
         
-        # Divide into 32x32 patches
-        real_mask_tr_patches = create_patches_from_grid_16(real_mask_tr)
-        real_mask_bl_patches = create_patches_from_grid_16(real_mask_bl)
-        real_mask_br_patches = create_patches_from_grid_16(real_mask_br)
+        # Real masks in the channel layout of the network output
+        real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
         with torch.no_grad():
             recon_mask_128_all = model_128(Y_64_patches)
@@ -483,17 +461,8 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
         recon_mask_256_all = model(Y_128_patches)
         recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
     
-        # Reshape channel-wise concatenated patches to new dimension
-        recon_mask_256_tr_patches = recon_mask_256_tr.reshape(recon_mask_256_tr.shape[0], -1, 3, 32, 32)
-        recon_mask_256_bl_patches = recon_mask_256_bl.reshape(recon_mask_256_bl.shape[0], -1, 3, 32, 32)
-        recon_mask_256_br_patches = recon_mask_256_br.reshape(recon_mask_256_br.shape[0], -1, 3, 32, 32) 
-        
         # Calculate loss
-        loss = 0
-        for j in range(real_mask_tr_patches.shape[1]):
-            loss += F.mse_loss(recon_mask_256_tr_patches[:, j], real_mask_tr_patches[:, j])
-            loss += F.mse_loss(recon_mask_256_bl_patches[:, j], real_mask_bl_patches[:, j])
-            loss += F.mse_loss(recon_mask_256_br_patches[:, j], real_mask_br_patches[:, j])
+        loss = criterion(recon_mask_256_all, real_mask_channels)
             
         loss.backward()
         optimizer.step()
@@ -505,17 +474,19 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
         # Update logger & wandb
         logger.update(state_dict['itr'], loss.cpu().item(), itr_time)
         wandb.log({'train_loss': loss.item()}, commit=False)
+        if not state_dict['itr'] % args.log_every:
+            band_losses = criterion.band_losses().tolist()
+            wandb.log({'train_loss_' + band: value for band, value in zip(criterion.BANDS, band_losses)}, commit=False)
         wandb.log({'train_itr_time': itr_time}, commit=True)    
 
         # Save images, logger, weights on save_every interval
         if not state_dict['itr'] % args.save_every:
-            Y_real = wt(data, filters, levels=3)
-            Y_64 = Y_real[:, :, :64, :64]
-            Y_128 = Y_real[:, :, :128, :128]
-            zeros = torch.zeros(real_mask_tr.shape)
+            Y_real = wt(data, filters, levels=levels)
+            Y_64 = Y_real[:, :, :2*patch, :2*patch]
+            Y_128 = Y_real[:, :, :4*patch, :4*patch]
 
-            # Real mask -- in 32x32 patches & regular
-            real_mask = collate_patches_to_img(zeros, real_mask_tr, real_mask_bl, real_mask_br)
+            # Real mask -- in patch x patch patches & regular
+            real_mask = collate_patches_to_img(None, real_mask_tr, real_mask_bl, real_mask_br)
             real_mask_iwt = zero_mask(Y_real, 3, 3)
 
             # Collate al masks constructed by first 128 level
@@ -534,24 +505,22 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
             recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
             recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
 
-            recon_mask_256 = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256 = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
+            recon_mask_256_tr_img = iwt_pyramid(recon_mask_256_tr_img, inv_filters, patch=patch)
+            recon_mask_256_bl_img = iwt_pyramid(recon_mask_256_bl_img, inv_filters, patch=patch)
+            recon_mask_256_br_img = iwt_pyramid(recon_mask_256_br_img, inv_filters, patch=patch)
             
-            recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256_iwt = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_padded = zero_pad(recon_mask_256_iwt, 256, args.device)
-            recon_mask_padded[:, :, :128, :128] = recon_mask_128_iwt
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            recon_mask_padded = recon_mask_256_iwt.to(args.device, copy=True)
+            recon_mask_padded[:, :, :4*patch, :4*patch] = recon_mask_128_iwt
+            recon_img = iwt_lowpass(recon_mask_padded, inv_filters, args.image_size, levels)
 
-            recon_mask_128_padded = zero_pad(recon_mask_128_iwt, 256, args.device)
-            recon_img_128 = iwt(recon_mask_128_padded, inv_filters, levels=3)
+            recon_img_128 = iwt_lowpass(recon_mask_128_iwt.to(args.device), inv_filters, args.image_size, levels)
             
             # Reconstructed image with only 64x64
-            Y_128_low = zero_pad(Y_128, 256, args.device)
-            Y_128_low = iwt(Y_128_low, inv_filters, levels=3)
+            Y_128_low = iwt_lowpass(Y_128, inv_filters, args.image_size, levels)
             
             # Save images
             save_image(real_mask.cpu(), args.output_dir + 'real_mask_itr{}.png'.format(state_dict['itr']))
@@ -580,23 +549,21 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
             model.eval()
             val_losses = []
             with torch.no_grad(): 
-                for data, _ in tqdm(valid_loader):
+                for data, coeffs in tqdm(valid_loader):
                     data = data.to(args.device)
                 
-                    Y = wt_256_3quads(data, filters, levels=3)
+                    Y = batch_coeffs(data, coeffs, filters, 8*patch, args)
 
                     # Get real 1st level masks
-                    Y_64 = Y[:, :, :64, :64]
-                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+                    Y_64 = Y[:, :, :2*patch, :2*patch]
+                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
                     Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
                     # Get real 2nd level masks
-                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
                     
-                    # Divide into 32x32 patches
-                    real_mask_tr_patches = create_patches_from_grid_16(real_mask_tr)
-                    real_mask_bl_patches = create_patches_from_grid_16(real_mask_bl)
-                    real_mask_br_patches = create_patches_from_grid_16(real_mask_br)
+                    # Real masks in the channel layout of the network output
+                    real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
                     with torch.no_grad():
                         recon_mask_128_all = model_128(Y_64_patches)
@@ -608,17 +575,8 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
                     recon_mask_256_all = model(Y_128_patches)
                     recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
                 
-                    # Reshape channel-wise concatenated patches to new dimension
-                    recon_mask_256_tr_patches = recon_mask_256_tr.reshape(recon_mask_256_tr.shape[0], -1, 3, 32, 32)
-                    recon_mask_256_bl_patches  = recon_mask_256_bl.reshape(recon_mask_256_bl.shape[0], -1, 3, 32, 32)
-                    recon_mask_256_br_patches = recon_mask_256_br.reshape(recon_mask_256_br.shape[0], -1, 3, 32, 32) 
-                    
                     # Calculate loss
-                    loss = 0
-                    for j in range(real_mask_tr_patches.shape[1]):
-                        loss += F.mse_loss(recon_mask_256_tr_patches[:, j], real_mask_tr_patches[:, j])
-                        loss += F.mse_loss(recon_mask_256_bl_patches[:, j], real_mask_bl_patches[:, j])
-                        loss += F.mse_loss(recon_mask_256_br_patches[:, j], real_mask_br_patches[:, j])
+                    loss = criterion(recon_mask_256_all, real_mask_channels)
 
                     val_losses.append(loss.item())
 
@@ -630,13 +588,12 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
             model.train()
 
             # Save validation images
-            Y_real = wt(data, filters, levels=3)
-            Y_64 = Y_real[:, :, :64, :64]
-            Y_128 = Y_real[:, :, :128, :128]
-            zeros = torch.zeros(real_mask_tr.shape)
+            Y_real = wt(data, filters, levels=levels)
+            Y_64 = Y_real[:, :, :2*patch, :2*patch]
+            Y_128 = Y_real[:, :, :4*patch, :4*patch]
 
-            # Real mask -- in 32x32 patches & regular
-            real_mask = collate_patches_to_img(zeros, real_mask_tr, real_mask_bl, real_mask_br)
+            # Real mask -- in patch x patch patches & regular
+            real_mask = collate_patches_to_img(None, real_mask_tr, real_mask_bl, real_mask_br)
             real_mask_iwt = zero_mask(Y_real, 3, 3)
 
             # Collate al masks constructed by first 128 level
@@ -655,24 +612,22 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
             recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
             recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
 
-            recon_mask_256 = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256 = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
+            recon_mask_256_tr_img = iwt_pyramid(recon_mask_256_tr_img, inv_filters, patch=patch)
+            recon_mask_256_bl_img = iwt_pyramid(recon_mask_256_bl_img, inv_filters, patch=patch)
+            recon_mask_256_br_img = iwt_pyramid(recon_mask_256_br_img, inv_filters, patch=patch)
             
-            recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256_iwt = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_padded = zero_pad(recon_mask_256_iwt, 256, args.device)
-            recon_mask_padded[:, :, :128, :128] = recon_mask_128_iwt
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            recon_mask_padded = recon_mask_256_iwt.to(args.device, copy=True)
+            recon_mask_padded[:, :, :4*patch, :4*patch] = recon_mask_128_iwt
+            recon_img = iwt_lowpass(recon_mask_padded, inv_filters, args.image_size, levels)
 
-            recon_mask_128_padded = zero_pad(recon_mask_128_iwt, 256, args.device)
-            recon_img_128 = iwt(recon_mask_128_padded, inv_filters, levels=3)
+            recon_img_128 = iwt_lowpass(recon_mask_128_iwt.to(args.device), inv_filters, args.image_size, levels)
             
             # Reconstructed image with only 64x64
-            Y_128_low = zero_pad(Y_128, 256, args.device)
-            Y_128_low = iwt(Y_128_low, inv_filters, levels=3)
+            Y_128_low = iwt_lowpass(Y_128, inv_filters, args.image_size, levels)
             
             # Save images
             save_image(real_mask.cpu(), args.output_dir + 'val_real_mask_itr{}.png'.format(state_dict['itr']))
@@ -696,37 +651,39 @@ def train_unet256(epoch, state_dict, model, model_128, optimizer, train_loader,
 def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_loader, args, logger):
     model.train()
 
-    filters = create_filters(device=args.device)
-    inv_filters = create_inv_filters(device=args.device)
+    filters = create_filters(device=args.device, wt_fn=args.wt_fn)
+    inv_filters = create_inv_filters(device=args.device, wt_fn=args.wt_fn)
+    patch = args.patch_size
+    levels = pyramid_levels(args.image_size, patch)
+    spec = packets_pyramid(args.image_size, 8*patch, patch)
+    criterion = MultiPatchMSELoss(args.band_weights).to(args.device)
 
-    for data, _ in tqdm(train_loader):
+    for data, coeffs in tqdm(train_loader):
         start_time = time.time()
         optimizer.zero_grad()
 
         data = data.to(args.device)
     
-        Y = wt_256_3quads(data, filters, levels=3)
+        Y = batch_coeffs(data, coeffs, filters, 8*patch, args)
 
         # Get real 1st level masks
-        Y_64 = Y[:, :, :64, :64]
-        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+        Y_64 = Y[:, :, :2*patch, :2*patch]
+        real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
         Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
         # Get real 2nd level masks (128 level)
-        real_mask_128_tr, real_mask_128_bl, real_mask_128_br = get_3masks(Y[:, :, :128, :128], 64)
+        real_mask_128_tr, real_mask_128_bl, real_mask_128_br = get_3masks(Y[:, :, :4*patch, :4*patch], 2*patch)
 
-        # Divide into 32 x 32 patches
+        # Divide into patch x patch patches
         real_mask_128_tr = collate_channels_from_grid(real_mask_128_tr)
         real_mask_128_bl = collate_channels_from_grid(real_mask_128_bl)
         real_mask_128_br = collate_channels_from_grid(real_mask_128_br)
 
         # Get real 3rd level masks (256 level)
-        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+        real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
         
-        # Divide into 32x32 patches
-        real_mask_tr_patches = create_patches_from_grid_16(real_mask_tr)
-        real_mask_bl_patches = create_patches_from_grid_16(real_mask_bl)
-        real_mask_br_patches = create_patches_from_grid_16(real_mask_br)
+        # Real masks in the channel layout of the network output
+        real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
         # Creating input with real masks up to 128 level
         Y_128_patches = torch.cat((Y_64_patches, real_mask_128_tr, real_mask_128_bl, real_mask_128_br), dim=1)
@@ -735,17 +692,8 @@ def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_
         recon_mask_256_all = model(Y_128_patches)
         recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
     
-        # Reshape channel-wise concatenated patches to new dimension
-        recon_mask_256_tr_patches = recon_mask_256_tr.reshape(recon_mask_256_tr.shape[0], -1, 3, 32, 32)
-        recon_mask_256_bl_patches = recon_mask_256_bl.reshape(recon_mask_256_bl.shape[0], -1, 3, 32, 32)
-        recon_mask_256_br_patches = recon_mask_256_br.reshape(recon_mask_256_br.shape[0], -1, 3, 32, 32) 
-        
         # Calculate loss
-        loss = 0
-        for j in range(real_mask_tr_patches.shape[1]):
-            loss += F.mse_loss(recon_mask_256_tr_patches[:, j], real_mask_tr_patches[:, j])
-            loss += F.mse_loss(recon_mask_256_bl_patches[:, j], real_mask_bl_patches[:, j])
-            loss += F.mse_loss(recon_mask_256_br_patches[:, j], real_mask_br_patches[:, j])
+        loss = criterion(recon_mask_256_all, real_mask_channels)
             
         loss.backward()
         optimizer.step()
@@ -757,17 +705,19 @@ def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_
         # Update logger & wandb
         logger.update(state_dict['itr'], loss.cpu().item(), itr_time)
         wandb.log({'train_loss': loss.item()}, commit=False)
+        if not state_dict['itr'] % args.log_every:
+            band_losses = criterion.band_losses().tolist()
+            wandb.log({'train_loss_' + band: value for band, value in zip(criterion.BANDS, band_losses)}, commit=False)
         wandb.log({'train_itr_time': itr_time}, commit=True)    
 
         # Save images, logger, weights on save_every interval
         if not state_dict['itr'] % args.save_every:
-            Y_real = wt(data, filters, levels=3)
-            Y_64 = Y_real[:, :, :64, :64]
-            Y_128 = Y_real[:, :, :128, :128]
-            zeros = torch.zeros(real_mask_tr.shape)
+            Y_real = wt(data, filters, levels=levels)
+            Y_64 = Y_real[:, :, :2*patch, :2*patch]
+            Y_128 = Y_real[:, :, :4*patch, :4*patch]
 
-            # Real mask -- in 32x32 patches & regular
-            real_mask = collate_patches_to_img(zeros, real_mask_tr, real_mask_bl, real_mask_br)
+            # Real mask -- in patch x patch patches & regular
+            real_mask = collate_patches_to_img(None, real_mask_tr, real_mask_bl, real_mask_br)
             real_mask_iwt = zero_mask(Y_real, 3, 3)
 
             # Collate all masks concatenated by channel to an image (slice up and put into a square)
@@ -775,21 +725,20 @@ def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_
             recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
             recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
 
-            recon_mask_256 = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256 = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
+            recon_mask_256_tr_img = iwt_pyramid(recon_mask_256_tr_img, inv_filters, patch=patch)
+            recon_mask_256_bl_img = iwt_pyramid(recon_mask_256_bl_img, inv_filters, patch=patch)
+            recon_mask_256_br_img = iwt_pyramid(recon_mask_256_br_img, inv_filters, patch=patch)
             
-            recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256_iwt = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_padded = zero_pad(recon_mask_256_iwt, 256, args.device)
-            recon_mask_padded[:, :, :128, :128] = Y_128
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            recon_mask_padded = recon_mask_256_iwt.to(args.device, copy=True)
+            recon_mask_padded[:, :, :4*patch, :4*patch] = Y_128
+            recon_img = iwt_lowpass(recon_mask_padded, inv_filters, args.image_size, levels)
             
             # Reconstructed image with only 128x128
-            Y_128_low = zero_pad(Y_128, 256, args.device)
-            Y_128_low = iwt(Y_128_low, inv_filters, levels=3)
+            Y_128_low = iwt_lowpass(Y_128, inv_filters, args.image_size, levels)
             
             # Save images
             save_image(real_mask.cpu(), args.output_dir + 'real_mask_itr{}.png'.format(state_dict['itr']))
@@ -817,31 +766,29 @@ def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_
             model.eval()
             val_losses = []
             with torch.no_grad(): 
-                for data, _ in tqdm(valid_loader):
+                for data, coeffs in tqdm(valid_loader):
                     data = data.to(args.device)
     
-                    Y = wt_256_3quads(data, filters, levels=3)
+                    Y = batch_coeffs(data, coeffs, filters, 8*patch, args)
 
                     # Get real 1st level masks
-                    Y_64 = Y[:, :, :64, :64]
-                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, 32)
+                    Y_64 = Y[:, :, :2*patch, :2*patch]
+                    real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br = get_4masks(Y_64, patch)
                     Y_64_patches = torch.cat((real_mask_64_tl, real_mask_64_tr, real_mask_64_bl, real_mask_64_br), dim=1)
 
                     # Get real 2nd level masks (128 level)
-                    real_mask_128_tr, real_mask_128_bl, real_mask_128_br = get_3masks(Y[:, :, :128, :128], 64)
+                    real_mask_128_tr, real_mask_128_bl, real_mask_128_br = get_3masks(Y[:, :, :4*patch, :4*patch], 2*patch)
 
-                    # Divide into 32 x 32 patches
+                    # Divide into patch x patch patches
                     real_mask_128_tr = collate_channels_from_grid(real_mask_128_tr)
                     real_mask_128_bl = collate_channels_from_grid(real_mask_128_bl)
                     real_mask_128_br = collate_channels_from_grid(real_mask_128_br)
 
                     # Get real 3rd level masks (256 level)
-                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, args.mask_dim)
+                    real_mask_tr, real_mask_bl, real_mask_br = get_3masks(Y, Y.shape[2] // 2)
                     
-                    # Divide into 32x32 patches
-                    real_mask_tr_patches = create_patches_from_grid_16(real_mask_tr)
-                    real_mask_bl_patches = create_patches_from_grid_16(real_mask_bl)
-                    real_mask_br_patches = create_patches_from_grid_16(real_mask_br)
+                    # Real masks in the channel layout of the network output
+                    real_mask_channels = CoefficientPyramid(Y, spec).mask_channels(Y.shape[2], patch)
 
                     # Creating input with real masks up to 128 level
                     Y_128_patches = torch.cat((Y_64_patches, real_mask_128_tr, real_mask_128_bl, real_mask_128_br), dim=1)
@@ -850,17 +797,8 @@ def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_
                     recon_mask_256_all = model(Y_128_patches)
                     recon_mask_256_tr, recon_mask_256_bl, recon_mask_256_br = split_masks_from_channels(recon_mask_256_all)
                 
-                    # Reshape channel-wise concatenated patches to new dimension
-                    recon_mask_256_tr_patches = recon_mask_256_tr.reshape(recon_mask_256_tr.shape[0], -1, 3, 32, 32)
-                    recon_mask_256_bl_patches = recon_mask_256_bl.reshape(recon_mask_256_bl.shape[0], -1, 3, 32, 32)
-                    recon_mask_256_br_patches = recon_mask_256_br.reshape(recon_mask_256_br.shape[0], -1, 3, 32, 32) 
-                    
                     # Calculate loss
-                    loss = 0
-                    for j in range(real_mask_tr_patches.shape[1]):
-                        loss += F.mse_loss(recon_mask_256_tr_patches[:, j], real_mask_tr_patches[:, j])
-                        loss += F.mse_loss(recon_mask_256_bl_patches[:, j], real_mask_bl_patches[:, j])
-                        loss += F.mse_loss(recon_mask_256_br_patches[:, j], real_mask_br_patches[:, j])
+                    loss = criterion(recon_mask_256_all, real_mask_channels)
 
                     val_losses.append(loss.item())
 
@@ -872,13 +810,12 @@ def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_
             model.train()
 
             # Save validation images
-            Y_real = wt(data, filters, levels=3)
-            Y_64 = Y_real[:, :, :64, :64]
-            Y_128 = Y_real[:, :, :128, :128]
-            zeros = torch.zeros(real_mask_tr.shape)
+            Y_real = wt(data, filters, levels=levels)
+            Y_64 = Y_real[:, :, :2*patch, :2*patch]
+            Y_128 = Y_real[:, :, :4*patch, :4*patch]
 
-            # Real mask -- in 32x32 patches & regular
-            real_mask = collate_patches_to_img(zeros, real_mask_tr, real_mask_bl, real_mask_br)
+            # Real mask -- in patch x patch patches & regular
+            real_mask = collate_patches_to_img(None, real_mask_tr, real_mask_bl, real_mask_br)
             real_mask_iwt = zero_mask(Y_real, 3, 3)
 
             # Collate all masks concatenated by channel to an image (slice up and put into a square)
@@ -886,21 +823,20 @@ def train_unet256_real(epoch, state_dict, model, optimizer, train_loader, valid_
             recon_mask_256_bl_img = collate_16_channels_to_img(recon_mask_256_bl, args.device)   
             recon_mask_256_br_img = collate_16_channels_to_img(recon_mask_256_br, args.device)
 
-            recon_mask_256 = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256 = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_256_tr_img = apply_iwt_quads_128(recon_mask_256_tr_img, inv_filters)
-            recon_mask_256_bl_img = apply_iwt_quads_128(recon_mask_256_bl_img, inv_filters)
-            recon_mask_256_br_img = apply_iwt_quads_128(recon_mask_256_br_img, inv_filters)
+            recon_mask_256_tr_img = iwt_pyramid(recon_mask_256_tr_img, inv_filters, patch=patch)
+            recon_mask_256_bl_img = iwt_pyramid(recon_mask_256_bl_img, inv_filters, patch=patch)
+            recon_mask_256_br_img = iwt_pyramid(recon_mask_256_br_img, inv_filters, patch=patch)
             
-            recon_mask_256_iwt = collate_patches_to_img(zeros, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
+            recon_mask_256_iwt = collate_patches_to_img(None, recon_mask_256_tr_img, recon_mask_256_bl_img, recon_mask_256_br_img)
             
-            recon_mask_padded = zero_pad(recon_mask_256_iwt, 256, args.device)
-            recon_mask_padded[:, :, :128, :128] = Y_128
-            recon_img = iwt(recon_mask_padded, inv_filters, levels=3)
+            recon_mask_padded = recon_mask_256_iwt.to(args.device, copy=True)
+            recon_mask_padded[:, :, :4*patch, :4*patch] = Y_128
+            recon_img = iwt_lowpass(recon_mask_padded, inv_filters, args.image_size, levels)
             
             # Reconstructed image with only 128x128
-            Y_128_low = zero_pad(Y_128, 256, args.device)
-            Y_128_low = iwt(Y_128_low, inv_filters, levels=3)
+            Y_128_low = iwt_lowpass(Y_128, inv_filters, args.image_size, levels)
             
             # Save images
             save_image(real_mask.cpu(), args.output_dir + 'val_real_mask_itr{}.png'.format(state_dict['itr']))
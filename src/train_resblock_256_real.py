@@ -7,7 +7,7 @@ import torchvision.transforms as transforms
 import torchvision.datasets as dset
 import wandb
 
-from datasets import ImagenetDataAugDataset
+from datasets import ImagenetDataAugDataset, create_collate_fn
 from wt_utils import wt, create_filters, load_checkpoint
 from arguments import parse_args
 from dsvae_resblock import ResNetLayer_NTails
@@ -49,14 +49,16 @@ if __name__ == "__main__":
 
     train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=args.batch_size,
                                                shuffle=True, num_workers=args.workers,
-                                               pin_memory=True, drop_last=True)
+                                               pin_memory=True, drop_last=True,
+                                               collate_fn=create_collate_fn(args, 8*args.patch_size))
 
     # Create validation dataset
     valid_dataset = dset.ImageFolder(root=args.valid_dir, transform=default_transform)
 
     valid_loader = torch.utils.data.DataLoader(valid_dataset, batch_size=args.batch_size,
                                                shuffle=True, num_workers=args.workers,
-                                               pin_memory=True, drop_last=True)
+                                               pin_memory=True, drop_last=True,
+                                               collate_fn=create_collate_fn(args, 8*args.patch_size))
 
     # Model and optimizer
     model = ResNetLayer_NTails(in_channels=48, hidden_channels=512, out_channels=3, n_tails=48).to(args.device)
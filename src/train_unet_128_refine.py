@@ -6,7 +6,7 @@ import torchvision.transforms as transforms
 import torchvision.datasets as dset
 import wandb
 
-from datasets import ImagenetDataAugDataset
+from datasets import ImagenetDataAugDataset, create_collate_fn
 from wt_utils import wt, create_filters, load_checkpoint, load_weights
 from arguments import parse_args
 from unet.unet_model import UNet_NTail_128_Mod, UNet_NTail_128_Mod1
@@ -57,14 +57,16 @@ if __name__ == "__main__":
 
     train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=args.batch_size,
                                                shuffle=True, num_workers=args.workers,
-                                               pin_memory=True, drop_last=True)
+                                               pin_memory=True, drop_last=True,
+                                               collate_fn=create_collate_fn(args, 4*args.patch_size))
 
     # Create validation dataset
     valid_dataset = dset.ImageFolder(root=args.valid_dir, transform=default_transform)
 
     valid_loader = torch.utils.data.DataLoader(valid_dataset, batch_size=args.batch_size,
                                                shuffle=True, num_workers=args.workers,
-                                               pin_memory=True, drop_last=True)
+                                               pin_memory=True, drop_last=True,
+                                               collate_fn=create_collate_fn(args, 4*args.patch_size))
 
     # Model and optimizer
     print('Loading model 128 weights')
@@ -6,7 +6,7 @@ import torchvision.transforms as transforms
 import torchvision.datasets as dset
 import wandb
 
-from datasets import parse_dataset_args, create_dataset
+from datasets import parse_dataset_args, create_dataset, create_collate_fn
 from wt_utils import wt, create_filters, load_checkpoint, load_weights
 from arguments import parse_args
 from unet.unet_model import UNet_NTail_128_Mod
@@ -50,13 +50,15 @@ if __name__ == "__main__":
     train_dataset = create_dataset(ds_name, args.train_dir, transform=default_transform, classes=classes[0] if classes else None)
     train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=args.batch_size,
                                                shuffle=True, num_workers=args.workers,
-                                               pin_memory=True, drop_last=True)
+                                               pin_memory=True, drop_last=True,
+                                               collate_fn=create_collate_fn(args, 8*args.patch_size))
 
     # Create validation dataset
     valid_dataset = create_dataset(ds_name, args.valid_dir, transform=default_transform, classes=classes[1] if classes else None)
     valid_loader = torch.utils.data.DataLoader(valid_dataset, batch_size=args.batch_size,
                                                shuffle=True, num_workers=args.workers,
-                                               pin_memory=True, drop_last=True)
+                                               pin_memory=True, drop_last=True,
+                                               collate_fn=create_collate_fn(args, 8*args.patch_size))
 
     # Load 128 model
     print('Loading model 128 weights')
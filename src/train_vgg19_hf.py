@@ -40,7 +40,7 @@ parser.add_argument('--use-adasum', action='store_true', default=False,
 
 # Wavelet options
 parser.add_argument('--wt-filter-type', type=str, default='bior2.2',
-                    help='type of wavelet filter')
+                    help='type of wavelet filter (2-tap filters such as haar run on the conv-free haar backend)')
 parser.add_argument('--num-wt-levels', type=int, default=1,
                     help='number of wavelet transforms applied')
 parser.add_argument('--hf', action='store_true', default=False,
@@ -163,14 +163,13 @@ verbose = 1 if hvd.rank() == 0 else 0
 torch.set_num_threads(4)
  
 ########################## WT #########################
-filters = create_filters('cpu', args.wt_filter_type)
+filters = create_filters('cuda' if args.cuda else 'cpu', args.wt_filter_type)
 if args.cuda:
-    filters = filters.to(device='cuda')
-    print('Wavelet filter moved to GPU')
+    print('Wavelet filter created on GPU')
 
 if args.hf:
     print('Running VGG19 model with high frequencies IWTed as input')
-    wt_transform = lambda vimg: wt_hf(vimg, filters, levels=args.num_wt_levels)
+    wt_transform = lambda vimg: wt_hf(vimg, filters, levels=args.num_wt_levels, wt_fn=args.wt_filter_type)
 ######################################################
 
 # # Setting up for collecting intermediate "texture" features from pretrained model
@@ -0,0 +1,166 @@
+import torch
+
+from wt_engine import separable_taps, _quadrants
+from wt_packets import wt_packets, check_packet_spec, packet_crop_levels, analysis_matrix_1d, cached_matrix, _children
+
+# Flips, transposes and 90 degree rotations of packed coefficients (any packet spec: wt, 3quads, pyramid), equal to the
+# coefficients of the flipped/transposed/rotated images, from cached coefficients alone
+# Transposing is exact and free: transposing the image transposes every sub-band and swaps LH and HL, i.e. the whole packed
+# layout is transposed (for the specs splitting LH and HL alike, as all the repo layouts do)
+# Flipping is not a permutation of the coefficients: the even length taps of wt put the lo outputs on the even pixels, and
+# the flipped image has them on the odd ones, half a sample away from every existing coefficient. The flips therefore go
+# through the pixels, recovered exactly: the zero-padded analysis of each level is an invertible (size, size) matrix per
+# axis (condition number below 2 for bior2.2), whose inverse undoes wt to the float precision where iwt does not (the
+# synthesis filters are not a perfect inverse at the zero-padded borders). flip_coeffs(wt_packets(x)) is
+# wt_packets(torch.flip(x)) to the float precision
+# The layouts with LL-only splits on top (crops) have dropped the sub-bands the flipped LL band depends on: they can be
+# transposed, not flipped
+AUGMENT_DIMS = (-2, -1)
+
+################# EXACT INVERSE #################
+
+# Inverse analysis matrices along one axis: (filters, size) => (filters, matrix), least recently used out above
+# SYNTHESIS_CACHE_SIZE entries (as the cascades of wt_packets)
+_SYNTHESIS = {}
+SYNTHESIS_CACHE_SIZE = 32
+
+
+# Inverse of the single level analysis along one axis, the (size, size) matrix stacking the lo and hi rows, in fp64
+def exact_synthesis_matrix(filters, size):
+    lo, hi = separable_taps(filters).double()
+
+    return torch.linalg.inv(torch.cat((analysis_matrix_1d(lo, size), analysis_matrix_1d(hi, size))))
+
+
+def _synthesis_matrix(filters, size):
+    key = (filters.data_ptr(), filters._version, filters.device, filters.dtype, size)
+
+    return cached_matrix(_SYNTHESIS, key, lambda: (filters, exact_synthesis_matrix(filters, size).to(filters.dtype)),
+                         SYNTHESIS_CACHE_SIZE)
+
+
+# Pixels of (N, H, W) single level coefficients: the quadrant [r, c] of wt is band r along W and c along H, so the LH/HL
+# quadrants are swapped into the [band along H, band along W] order of the matrices, then S_H . Z . S_W^T
+def _invert_level(res, filters):
+    n = res.shape[0]
+    h = res.size(1)
+    w = res.size(2)
+    z = _quadrants(res, h, w).transpose(1, 2).permute(0, 1, 3, 2, 4).reshape(n, h, w)
+    s_h = _synthesis_matrix(filters, h).to(res.dtype)
+    s_w = _synthesis_matrix(filters, w).to(res.dtype)
+
+    return torch.matmul(torch.matmul(s_h, z), s_w.t())
+
+
+# Exact inverse of wt_packets for the layouts without LL-only splits, from the deepest splits up
+def invert_packets(vres, filters, spec):
+    check_packet_spec(spec)
+    if packet_crop_levels(spec):
+        raise ValueError('Layouts with LL-only splits drop sub-bands, they cannot be inverted exactly: {}'.format(spec))
+    bs = vres.shape[0]
+    h = vres.size(2)
+    w = vres.size(3)
+
+    return _invert_nodes(vres.reshape(-1, h, w), filters, spec).reshape(bs, -1, h, w)
+
+
+def _invert_nodes(vres, filters, spec):
+    if spec is None:
+        return vres
+    if len(spec) == 1:
+        raise ValueError('LL-only splits drop sub-bands, they cannot be inverted exactly: {}'.format(spec))
+
+    h = vres.size(1)
+    w = vres.size(2)
+    res = vres.clone()
+    for child, r, c, top, left in _children(spec, 0, 0, h, w):
+        if child is not None:
+            res[:, top:top+h//2, left:left+w//2] = _invert_nodes(vres[:, top:top+h//2, left:left+w//2], filters, child)
+
+    return _invert_level(res, filters)
+
+
+################# FLIPS #################
+
+# Flip of the packed coefficients of spec along dim (-1: horizontal, -2: vertical), the coefficients of torch.flip(img, dim)
+def flip_coeffs(vres, filters, spec, dim=-1, backend=None):
+    return flip_coeffs_dims(vres, filters, spec, (dim,), backend)
+
+
+# Flip along every dim of dims (one exact inverse and one wt_packets whatever the number of dims)
+def flip_coeffs_dims(vres, filters, spec, dims, backend=None):
+    for dim in dims:
+        if dim not in AUGMENT_DIMS:
+            raise ValueError('Coefficients can only be flipped along dim -1 or -2, got {}'.format(dim))
+    if not dims:
+        return vres
+
+    return wt_packets(invert_packets(vres, filters, spec).flip(tuple(dims)), filters, spec, backend)
+
+
+################# TRANSPOSES/ROTATIONS #################
+
+# Spec of the transposed layout: LH and HL swapped at every split
+def transpose_spec(spec):
+    if spec is None:
+        return None
+    if len(spec) == 1:
+        return (transpose_spec(spec[0]),)
+
+    return (transpose_spec(spec[0]), transpose_spec(spec[2]), transpose_spec(spec[1]), transpose_spec(spec[3]))
+
+
+# Coefficients of the transposed images (exact), a view of vres
+def transpose_coeffs(vres, spec=None):
+    if spec is not None and transpose_spec(spec) != spec:
+        raise ValueError('The transposed layout of spec {} is a different spec'.format(spec))
+
+    return vres.transpose(-2, -1)
+
+
+# Coefficients of the images rotated by k * 90 degrees as torch.rot90(img, k, (-2, -1)), flips as in flip_coeffs
+def rot90_coeffs(vres, filters, spec, k=1, backend=None):
+    k = k % 4
+    if k == 0:
+        return vres
+    if k == 2:
+        return flip_coeffs_dims(vres, filters, spec, AUGMENT_DIMS, backend)
+
+    return flip_coeffs(transpose_coeffs(vres, spec), filters, spec, -2 if k == 1 else -1, backend)
+
+
+################# RANDOM AUGMENTATION #################
+
+# Random flips and rotations of a batch of packed coefficients, drawn independently for each image
+# The 8 flips/rotations of the square are a random transpose followed by random vertical and horizontal flips
+# Cropped layouts (LL-only splits on top) can only be transposed: use p_flip=0
+class CoeffAugment(object):
+    def __init__(self, filters, spec, p_flip=0.5, rotate=True, backend=None):
+        self.filters = filters
+        self.spec = spec
+        self.p_flip = p_flip
+        self.rotate = rotate
+        self.backend = backend
+        if rotate and transpose_spec(spec) != spec:
+            raise ValueError('Rotations need a layout splitting LH and HL alike, got {}'.format(spec))
+        if p_flip and packet_crop_levels(spec):
+            raise ValueError('Layouts with LL-only splits cannot be flipped, use p_flip=0 to only transpose: {}'.format(spec))
+
+    def __call__(self, vres, generator=None):
+        bs = vres.shape[0]
+        out = vres.clone()
+
+        if self.rotate:
+            mask = torch.rand(bs, generator=generator) < 0.5
+            out[mask] = transpose_coeffs(out[mask])
+
+        # Every flipped image is inverted and transformed once, whichever of the dims it is flipped along
+        dims = AUGMENT_DIMS if self.rotate else (-1,)
+        flips = torch.stack([torch.rand(bs, generator=generator) < self.p_flip for _ in dims], dim=1)
+        for pattern in flips.unique(dim=0):
+            if pattern.any():
+                mask = (flips == pattern).all(dim=1)
+                flip_dims = [dim for dim, flip in zip(dims, pattern.tolist()) if flip]
+                out[mask] = flip_coeffs_dims(out[mask], self.filters, self.spec, flip_dims, self.backend)
+
+        return out
@@ -0,0 +1,161 @@
+import os
+import torch
+
+# Compact codec for packed WT coefficients (B, C, H, W) as stored by the eval scripts (TL patches, HF masks)
+#   quantization   per (image, channel, sub-band) to signed int8/int16: x ~ offset + q * scale
+#                  the LL band is centered on its mid-range, the HF bands keep offset 0 so that small coefficients map to 0
+#   sparse coding  bitmask of the non-zero q (1 bit per coefficient) and their values, most HF coefficients are 0
+# levels=0 treats the input as a single band (e.g. pixels of the TL 64 x 64)
+CODEC_BITS = (8, 16)
+
+################# SUB-BANDS #################
+
+def num_subbands(levels):
+    return 1 + 3 * levels
+
+
+# (top, left, h, w) of every sub-band of the packed layout: LL, then (LH, HL, HH) per level from the coarsest
+def subband_rects(h, w, levels):
+    rects = [(0, 0, h >> levels, w >> levels)]
+    for level in range(levels - 1, -1, -1):
+        lh = (h >> level) // 2
+        lw = (w >> level) // 2
+        rects += [(0, lw, lh, lw), (lh, 0, lh, lw), (lh, lw, lh, lw)]
+
+    return rects
+
+
+################# QUANTIZATION #################
+
+def _int_dtype(bits):
+    if bits not in CODEC_BITS:
+        raise ValueError('Codec supports {} bits, got {}'.format(CODEC_BITS, bits))
+
+    return torch.int8 if bits == 8 else torch.int16
+
+
+# Per sub-band quantization, each sub-band in one pass over the whole batch; HF coefficients below threshold are zeroed
+# Returns q (B, C, H, W) int8/int16 and scale, offset (B, C, sub-bands)
+def quantize_coeffs(Y, levels, bits=8, threshold=0.):
+    qmax = 2 ** (bits - 1) - 1
+    q = torch.empty(Y.shape, dtype=_int_dtype(bits), device=Y.device)
+    scales = []
+    offsets = []
+
+    for band, (top, left, h, w) in enumerate(subband_rects(Y.size(2), Y.size(3), levels)):
+        x = Y[:, :, top:top+h, left:left+w].float()
+        lo = x.amin((2, 3), keepdim=True)
+        hi = x.amax((2, 3), keepdim=True)
+
+        # LL range -> mid-range offset, HF bands -> offset 0
+        offset = (lo + hi) / 2 if band == 0 else torch.zeros_like(lo)
+        scale = torch.maximum(hi - offset, offset - lo) / qmax
+        scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+        if band > 0 and threshold > 0:
+            x = torch.where(x.abs() < threshold, torch.zeros_like(x), x)
+
+        q[:, :, top:top+h, left:left+w] = torch.round((x - offset) / scale).clamp_(-qmax, qmax)
+        scales.append(scale)
+        offsets.append(offset)
+
+    return q, torch.cat(scales, 2).flatten(2), torch.cat(offsets, 2).flatten(2)
+
+
+def dequantize_coeffs(q, scale, offset, levels):
+    Y = torch.empty(q.shape, dtype=scale.dtype, device=q.device)
+
+    for band, (top, left, h, w) in enumerate(subband_rects(q.size(2), q.size(3), levels)):
+        Y[:, :, top:top+h, left:left+w] = q[:, :, top:top+h, left:left+w] * scale[:, :, band, None, None] + offset[:, :, band, None, None]
+
+    return Y
+
+
+################# SPARSE CODING #################
+
+_BIT_WEIGHTS = {}
+
+
+def _bit_weights(device):
+    device = torch.device(device)
+    if device not in _BIT_WEIGHTS:
+        _BIT_WEIGHTS[device] = 2 ** torch.arange(8, dtype=torch.uint8, device=device)
+
+    return _BIT_WEIGHTS[device]
+
+
+# (N, L) bool => (N, ceil(L / 8)) uint8, bit i of byte j is element 8j + i
+def pack_bits(mask):
+    n, length = mask.shape
+    pad = -length % 8
+    if pad:
+        mask = torch.cat([mask, mask.new_zeros(n, pad)], 1)
+
+    return (mask.view(n, -1, 8).to(torch.uint8) * _bit_weights(mask.device)).sum(-1, dtype=torch.uint8)
+
+
+def unpack_bits(packed, length):
+    bits = packed.unsqueeze(-1).bitwise_and(_bit_weights(packed.device)).ne(0)
+
+    return bits.flatten(1)[:, :length]
+
+
+# Encodes (B, C, H, W) coefficients of a levels WT: a dict of tensors (torch.save-able), per image non-zero counts in 'counts'
+def encode_coeffs(Y, levels, bits=8, threshold=0.):
+    bs, c, h, w = Y.shape
+    q, scale, offset = quantize_coeffs(Y, levels, bits, threshold)
+    q = q.view(bs, c * h * w)
+    mask = q.ne(0)
+
+    return {'shape': (bs, c, h, w), 'levels': levels, 'bits': bits,
+            'scale': scale, 'offset': offset,
+            'mask': pack_bits(mask), 'counts': mask.sum(1), 'values': torch.masked_select(q, mask)}
+
+
+def decode_coeffs(code):
+    bs, c, h, w = code['shape']
+    mask = unpack_bits(code['mask'], c * h * w)
+    q = code['values'].new_zeros(bs, c * h * w).masked_scatter_(mask, code['values'])
+
+    return dequantize_coeffs(q.view(bs, c, h, w), code['scale'], code['offset'], code['levels'])
+
+
+# Encoded size in bytes (tensors only)
+def code_nbytes(code):
+    return sum(v.numel() * v.element_size() for v in code.values() if torch.is_tensor(v))
+
+
+# Size of the float32 coefficients over the encoded size
+def compression_ratio(code):
+    bs, c, h, w = code['shape']
+
+    return 4. * bs * c * h * w / code_nbytes(code)
+
+
+################# STORAGE #################
+
+# Drop-in for the h5py files of the eval scripts: dataset[start:end] = batch encodes the batch into directory/start.pt
+class CoeffFile(object):
+    def __init__(self, directory, levels, bits=8, threshold=0.):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.levels = levels
+        self.bits = bits
+        self.threshold = threshold
+
+    def create_dataset(self, name, shape=None, dtype=None, fillvalue=None):
+        return self
+
+    def __setitem__(self, index, data):
+        code = encode_coeffs(torch.as_tensor(data), self.levels, self.bits, self.threshold)
+        code = {k: v.cpu() if torch.is_tensor(v) else v for k, v in code.items()}
+        torch.save(code, os.path.join(self.directory, '{:06d}.pt'.format(index.start)))
+
+    def close(self):
+        pass
+
+
+# Decoded batches of a CoeffFile directory, in order
+def iter_coeffs(directory, device='cpu'):
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.pt'):
+            yield decode_coeffs(torch.load(os.path.join(directory, name), map_location=device))
@@ -0,0 +1,546 @@
+import torch
+
+# Backend used by wt/iwt when no backend is passed explicitly (see set_wt_backend)
+_WT_BACKEND = 'dense'
+
+################# DENSE BACKEND #################
+
+# Single level WT: (N, 1, H, W) => (N, 4, H/2, W/2) with the 4 sub-bands as channels (LL, LH, HL, HH)
+def wt_level_dense(vimg, filters):
+    padded = torch.nn.functional.pad(vimg,(2,2,2,2))
+    res = torch.nn.functional.conv2d(padded, filters[:,None],stride=2)
+
+    return res
+
+
+# Single level IWT: (N, 4, H/2, W/2) => (N, 1, H, W)
+def iwt_level_dense(res, inv_filters):
+    res = torch.nn.functional.conv_transpose2d(res, inv_filters[:,None],stride=2)
+    res = res[:,:,2:-2,2:-2] #removing padding
+
+    return res
+
+
+################# SEPARABLE BACKEND #################
+
+# Recovers the 1D low/high taps from a stack of 4 outer-product filters (as built by create_filters/create_inv_filters)
+# filters[0] = lo x lo, filters[2] = lo (rows) x hi (cols); the sign ambiguity cancels out in every product
+def separable_taps(filters):
+    diag = torch.diagonal(filters[0])
+    peak = torch.argmax(diag.abs())
+    scale = torch.sqrt(diag[peak].abs())
+    lo = filters[0][peak] / scale
+    hi = filters[2][peak] / scale
+
+    return torch.stack((lo, hi), dim=0)
+
+
+# Same result as wt_level_dense, as a row pass (along W) followed by a column pass (along H)
+def wt_level_separable(vimg, filters):
+    n = vimg.shape[0]
+    h = vimg.size(2)
+    w = vimg.size(3)
+    taps = separable_taps(filters)
+
+    padded = torch.nn.functional.pad(vimg, (2,2,2,2))
+    res = torch.nn.functional.conv2d(padded, taps[:, None, None, :], stride=(1, 2))
+    res = res.reshape(-1, 1, h+4, w//2)
+    res = torch.nn.functional.conv2d(res, taps[:, None, :, None], stride=(2, 1))
+
+    # Channels come out ordered as (W filter, H filter), which matches the dense filter order
+    return res.reshape(n, 4, h//2, w//2)
+
+
+# Same result as iwt_level_dense, as a column pass (along H) followed by a row pass (along W)
+def iwt_level_separable(res, inv_filters):
+    n = res.shape[0]
+    h = res.size(2)
+    w = res.size(3)
+    taps = separable_taps(inv_filters)
+
+    res = res.reshape(-1, 2, h, w)
+    res = torch.nn.functional.conv_transpose2d(res, taps[:, None, :, None], stride=(2, 1))
+    res = res[:, :, 2:-2, :].reshape(n, 2, 2*h, w)
+    res = torch.nn.functional.conv_transpose2d(res, taps[:, None, None, :], stride=(1, 2))
+    res = res[:, :, :, 2:-2] #removing padding
+
+    return res
+
+
+################# LIFTING BACKEND #################
+
+# Row/column phase and output scale of each sub-band (LL, LH, HL, HH) after the lifting steps
+# bior2.2 gives lo = sqrt(2) * s and hi = -d / sqrt(2) for the lifting outputs s (even) and d (odd)
+LIFTING_BANDS = ((0, 0, 2.), (1, 0, -1.), (0, 1, -1.), (1, 1, .5))
+
+
+def _polyphase(x, dim):
+    if dim == -1:
+        return x[..., 0::2], x[..., 1::2]
+
+    return x[..., 0::2, :], x[..., 1::2, :]
+
+
+# In-place bior2.2 (CDF 5/3) analysis along dim, samples outside the signal are zero (as with the conv padding)
+def lift_forward_(x, dim):
+    even, odd = _polyphase(x, dim)
+    n = even.size(dim)
+
+    # Predict: d[i] = x[2i+1] - (x[2i] + x[2i+2]) / 2
+    odd.add_(even, alpha=-0.5)
+    odd.narrow(dim, 0, n-1).add_(even.narrow(dim, 1, n-1), alpha=-0.5)
+
+    # Update: s[i] = x[2i] + (d[i-1] + d[i]) / 4, with d[-1] = -x[0] / 2 from the zero padding
+    even.narrow(dim, 0, 1).mul_(0.875)
+    even.add_(odd, alpha=0.25)
+    even.narrow(dim, 1, n-1).add_(odd.narrow(dim, 0, n-1), alpha=0.25)
+
+    return x
+
+
+# In-place inverse of lift_forward_, matching the cropped conv_transpose2d of iwt_level_dense
+def lift_inverse_(x, dim):
+    even, odd = _polyphase(x, dim)
+    n = even.size(dim)
+
+    # Undo update, coefficients outside the signal are zero (d[-1] = 0)
+    even.add_(odd, alpha=-0.25)
+    even.narrow(dim, 1, n-1).add_(odd.narrow(dim, 0, n-1), alpha=-0.25)
+
+    # Undo predict, with x[N] = -d[N/2-1] / 4 coming from s[N/2] = d[N/2] = 0
+    odd.narrow(dim, n-1, 1).mul_(0.875)
+    odd.add_(even, alpha=0.5)
+    odd.narrow(dim, 0, n-1).add_(even.narrow(dim, 1, n-1), alpha=0.5)
+
+    return x
+
+
+# Multi-level bior2.2 WT with lifting steps, only valid for bior2.2 filters (the filters values are not used)
+# Works in place on two preallocated work buffers and writes each sub-band once into the packed output
+def wt_lifting(vimg, filters, levels=1, out=None):
+    if filters.shape[-1] != 6:
+        raise ValueError('Lifting backend only implements bior2.2')
+    bs = vimg.shape[0]
+    h = vimg.size(2)
+    w = vimg.size(3)
+    vimg = vimg.reshape(-1, h, w)
+
+    if out is None:
+        out = torch.empty_like(vimg)
+    out = out.view(-1, h, w)
+    work = (vimg.clone(), vimg.new_empty(vimg.shape[0], h//2, w//2))
+
+    for level in range(levels):
+        x = work[level % 2][:, :h, :w]
+        lift_forward_(x, -1)
+        lift_forward_(x, -2)
+
+        for band, (r, c, scale) in enumerate(LIFTING_BANDS):
+            if band == 0 and level < levels - 1:
+                dst = work[(level+1) % 2][:, :h//2, :w//2]
+            else:
+                dst = out[:, (band//2)*h//2:(band//2+1)*h//2, (band%2)*w//2:(band%2+1)*w//2]
+            torch.mul(x[:, r::2, c::2], scale, out=dst)
+
+        h = h // 2
+        w = w // 2
+
+    return out.reshape(bs, -1, out.shape[1], out.shape[2])
+
+
+# Multi-level bior2.2 IWT with lifting steps, the finest level is reconstructed in place in the output
+def iwt_lifting(vres, inv_filters, levels=1, out=None):
+    if inv_filters.shape[-1] != 6:
+        raise ValueError('Lifting backend only implements bior2.2')
+    bs = vres.shape[0]
+    h = vres.size(2)
+    w = vres.size(3)
+    vres = vres.reshape(-1, h, w)
+
+    if out is None:
+        out = torch.empty_like(vres)
+    out = out.view(-1, h, w)
+    work = (out, vres.new_empty(vres.shape[0], h//2, w//2), vres.new_empty(vres.shape[0], h//4, w//4) if levels > 2 else None)
+    ll = None
+
+    for level in reversed(range(levels)):
+        lh = h >> level
+        lw = w >> level
+        x = work[0 if level == 0 else 2 - level % 2][:, :lh, :lw]
+
+        for band, (r, c, scale) in enumerate(LIFTING_BANDS):
+            if band == 0 and ll is not None:
+                src = ll
+            else:
+                src = vres[:, (band//2)*lh//2:(band//2+1)*lh//2, (band%2)*lw//2:(band%2+1)*lw//2]
+            torch.mul(src, 1. / scale, out=x[:, r::2, c::2])
+
+        lift_inverse_(x, -2)
+        lift_inverse_(x, -1)
+        ll = x
+
+    return out.reshape(bs, -1, h, w)
+
+
+################# GROUPED BACKEND #################
+
+# (4C, 1, k, k) weight applying the 4 filters to each of C channels in a conv with groups=C
+def _grouped_weight(filters, c):
+    return filters[:, None].repeat(c, 1, 1, 1)
+
+
+# Multi-level WT over the native (B, C, H, W) layout, one grouped conv per level (padding=2 as the dense pad)
+# The convs run in channels_last, where the grouped kernels vectorize over channels (2-3x faster than the single channel
+# convs of the dense backend on oneDNN), the output keeps the memory format of the input
+def wt_grouped(vimg, filters, levels=1, out=None):
+    bs, c, h, w = vimg.shape
+    weight = _grouped_weight(filters, c)
+    ll = vimg.contiguous(memory_format=torch.channels_last)
+
+    for level in range(levels):
+        lh = h >> level
+        lw = w >> level
+        res = torch.nn.functional.conv2d(ll, weight, stride=2, padding=2, groups=c)
+
+        # Allocated after the first level so that it never coexists with the conv input
+        if out is None:
+            out = torch.empty_like(vimg)
+        out = out.view(bs, c, h, w)
+        bands = res.unflatten(1, (c, 2, 2))
+        quads = out[:, :, :lh, :lw].unflatten(3, (2, lw//2)).unflatten(2, (2, lh//2)).permute(0, 1, 2, 4, 3, 5)
+
+        if level == levels - 1:
+            quads.copy_(bands)
+        else:
+            quads[:, :, 0, 1].copy_(bands[:, :, 0, 1])
+            quads[:, :, 1].copy_(bands[:, :, 1])
+            ll = bands[:, :, 0, 0]
+
+    return out
+
+
+# Multi-level IWT over the native layout, one grouped conv_transpose per level (padding=2 crops as iwt_level_dense)
+# The sub-bands are gathered in channels_last, the output keeps the memory format of the input
+def iwt_grouped(vres, inv_filters, levels=1, out=None):
+    bs, c, h, w = vres.shape
+    weight = _grouped_weight(inv_filters, c)
+    ll = None
+
+    for level in reversed(range(levels)):
+        lh = h >> level
+        lw = w >> level
+        quads = vres[:, :, :lh, :lw].unflatten(3, (2, lw//2)).unflatten(2, (2, lh//2)).permute(0, 1, 2, 4, 3, 5)
+        res = torch.empty(bs, 4*c, lh//2, lw//2, dtype=vres.dtype, device=vres.device, memory_format=torch.channels_last)
+        bands = res.unflatten(1, (c, 2, 2))
+
+        if ll is None:
+            bands.copy_(quads)
+        else:
+            bands[:, :, 0, 0].copy_(ll)
+            bands[:, :, 0, 1].copy_(quads[:, :, 0, 1])
+            bands[:, :, 1].copy_(quads[:, :, 1])
+            del ll
+        ll = torch.nn.functional.conv_transpose2d(res, weight, stride=2, padding=2, groups=c)
+
+    if out is None:
+        out = torch.empty_like(vres)
+
+    return out.view(ll.shape).copy_(ll)
+
+
+################# HAAR BACKEND #################
+
+# Sum/difference weights of 2-tap filters: (lo ratio, hi ratio) between the second and first taps, and the first taps
+# Every 2-tap wavelet (haar, db1, bior1.1) has equal lo taps, so only the sign of the hi ratio matters
+def _haar_taps(filters):
+    (lo0, lo1), (hi0, hi1) = separable_taps(filters).tolist()
+
+    return (lo1 / lo0, hi1 / hi0), (lo0, hi0)
+
+
+# Scale of each sub-band (LL, LH, HL, HH) as a (1, 4, 1, 1) tensor, the product of the first taps along W and H
+def _haar_scale(first, like):
+    lo0, hi0 = first
+    scale = torch.tensor([lo0*lo0, lo0*hi0, hi0*lo0, hi0*hi0], dtype=like.dtype, device=like.device)
+
+    return scale.view(1, 4, 1, 1)
+
+
+# Single level Haar WT without convolution: sums and differences of the 2 x 2 pixel blocks, scaled once at the end
+# Same result as wt_level_dense with 2-tap filters and no padding (as wt_haar in old/vae_models.py)
+def wt_level_haar(vimg, filters):
+    n = vimg.shape[0]
+    h = vimg.size(2)
+    w = vimg.size(3)
+    ratio, first = _haar_taps(filters)
+
+    x = vimg.reshape(n, h//2, 2, w//2, 2)
+    res = vimg.new_empty(n, 4, h//2, w//2)
+    bands = res.view(n, 2, 2, h//2, w//2)
+
+    # Along W, both row phases at once, then along H straight into the sub-bands, ordered as (W filter, H filter)
+    for wb, alpha in enumerate(ratio):
+        rows = torch.add(x[..., 0], x[..., 1], alpha=alpha)
+        torch.add(rows[:, :, 0], rows[:, :, 1], alpha=ratio[0], out=bands[:, wb, 0])
+        torch.add(rows[:, :, 0], rows[:, :, 1], alpha=ratio[1], out=bands[:, wb, 1])
+
+    return res.mul_(_haar_scale(first, res))
+
+
+# Single level Haar IWT without convolution, the exact inverse of wt_level_haar (no padding, nothing cropped)
+def iwt_level_haar(res, inv_filters):
+    n = res.shape[0]
+    h = res.size(2)
+    w = res.size(3)
+    ratio, first = _haar_taps(inv_filters)
+
+    bands = (res * _haar_scale(first, res)).view(n, 2, 2, h, w)
+
+    # Along H into the two row phases of each W sub-band, then along W into the two column phases of the output
+    cols = res.new_empty(n, 2, h, 2, w)
+    torch.add(bands[:, :, 0], bands[:, :, 1], out=cols[:, :, :, 0])
+    torch.add(bands[:, :, 0], bands[:, :, 1], alpha=ratio[1], out=cols[:, :, :, 1])
+    del bands
+
+    out = res.new_empty(n, 1, 2*h, 2*w)
+    pixels = out.view(n, 2*h, w, 2)
+    cols = cols.view(n, 2, 2*h, w)
+    torch.add(cols[:, 0], cols[:, 1], out=pixels[..., 0])
+    torch.add(cols[:, 0], cols[:, 1], alpha=ratio[1], out=pixels[..., 1])
+
+    return out
+
+
+################# BACKEND SELECTION #################
+
+# Backends defined by a single level op, run through the multi-level wt/iwt below
+WT_BACKENDS = {
+    'dense': (wt_level_dense, iwt_level_dense),
+    'separable': (wt_level_separable, iwt_level_separable),
+    'haar': (wt_level_haar, iwt_level_haar),
+}
+
+# Backends with their own multi-level implementation
+WT_TRANSFORMS = {
+    'lifting': (wt_lifting, iwt_lifting),
+    'grouped': (wt_grouped, iwt_grouped),
+}
+
+
+def available_wt_backends():
+    return list(WT_BACKENDS) + list(WT_TRANSFORMS)
+
+
+def check_wt_backend(backend):
+    if backend not in WT_BACKENDS and backend not in WT_TRANSFORMS:
+        raise ValueError('Unknown WT backend {} (available: {})'.format(backend, ', '.join(available_wt_backends())))
+
+
+# Sets the backend used by wt/iwt (and everything built on them) when no backend is passed
+def set_wt_backend(backend):
+    global _WT_BACKEND
+    check_wt_backend(backend)
+    _WT_BACKEND = backend
+
+
+def get_wt_backend():
+    return _WT_BACKEND
+
+
+# 2-tap filters (haar, db1, bior1.1) always run on the haar backend, the padded backends are written for 6-tap filters
+def resolve_wt_backend(backend, filters):
+    backend = backend or _WT_BACKEND
+    if filters.shape[-1] == 2:
+        return 'haar'
+    if backend == 'haar':
+        raise ValueError('Haar backend needs 2-tap filters, got {}-tap filters'.format(filters.shape[-1]))
+
+    return backend
+
+
+def get_backend_levels(backend=None):
+    backend = backend or _WT_BACKEND
+    check_wt_backend(backend)
+
+    return WT_BACKENDS[backend]
+
+
+################# PRECISION #################
+
+# Backends that transform fp16/bf16 inputs natively: one conv per level, accumulated in fp32 by cuDNN/oneDNN
+# The other backends round after every lifting step, separable pass or butterfly add, so fp16/bf16 inputs are transformed
+# in fp32 and only the packed result is rounded back (see the precision benchmark in bench_wt.py for the measured errors)
+WT_HALF_NATIVE = ('dense', 'grouped')
+
+
+def _upcast(x, backend):
+    return x.dtype in (torch.float16, torch.bfloat16) and backend not in WT_HALF_NATIVE
+
+
+# Result of an fp32 transform in the input dtype, written into out if given
+def _round_into(res, dtype, out):
+    if out is None:
+        return res.to(dtype)
+
+    return out.view(res.shape).copy_(res)
+
+
+################# MULTI-LEVEL TRANSFORMS #################
+
+# (N, H, W) => (N, 2, 2, H/2, W/2) view of the 4 quadrants of the top-left h x w corner, indexed as [row, col]
+# The quadrant [r, c] holds the sub-band r*2 + c of the level (LL, LH, HL, HH)
+def _quadrants(x, h, w):
+    x = x[:, :h, :w]
+    x = x.unflatten(2, (2, w//2)).unflatten(1, (2, h//2))
+
+    return x.permute(0, 1, 3, 2, 4)
+
+
+# Multi-level WT writing each level's sub-bands straight into their quadrant of a single packed output
+def _wt(vimg, filters, levels, backend, out=None):
+    if _upcast(vimg, backend):
+        return _round_into(_wt(vimg.float(), filters, levels, backend), vimg.dtype, out)
+    filters = filters.to(vimg.dtype)
+
+    if backend in WT_TRANSFORMS:
+        return WT_TRANSFORMS[backend][0](vimg, filters, levels, out=out)
+
+    wt_level, _ = get_backend_levels(backend)
+    bs = vimg.shape[0]
+    h = vimg.size(2)
+    w = vimg.size(3)
+    ll = vimg.reshape(-1, 1, h, w)
+    n = ll.shape[0]
+
+    for level in range(levels):
+        lh = h >> level
+        lw = w >> level
+        res = wt_level(ll, filters).view(n, 2, 2, lh//2, lw//2)
+
+        # Allocated after the first level so that it never coexists with the padded input
+        if out is None:
+            out = vimg.new_empty(n, h, w)
+        out = out.view(-1, h, w)
+        quads = _quadrants(out, lh, lw)
+
+        if level == levels - 1:
+            quads.copy_(res)
+        else:
+            # The LL band stays in res and is transformed by the next level
+            quads[:, 0, 1].copy_(res[:, 0, 1])
+            quads[:, 1].copy_(res[:, 1])
+            ll = res[:, 0, :1]
+
+    return out.reshape(bs, -1, h, w)
+
+
+# Multi-level IWT, from the coarsest level up, reading the sub-bands directly from their packed quadrants
+def _iwt(vres, inv_filters, levels, backend, out=None):
+    if _upcast(vres, backend):
+        return _round_into(_iwt(vres.float(), inv_filters, levels, backend), vres.dtype, out)
+    inv_filters = inv_filters.to(vres.dtype)
+
+    if backend in WT_TRANSFORMS:
+        return WT_TRANSFORMS[backend][1](vres, inv_filters, levels, out=out)
+
+    _, iwt_level = get_backend_levels(backend)
+    bs = vres.shape[0]
+    h = vres.size(2)
+    w = vres.size(3)
+    vres = vres.reshape(-1, h, w)
+    n = vres.shape[0]
+
+    for level in reversed(range(levels)):
+        lh = h >> level
+        lw = w >> level
+        quads = _quadrants(vres, lh, lw)
+        res = vres.new_empty(n, 4, lh//2, lw//2)
+        bands = res.view(n, 2, 2, lh//2, lw//2)
+
+        if level == levels - 1:
+            bands.copy_(quads)
+        else:
+            bands[:, 0, 0].copy_(ll[:, 0])
+            bands[:, 0, 1].copy_(quads[:, 0, 1])
+            bands[:, 1].copy_(quads[:, 1])
+            # The coarser reconstruction now lives in res, free it before the next level runs
+            del ll
+        ll = iwt_level(res, inv_filters)
+
+    if out is None:
+        return ll.reshape(bs, -1, h, w)
+
+    out.view(-1, 1, h, w).copy_(ll)
+
+    return out.reshape(bs, -1, h, w)
+
+
+################# AUTOGRAD #################
+
+# wt/iwt are linear in the image, so their backward is the adjoint transform: the adjoint of a padded strided conv is the
+# cropped conv_transpose with the same filters, i.e. iwt run with the analysis filters (and wt with the synthesis filters)
+# Nothing but the filters is saved for backward, instead of every padded input and intermediate of the forward
+# The lifting backend only implements bior2.2 analysis/synthesis, its adjoint runs on the dense backend
+def _adjoint_backend(backend):
+    return 'dense' if backend == 'lifting' else backend
+
+
+class WTFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, vimg, filters, levels, backend):
+        ctx.save_for_backward(filters)
+        ctx.levels = levels
+        ctx.backend = backend
+        return _wt(vimg, filters, levels, backend)
+
+    @staticmethod
+    def backward(ctx, grad):
+        filters, = ctx.saved_tensors
+        return iwt(grad, filters, ctx.levels, _adjoint_backend(ctx.backend)), None, None, None
+
+
+class IWTFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, vres, inv_filters, levels, backend):
+        ctx.save_for_backward(inv_filters)
+        ctx.levels = levels
+        ctx.backend = backend
+        return _iwt(vres, inv_filters, levels, backend)
+
+    @staticmethod
+    def backward(ctx, grad):
+        inv_filters, = ctx.saved_tensors
+        return wt(grad, inv_filters, ctx.levels, _adjoint_backend(ctx.backend)), None, None, None
+
+
+# The autograd functions only apply when the image needs a gradient, learnable filters go through plain autograd
+def _use_function(x, filters):
+    return torch.is_grad_enabled() and x.requires_grad and not filters.requires_grad
+
+
+# Copies an autograd function result into a preallocated output (out= is not differentiable)
+def _into(res, out):
+    if out is None:
+        return res
+
+    return out.view(res.shape).copy_(res)
+
+
+################# WT FUNCTIONS #################
+
+# Multi-level WT of (B, C, H, W) images into the packed (B, C, H, W) layout, differentiable with respect to the image
+def wt(vimg, filters, levels=1, backend=None, out=None):
+    backend = resolve_wt_backend(backend, filters)
+    if _use_function(vimg, filters):
+        return _into(WTFunction.apply(vimg, filters, levels, backend), out)
+
+    return _wt(vimg, filters, levels, backend, out)
+
+
+# Multi-level IWT of the packed layout back to (B, C, H, W) images, differentiable with respect to the coefficients
+def iwt(vres, inv_filters, levels=1, backend=None, out=None):
+    backend = resolve_wt_backend(backend, inv_filters)
+    if _use_function(vres, inv_filters):
+        return _into(IWTFunction.apply(vres, inv_filters, levels, backend), out)
+
+    return _iwt(vres, inv_filters, levels, backend, out)
@@ -0,0 +1,187 @@
+import torch
+from torch import nn
+from typing import List
+
+from filter_bank import get_filters, get_inv_filters
+
+# Layouts of the WT modules:
+#   plain         multi-level WT, as wt/iwt
+#   128_3quads    top-left 128 x 128 of the WT with its 3 outer quadrants split once more, as wt_128_3quads/apply_iwt_quads_128
+#   256_3quads    the 256 x 256 layout of wt_256_3quads
+# The modules only use TorchScript-compatible ops (no Variable, numpy, autograd functions or packet specs), so they can be
+# scripted with torch.jit.script and captured by torch.compile without graph breaks, together with the decoders around them
+WT_LAYOUTS = ('plain', '128_3quads', '256_3quads')
+
+################# LEVEL OPS #################
+
+# Single level WT of (N, 1, H, W), the filters are padded by (taps - 2) / 2: 2 for bior2.2, 0 for haar
+def _wt_level(x: torch.Tensor, filters: torch.Tensor, pad: int) -> torch.Tensor:
+    if pad > 0:
+        x = torch.nn.functional.pad(x, (pad, pad, pad, pad))
+
+    return torch.nn.functional.conv2d(x, filters[:, None], stride=2)
+
+
+def _iwt_level(res: torch.Tensor, inv_filters: torch.Tensor, pad: int) -> torch.Tensor:
+    res = torch.nn.functional.conv_transpose2d(res, inv_filters[:, None], stride=2)
+    if pad > 0:
+        res = res[:, :, pad:-pad, pad:-pad] #removing padding
+
+    return res
+
+
+# (B, C, h, w) quadrants => (B, C, 2h, 2w), quadrant [r, c] holds the sub-band r*2 + c
+def _assemble(tl: torch.Tensor, tr: torch.Tensor, bl: torch.Tensor, br: torch.Tensor) -> torch.Tensor:
+    return torch.cat([torch.cat([tl, tr], 3), torch.cat([bl, br], 3)], 2)
+
+
+# LL-only levels of the 3quads layouts larger than the layout: log2(size / base)
+def _crop_levels(size: int, base: int) -> int:
+    crop = 0
+    while (base << crop) < size:
+        crop += 1
+
+    return crop
+
+
+################# TRANSFORMS #################
+
+# Packed multi-level WT, the first crop levels only compute the LL band (the output is 2**crop times smaller)
+def _wt_packed(x: torch.Tensor, filters: torch.Tensor, levels: int, pad: int, crop: int = 0) -> torch.Tensor:
+    bs = x.size(0)
+    h = x.size(2)
+    w = x.size(3)
+    ll = x.reshape(-1, 1, h, w)
+
+    for _ in range(crop):
+        ll = _wt_level(ll, filters[:1], pad)
+
+    bands: List[torch.Tensor] = []
+    for _ in range(levels):
+        res = _wt_level(ll, filters, pad)
+        ll = res[:, :1]
+        bands.append(res[:, 1:])
+
+    out = ll
+    for level in range(levels - 1, -1, -1):
+        hf = bands[level]
+        out = _assemble(out, hf[:, :1], hf[:, 1:2], hf[:, 2:])
+
+    return out.reshape(bs, -1, h >> crop, w >> crop)
+
+
+# Inverse of _wt_packed without crop, from the coarsest level up
+def _iwt_packed(x: torch.Tensor, inv_filters: torch.Tensor, levels: int, pad: int) -> torch.Tensor:
+    bs = x.size(0)
+    h = x.size(2)
+    w = x.size(3)
+    x = x.reshape(-1, 1, h, w)
+    recon = x[:, :, :h >> levels, :w >> levels]
+
+    for level in range(levels - 1, -1, -1):
+        lh = (h >> level) // 2
+        lw = (w >> level) // 2
+        res = torch.cat([recon, x[:, :, :lh, lw:2*lw], x[:, :, lh:2*lh, :lw], x[:, :, lh:2*lh, lw:2*lw]], 1)
+        recon = _iwt_level(res, inv_filters, pad)
+
+    return recon.reshape(bs, -1, h, w)
+
+
+# Splits the 3 outer quadrants of x once more, in a single batched WT
+def _split_3quads(x: torch.Tensor, filters: torch.Tensor, pad: int) -> torch.Tensor:
+    h = x.size(2) // 2
+    w = x.size(3) // 2
+    quads = torch.cat([x[:, :, :h, w:], x[:, :, h:, :w], x[:, :, h:, w:]], 0)
+    quads = _wt_packed(quads, filters, 1, pad).chunk(3, 0)
+
+    return _assemble(x[:, :, :h, :w], quads[0], quads[1], quads[2])
+
+
+def _merge_3quads(x: torch.Tensor, inv_filters: torch.Tensor, pad: int) -> torch.Tensor:
+    h = x.size(2) // 2
+    w = x.size(3) // 2
+    quads = torch.cat([x[:, :, :h, w:], x[:, :, h:, :w], x[:, :, h:, w:]], 0)
+    quads = _iwt_packed(quads, inv_filters, 1, pad).chunk(3, 0)
+
+    return _assemble(x[:, :, :h, :w], quads[0], quads[1], quads[2])
+
+
+def _wt_128_3quads(x: torch.Tensor, filters: torch.Tensor, levels: int, pad: int) -> torch.Tensor:
+    crop = _crop_levels(x.size(2), 128)
+
+    return _split_3quads(_wt_packed(x, filters, levels - crop, pad, crop), filters, pad)
+
+
+def _wt_256_3quads(x: torch.Tensor, filters: torch.Tensor, levels: int, pad: int) -> torch.Tensor:
+    crop = _crop_levels(x.size(2), 256)
+    data = _wt_packed(x, filters, levels - crop, pad, crop)
+
+    # The 3 outer 128 x 128 quadrants are laid out as wt_128_3quads with 2 levels, in a single batch
+    quads = torch.cat([data[:, :, :128, 128:], data[:, :, 128:, :128], data[:, :, 128:, 128:]], 0)
+    quads = _split_3quads(_wt_packed(quads, filters, 2, pad), filters, pad).chunk(3, 0)
+
+    return _assemble(_split_3quads(data[:, :, :128, :128], filters, pad), quads[0], quads[1], quads[2])
+
+
+def _iwt_128_3quads(x: torch.Tensor, inv_filters: torch.Tensor, levels: int, pad: int) -> torch.Tensor:
+    return _iwt_packed(_merge_3quads(x, inv_filters, pad), inv_filters, levels, pad)
+
+
+def _iwt_256_3quads(x: torch.Tensor, inv_filters: torch.Tensor, levels: int, pad: int) -> torch.Tensor:
+    quads = torch.cat([x[:, :, :128, 128:], x[:, :, 128:, :128], x[:, :, 128:, 128:]], 0)
+    quads = _iwt_packed(_merge_3quads(quads, inv_filters, pad), inv_filters, 2, pad).chunk(3, 0)
+    data = _assemble(_merge_3quads(x[:, :, :128, :128], inv_filters, pad), quads[0], quads[1], quads[2])
+
+    return _iwt_packed(data, inv_filters, levels, pad)
+
+
+def _check_layout(layout):
+    if layout not in WT_LAYOUTS:
+        raise ValueError('Unknown WT layout {} (available: {})'.format(layout, ', '.join(WT_LAYOUTS)))
+
+
+################# MODULES #################
+
+# WT as a module: the filters are a non-persistent buffer (moved by .to(), not stored in checkpoints)
+# fp16/bf16 inputs are transformed natively, as with the dense backend of wt
+class WaveletTransform(nn.Module):
+    def __init__(self, levels=1, wt_fn='bior2.2', layout='plain'):
+        super(WaveletTransform, self).__init__()
+        _check_layout(layout)
+        filters = get_filters(wt_fn)
+
+        self.levels = levels
+        self.layout = layout
+        self.pad = (filters.shape[-1] - 2) // 2
+        self.register_buffer('filters', filters, persistent=False)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        filters = self.filters.to(x.dtype)
+        if self.layout == '128_3quads':
+            return _wt_128_3quads(x, filters, self.levels, self.pad)
+        if self.layout == '256_3quads':
+            return _wt_256_3quads(x, filters, self.levels, self.pad)
+
+        return _wt_packed(x, filters, self.levels, self.pad)
+
+
+# IWT as a module, the 3quads layouts are inverted at their own size (128 x 128 for apply_iwt_quads_128)
+class InverseWaveletTransform(nn.Module):
+    def __init__(self, levels=1, wt_fn='bior2.2', layout='plain'):
+        super(InverseWaveletTransform, self).__init__()
+        _check_layout(layout)
+        inv_filters = get_inv_filters(wt_fn)
+
+        self.levels = levels
+        self.layout = layout
+        self.pad = (inv_filters.shape[-1] - 2) // 2
+        self.register_buffer('inv_filters', inv_filters, persistent=False)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        inv_filters = self.inv_filters.to(x.dtype)
+        if self.layout == '128_3quads':
+            return _iwt_128_3quads(x, inv_filters, self.levels, self.pad)
+        if self.layout == '256_3quads':
+            return _iwt_256_3quads(x, inv_filters, self.levels, self.pad)
+
+        return _iwt_packed(x, inv_filters, self.levels, self.pad)
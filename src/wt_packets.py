@@ -0,0 +1,440 @@
+import torch
+
+from wt_engine import wt, iwt, separable_taps, _quadrants
+
+# A packet spec describes which sub-bands get split further, from the pixels down:
+#   None                    leaf, the node is stored as is
+#   (LL, LH, HL, HH)        single level WT of the node, each child spec placed in its quadrant
+#   (LL,)                   single level WT keeping only the LL sub-band, which halves the layout size
+PACKET_SPLIT = (None, None, None, None)
+
+# On CPU the packet tree runs on chunks of images of about this many pixels, small enough for the convs to stay in cache
+# (a 96 x 256 x 256 batch in one conv call is 2-3x slower per pixel than in chunks of 4 images), the GPU takes the whole batch
+PACKET_CHUNK_PIXELS = 1 << 18
+
+################# SPECS #################
+
+# Plain multi-level WT: the LL band split levels times
+def packets_wt(levels):
+    spec = None
+    for _ in range(levels):
+        spec = (spec, None, None, None)
+
+    return spec
+
+
+# Full packet tree: every sub-band split down to the given depth
+def packets_tree(depth):
+    spec = None
+    for _ in range(depth):
+        spec = (spec, spec, spec, spec)
+
+    return spec
+
+
+# Keeps only the LL branch for levels splits above spec
+def packets_crop(spec, levels):
+    for _ in range(levels):
+        spec = (spec,)
+
+    return spec
+
+
+# Layout of wt_128_3quads: top-left 128 x 128 of a multi-level WT, with its 3 outer quadrants split once more
+def packets_128_3quads(size, levels):
+    crop = (size // 128).bit_length() - 1
+
+    return packets_crop((packets_wt(levels-crop-1), PACKET_SPLIT, PACKET_SPLIT, PACKET_SPLIT), crop)
+
+
+# Layout of wt_256_3quads: as packets_128_3quads for the LL quadrant, the 3 outer quadrants in the 128 layout
+def packets_256_3quads(size, levels):
+    crop = (size // 256).bit_length() - 1
+    quads_128 = packets_128_3quads(128, 2)
+    ll = (packets_wt(levels-crop-2), PACKET_SPLIT, PACKET_SPLIT, PACKET_SPLIT)
+
+    return packets_crop((ll, quads_128, quads_128, quads_128), crop)
+
+
+# WT levels bringing an image of the given size down to a single patch x patch LL band
+def pyramid_levels(size, patch=32):
+    levels = (size // patch).bit_length() - 1
+    if levels < 1 or patch << levels != size:
+        raise ValueError('Image size {} is not a power of 2 multiple of the patch size {}'.format(size, patch))
+
+    return levels
+
+
+# Resolution-generic pyramid of the UNet decoders: the top-left target x target of a levels WT (all the levels by default),
+# with every sub-band split down to patch x patch packets. The 3 outer quadrants of the top-left 2*patch, 4*patch, ... are the
+# masks of the successive decoder stages, so the stages see the same patches at any image size
+# packets_128_3quads(256, 3) is packets_pyramid(256, 128) and packets_256_3quads(256, 3) is packets_pyramid(256, 256)
+def packets_pyramid(size, target=None, patch=32, levels=None):
+    target = target or size
+    crop = pyramid_levels(size, target) if target < size else 0
+    depth = pyramid_levels(target, patch)
+    levels = pyramid_levels(size, patch) if levels is None else levels
+    if levels < crop + depth:
+        raise ValueError('A {} x {} pyramid of {} x {} patches needs at least {} levels'.format(target, target, patch, patch, crop + depth))
+
+    # Full tree of the given depth, the LL-most leaf carries the remaining levels as a plain WT
+    spec = packets_wt(levels - crop - depth)
+    for level in range(depth):
+        tree = packets_tree(level)
+        spec = (spec, tree, tree, tree)
+
+    return packets_crop(spec, crop)
+
+
+# Layout of a decoder stage output: the top-left target x target of a levels WT (all the levels by default) as a plain WT,
+# with only its 3 outer quadrants split down to patch x patch packets (the masks the stage predicts)
+# packets_masks(size, 2*patch, patch) and packets_masks(size, 4*patch, patch) are packets_pyramid of the same arguments
+def packets_masks(size, target, patch=32, levels=None):
+    crop = pyramid_levels(size, target) if target < size else 0
+    depth = pyramid_levels(target, patch)
+    levels = pyramid_levels(size, patch) if levels is None else levels
+    if levels < crop + depth:
+        raise ValueError('A {} x {} pyramid of {} x {} patches needs at least {} levels'.format(target, target, patch, patch, crop + depth))
+    masks = packets_tree(depth - 1)
+
+    return packets_crop((packets_wt(levels - crop - 1), masks, masks, masks), crop)
+
+
+def check_packet_spec(spec):
+    if spec is None:
+        return
+    if not isinstance(spec, tuple) or len(spec) not in (1, 4):
+        raise ValueError('Packet spec nodes must be None, a 1-tuple or a 4-tuple, got {}'.format(spec))
+    for child in spec:
+        check_packet_spec(child)
+
+
+# Number of LL-only splits on top of the spec, the layout is 2**crop times smaller than the input
+def packet_crop_levels(spec):
+    crop = 0
+    while spec is not None and len(spec) == 1:
+        spec = spec[0]
+        crop += 1
+
+    return crop
+
+
+# Children of a split node of size h x w placed at (top, left): (spec, quadrant row, quadrant col, top, left)
+def _children(spec, top, left, h, w):
+    if len(spec) == 1:
+        return [(spec[0], 0, 0, top, left)]
+
+    return [(child, band//2, band%2, top + (band//2)*h//2, left + (band%2)*w//2) for band, child in enumerate(spec)]
+
+
+# Number of images per packet tree pass
+def _packet_chunk(x):
+    if x.device.type == 'cuda':
+        return x.shape[0]
+
+    return max(1, PACKET_CHUNK_PIXELS // (x.size(-2) * x.size(-1)))
+
+
+# Stacks the node tensors (N, h, w) into a (nodes, N, h, w) batch, a single node is not copied
+def _stack_nodes(data):
+    if len(data) == 1:
+        return data[0].unsqueeze(0)
+
+    return torch.stack(data)
+
+
+################# LOW-PASS CASCADE #################
+
+# Composed low-pass cascades along one axis: (analysis or synthesis, filters, size, levels) => (filters, matrix)
+# Every entry keeps its filters alive (their data_ptr cannot be reused while cached), the least recently used entries are
+# dropped above LOWPASS_CACHE_SIZE so re-created filters do not grow it
+_LOWPASS = {}
+LOWPASS_CACHE_SIZE = 32
+
+# Largest LL size handled by a cascade matrix: the matmul costs size >> levels multiply-adds per pixel and axis, above that
+# the levels run as plain single level WT/IWTs
+LOWPASS_MAX_SIZE = 512
+
+
+# Single level low-pass analysis along one axis as a (size/2, size) matrix: the padded strided conv of wt
+def analysis_matrix_1d(lo, size):
+    pad = (lo.shape[-1] - 2) // 2
+    eye = torch.nn.functional.pad(torch.eye(size, dtype=lo.dtype, device=lo.device)[:, None], (pad, pad))
+    res = torch.nn.functional.conv1d(eye, lo[None, None], stride=2)
+
+    return res[:, 0].t()
+
+
+# Levels low-pass analyses along one axis composed into a single (size >> levels, size) matrix, in fp64
+# Its rows are the composed taps (36 for 3 levels of bior2.2) with a stride of 2**levels, except near the borders where
+# every level zero pads its own input, which the matrix keeps exact
+def lowpass_cascade_matrix(lo, size, levels):
+    res = torch.eye(size, dtype=lo.dtype, device=lo.device)
+    for level in range(levels):
+        res = torch.matmul(analysis_matrix_1d(lo, size >> level), res)
+
+    return res
+
+
+# Levels low-pass syntheses along one axis composed into a single (size << levels, size) matrix, in fp64
+# Same as the cropped conv_transpose of iwt on an input whose high-pass bands are all zero
+def upsample_cascade_matrix(lo, size, levels):
+    res = torch.eye(size, dtype=lo.dtype, device=lo.device)
+    for level in range(levels):
+        res = torch.matmul(synthesis_matrices_1d(lo[None], size << (level + 1))[0], res)
+
+    return res
+
+
+# Matrix of key in cache, built by build() on a miss; the cache is kept to max_size entries, least recently used first out
+def cached_matrix(cache, key, build, max_size):
+    if key in cache:
+        cache[key] = cache.pop(key)
+    else:
+        while len(cache) >= max_size:
+            del cache[next(iter(cache))]
+        cache[key] = build()
+
+    return cache[key][1]
+
+
+# Cascade matrix of filters (synthesis for inv_filters), cached as long as the filters are not modified in place
+def _lowpass_matrix(filters, size, levels, synthesis=False):
+    key = (synthesis, filters.data_ptr(), filters._version, filters.device, filters.dtype, size, levels)
+    cascade = upsample_cascade_matrix if synthesis else lowpass_cascade_matrix
+
+    return cached_matrix(_LOWPASS, key, lambda: (filters, cascade(separable_taps(filters)[0].double(), size, levels).to(filters.dtype)),
+                         LOWPASS_CACHE_SIZE)
+
+
+# LL band of a levels WT of (B, C, H, W) images, without computing any other sub-band: A_H . X . A_W^T with the cascade
+# matrices of both axes, two GEMMs instead of levels convs (single channel strided convs are slower than the 4 filter
+# conv of wt on oneDNN, so the composed taps are not run as a conv)
+def wt_lowpass(vimg, filters, levels, backend=None):
+    while levels > 0 and max(vimg.size(2), vimg.size(3)) >> levels > LOWPASS_MAX_SIZE:
+        h = vimg.size(2)
+        w = vimg.size(3)
+        vimg = wt(vimg, filters, levels=1, backend=backend)[:, :, :h//2, :w//2]
+        levels -= 1
+    if levels == 0:
+        return vimg
+
+    a_h = _lowpass_matrix(filters, vimg.size(2), levels).to(vimg.dtype)
+    a_w = _lowpass_matrix(filters, vimg.size(3), levels).to(vimg.dtype)
+
+    return torch.matmul(torch.matmul(a_h, vimg), a_w.t())
+
+
+# Pixels of (B, C, H, W) LL bands with levels of all-zero high-pass bands above them: U_H . X . U_W^T with the composed
+# synthesis cascades, iwt of the zero padded (H << levels, W << levels) frame without building or convolving it
+# The GEMMs sum in a different order than the per-level conv_transposes: within a few 1e-7 of iwt, not bit-identical
+def iwt_upsample(vres, inv_filters, levels, backend=None):
+    if levels == 0:
+        return vres
+    if max(vres.size(2), vres.size(3)) > LOWPASS_MAX_SIZE:
+        return iwt_packets(vres, inv_filters, packets_crop(None, levels), backend)
+
+    u_h = _lowpass_matrix(inv_filters, vres.size(2), levels, synthesis=True).to(vres.dtype)
+    u_w = _lowpass_matrix(inv_filters, vres.size(3), levels, synthesis=True).to(vres.dtype)
+
+    return torch.matmul(torch.matmul(u_h, vres), u_w.t())
+
+
+################# PACKET WT #################
+
+# Computes the whole packet layout of spec from the pixels, one batched single level WT per tree depth
+# With fused=True the LL-only splits on top of spec run as a single low-pass cascade (wt_lowpass) and the dropped sub-bands
+# are never computed. The cascade sums in a different order than the per-level convs, so its output is within a few 1e-6
+# of the default path but not bit-identical to it (nor to wt + crop): callers whose coefficients are training targets keep
+# the default
+def wt_packets(vimg, filters, spec, backend=None, fused=False):
+    check_packet_spec(spec)
+    crop = packet_crop_levels(spec)
+    if fused and crop:
+        vimg = wt_lowpass(vimg, filters, crop, backend)
+        for _ in range(crop):
+            spec = spec[0]
+        crop = 0
+    bs = vimg.shape[0]
+    h = vimg.size(2)
+    w = vimg.size(3)
+    vimg = vimg.reshape(-1, h, w)
+
+    out = vimg.new_empty(vimg.shape[0], h >> crop, w >> crop)
+    chunk = _packet_chunk(vimg)
+    for start in range(0, vimg.shape[0], chunk):
+        _wt_packets(vimg[start:start+chunk], out[start:start+chunk], filters, spec, backend)
+
+    return out.reshape(bs, -1, out.shape[1], out.shape[2])
+
+
+def _wt_packets(vimg, out, filters, spec, backend):
+    n = vimg.size(0)
+    h = vimg.size(1)
+    w = vimg.size(2)
+    nodes = [(spec, vimg, 0, 0)]
+
+    while nodes:
+        for node, data, top, left in nodes:
+            if node is None:
+                out[:, top:top+h, left:left+w].copy_(data)
+
+        splits = [node for node in nodes if node[0] is not None]
+        if not splits:
+            break
+
+        res = wt(_stack_nodes([data for _, data, _, _ in splits]), filters, levels=1, backend=backend)
+        quads = _quadrants(res.view(-1, h, w), h, w).unflatten(0, (len(splits), n))
+
+        nodes = []
+        for i, (node, _, top, left) in enumerate(splits):
+            for child, r, c, child_top, child_left in _children(node, top, left, h, w):
+                nodes.append((child, quads[i, :, r, c], child_top, child_left))
+        h = h // 2
+        w = w // 2
+
+
+# Inverse of wt_packets, from the deepest splits up, one batched single level IWT per tree depth
+# Sub-bands dropped by LL-only splits are reconstructed as zeros, the output has the size of the original input
+# With a target spec, the splits of target are kept and the result is in the target layout (e.g. packets_wt(3) for a plain WT)
+# The LL-only splits on top of spec are inverted as zero sub-bands, bit-identical to iwt of the zero padded frame. With
+# fused=True they run as a single upsampling (iwt_upsample, within a few 1e-7) and the zero sub-bands are never built
+def iwt_packets(vres, inv_filters, spec, backend=None, target=None, fused=False):
+    check_packet_spec(spec)
+    check_packet_spec(target)
+    crop = packet_crop_levels(spec)
+    if fused and target is None and crop and max(vres.size(2), vres.size(3)) <= LOWPASS_MAX_SIZE:
+        for _ in range(crop):
+            spec = spec[0]
+        return iwt_upsample(iwt_packets(vres, inv_filters, spec, backend), inv_filters, crop, backend)
+
+    bs = vres.shape[0]
+    crop = packet_crop_levels(spec) if target is None else 0
+    h = vres.size(2) << crop
+    w = vres.size(3) << crop
+    vres = vres.reshape(-1, vres.size(2), vres.size(3))
+
+    # Split nodes to invert at every depth, top-down: (spec, top, left, parent index, quadrant row, quadrant col)
+    # Nodes without a parent are written to the output, as are the leaves listed in copies
+    depths = []
+    copies = []
+    nodes = [(spec, target, 0, 0, None, 0, 0)]
+    while nodes:
+        dh = h >> len(depths)
+        dw = w >> len(depths)
+        inverted = []
+        children = []
+
+        for node, keep, top, left, parent, r, c in nodes:
+            if node is None:
+                if keep is not None:
+                    raise ValueError('Target spec splits a leaf of the packet spec')
+                if parent is None:
+                    copies.append((top, left, dh, dw))
+            elif keep is not None:
+                if len(keep) != len(node) or len(keep) == 1:
+                    raise ValueError('Target spec must keep full splits of the packet spec')
+                for (child, _, _, child_top, child_left), child_keep in zip(_children(node, top, left, dh, dw), keep):
+                    children.append((child, child_keep, child_top, child_left, None, 0, 0))
+            else:
+                if len(node) == 1 and parent is None and target is not None:
+                    raise ValueError('LL-only splits can only be inverted back to pixels')
+                for child, child_r, child_c, child_top, child_left in _children(node, top, left, dh, dw):
+                    children.append((child, None, child_top, child_left, len(inverted), child_r, child_c))
+                inverted.append((node, top, left, parent, r, c))
+
+        depths.append(inverted)
+        nodes = children
+
+    out = vres.new_empty(vres.shape[0], h, w)
+    chunk = _packet_chunk(out)
+    for start in range(0, vres.shape[0], chunk):
+        _iwt_packets(vres[start:start+chunk], out[start:start+chunk], inv_filters, depths, copies, backend)
+
+    return out.reshape(bs, -1, h, w)
+
+
+def _iwt_packets(vres, out, inv_filters, depths, copies, backend):
+    n = out.size(0)
+    h = out.size(1)
+    w = out.size(2)
+    recon = None
+
+    for top, left, dh, dw in copies:
+        out[:, top:top+dh, left:left+dw].copy_(vres[:, top:top+dh, left:left+dw])
+
+    for depth in reversed(range(len(depths))):
+        dh = h >> depth
+        dw = w >> depth
+        nodes = depths[depth]
+        if not nodes:
+            recon = None
+            continue
+
+        if any(len(node) == 1 for node, _, _, _, _, _ in nodes):
+            res = vres.new_zeros(len(nodes), n, dh, dw)
+        else:
+            res = vres.new_empty(len(nodes), n, dh, dw)
+        quads = _quadrants(res.view(-1, dh, dw), dh, dw).unflatten(0, (len(nodes), n))
+
+        for i, (node, top, left, _, _, _) in enumerate(nodes):
+            for child, r, c, child_top, child_left in _children(node, top, left, dh, dw):
+                if child is None:
+                    quads[i, :, r, c].copy_(vres[:, child_top:child_top+dh//2, child_left:child_left+dw//2])
+        if recon is not None:
+            for j, (_, _, _, parent, r, c) in enumerate(depths[depth+1]):
+                if parent is not None:
+                    quads[parent, :, r, c].copy_(recon[j])
+
+        # Only the root can be inverted at depth 0, straight into the output
+        if depth == 0:
+            iwt(res, inv_filters, levels=1, backend=backend, out=out)
+            continue
+
+        recon = iwt(res, inv_filters, levels=1, backend=backend)
+        for i, (_, top, left, parent, _, _) in enumerate(nodes):
+            if parent is None:
+                out[:, top:top+dh, left:left+dw].copy_(recon[i])
+
+
+################# PACKET SYNTHESIS #################
+
+# Single level synthesis along one axis as a (2, size, size/2) stack of matrices (lo, hi): the cropped conv_transpose of iwt
+def synthesis_matrices_1d(taps, size):
+    eye = torch.eye(size//2, dtype=taps.dtype, device=taps.device)[:, None]
+    res = torch.nn.functional.conv_transpose1d(eye, taps[None], stride=2)
+    pad = (taps.shape[-1] - 2) // 2
+    if pad > 0:
+        res = res[:, :, pad:-pad] #removing padding
+
+    return res.permute(1, 2, 0)
+
+
+# Exact synthesis of a full packet tree of the given depth along one axis, as a (size, size) matrix
+# Column block p reconstructs the leaves whose band path along that axis (coarse to fine) is the bits of p
+def create_packet_synthesis(inv_filters, size=256, depth=3):
+    taps = separable_taps(inv_filters).double()
+    blocks = [torch.eye(size, dtype=taps.dtype, device=taps.device)]
+
+    for level in range(depth):
+        bands = synthesis_matrices_1d(taps, size >> level)
+        blocks = [torch.matmul(block, band) for block in blocks for band in bands]
+
+    return torch.cat(blocks, dim=1).to(inv_filters.dtype)
+
+
+# Pixels of a full packet layout (as computed by wt_packets with packets_tree(depth))
+# The quadrant (r, c) of a split holds the band filtered with c along H and r along W, so the leaf blocks are transposed first
+def synthesize_packets(vres, synthesis, depth):
+    bs = vres.shape[0]
+    h = vres.size(2)
+    w = vres.size(3)
+    k = 1 << depth
+    grid = vres.reshape(bs, -1, k, h//k, k, w//k).permute(0, 1, 4, 3, 2, 5).reshape(bs, -1, h, w)
+
+    return synthesize_packet_grid(grid, synthesis)
+
+
+# A.G.A^T, with the leaf whose band paths along H and W are (p, q) in the block (p, q) of the grid G
+def synthesize_packet_grid(grid, synthesis):
+    return torch.matmul(torch.matmul(synthesis, grid), synthesis.t())
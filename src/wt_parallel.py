@@ -0,0 +1,70 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from wt_engine import wt, iwt
+
+# Sharded wt/iwt for CPU hosts: the (B*C, 1, H, W) convs of a single call scale poorly over the intra-op threads, so large
+# batches are split into shards along B, run concurrently on a thread pool (the convs release the GIL) with few intra-op
+# threads each, and written straight into their slice of a single preallocated output (wt/iwt out=)
+# Every pool thread sets its own intra-op thread count once when it starts, the caller's count is never touched
+# Inference only, the shards are not differentiable as a whole: they run under no_grad, which is per thread and is therefore
+# entered by each shard on its own thread
+WT_MIN_SHARD = 1
+
+################# EXECUTOR #################
+
+# fn(x, out) without autograd on the thread running it (grad mode is thread local, the pool threads do not inherit it)
+def _run_no_grad(fn, x, out):
+    with torch.no_grad():
+        fn(x, out)
+
+
+class WTExecutor(object):
+    def __init__(self, workers=None, intra_threads=1, min_shard=WT_MIN_SHARD):
+        self.workers = workers or os.cpu_count() or 1
+        self.intra_threads = intra_threads
+        self.min_shard = min_shard
+        self.pool = ThreadPoolExecutor(self.workers, initializer=torch.set_num_threads, initargs=(intra_threads,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+    # (start, end) batch ranges of at least min_shard images, one per worker at most
+    def shards(self, batch_size):
+        count = max(1, min(self.workers, batch_size // self.min_shard))
+        step = -(-batch_size // count)
+
+        return [(start, min(start + step, batch_size)) for start in range(0, batch_size, step)]
+
+    # fn(x[start:end], out[start:end]) for every shard, out is the (B, ...) output of fn on the whole batch
+    def map(self, fn, x, out):
+        shards = self.shards(x.shape[0])
+        if len(shards) == 1:
+            _run_no_grad(fn, x, out)
+            return out
+
+        futures = [self.pool.submit(_run_no_grad, fn, x[start:end], out[start:end]) for start, end in shards]
+        for future in futures:
+            future.result()
+
+        return out
+
+    def wt(self, vimg, filters, levels=1, backend=None, out=None):
+        if out is None:
+            out = torch.empty_like(vimg, memory_format=torch.contiguous_format)
+
+        return self.map(lambda x, res: wt(x, filters, levels, backend, out=res), vimg, out)
+
+    def iwt(self, vres, inv_filters, levels=1, backend=None, out=None):
+        if out is None:
+            out = torch.empty_like(vres, memory_format=torch.contiguous_format)
+
+        return self.map(lambda x, res: iwt(x, inv_filters, levels, backend, out=res), vres, out)
@@ -0,0 +1,122 @@
+import torch
+
+from wt_engine import wt, LIFTING_BANDS, _polyphase
+
+# Reversible integer 5/3 transform (JPEG2000 lossless): the bior2.2 lifting steps with floor rounding, uint8 pixels map
+# to int16 coefficients and back without loss, so transformed datasets can be cached at half the float32 size
+#   predict  d[i] = x[2i+1] - floor((x[2i] + x[2i+2]) / 2)
+#   update   s[i] = x[2i] + floor((d[i-1] + d[i] + 2) / 4)
+# The signal is extended symmetrically (x[N] = x[N-2], d[-1] = d[0]) as in JPEG2000: the zero padding of the float
+# transform is not invertible once rounded. With the rounding and the borders, the integer coefficients are only close to a
+# scaled copy of the float ones: int_to_float_coeffs gives the exact float layout of wt through the lossless pixels
+# Packed layout as wt: quadrant [r, c] holds the sub-band r*2 + c, s and d are stored unscaled
+INT_COEFF_DTYPE = torch.int16
+
+################# INTEGER LIFTING #################
+
+# x[2i] + x[2i+2] along dim (with x[N] = x[N-2]) for the even samples
+def _next_sum(even, dim):
+    n = even.size(dim)
+    res = even.clone()
+    res.narrow(dim, 0, n-1).add_(even.narrow(dim, 1, n-1))
+    res.narrow(dim, n-1, 1).add_(even.narrow(dim, n-1, 1))
+
+    return res
+
+
+# d[i-1] + d[i] along dim (with d[-1] = d[0]) for the odd samples
+def _prev_sum(odd, dim):
+    n = odd.size(dim)
+    res = odd.clone()
+    res.narrow(dim, 1, n-1).add_(odd.narrow(dim, 0, n-1))
+    res.narrow(dim, 0, 1).add_(odd.narrow(dim, 0, 1))
+
+    return res
+
+
+# In-place integer 5/3 analysis of an int32 tensor along dim, floor divisions as arithmetic shifts
+def lift_int_forward_(x, dim):
+    even, odd = _polyphase(x, dim)
+    odd.sub_(_next_sum(even, dim).bitwise_right_shift_(1))
+    even.add_(_prev_sum(odd, dim).add_(2).bitwise_right_shift_(2))
+
+    return x
+
+
+# In-place inverse of lift_int_forward_, exact on integers
+def lift_int_inverse_(x, dim):
+    even, odd = _polyphase(x, dim)
+    even.sub_(_prev_sum(odd, dim).add_(2).bitwise_right_shift_(2))
+    odd.add_(_next_sum(even, dim).bitwise_right_shift_(1))
+
+    return x
+
+
+################# REVERSIBLE WT #################
+
+# Multi-level integer WT of (B, C, H, W) uint8 (or integer) images into the packed layout, as int16 coefficients
+def wt_int(img, levels=1, out=None):
+    if img.is_floating_point():
+        raise TypeError('Reversible WT needs integer pixels, got {}'.format(img.dtype))
+    bs = img.shape[0]
+    h = img.size(2)
+    w = img.size(3)
+    img = img.reshape(-1, h, w)
+
+    if out is None:
+        out = img.new_empty(img.shape, dtype=INT_COEFF_DTYPE)
+    out = out.view(-1, h, w)
+    # A copy even for int32 pixels, the lifting runs in place
+    x = img.to(torch.int32, copy=True)
+
+    for level in range(levels):
+        lift_int_forward_(x, -1)
+        lift_int_forward_(x, -2)
+
+        for band, (r, c, _) in enumerate(LIFTING_BANDS):
+            if band > 0 or level == levels - 1:
+                out[:, (band//2)*h//2:(band//2+1)*h//2, (band%2)*w//2:(band%2+1)*w//2].copy_(x[:, r::2, c::2])
+        x = x[:, 0::2, 0::2].clone()
+
+        h = h // 2
+        w = w // 2
+
+    return out.reshape(bs, -1, out.shape[1], out.shape[2])
+
+
+# Inverse of wt_int, the pixels come back exactly (as uint8 by default)
+def iwt_int(coeffs, levels=1, out=None, dtype=torch.uint8):
+    bs = coeffs.shape[0]
+    h = coeffs.size(2)
+    w = coeffs.size(3)
+    coeffs = coeffs.reshape(-1, h, w)
+    ll = None
+
+    for level in reversed(range(levels)):
+        lh = h >> level
+        lw = w >> level
+        x = coeffs.new_empty(coeffs.shape[0], lh, lw, dtype=torch.int32)
+
+        for band, (r, c, _) in enumerate(LIFTING_BANDS):
+            if band == 0 and ll is not None:
+                x[:, r::2, c::2] = ll
+            else:
+                x[:, r::2, c::2] = coeffs[:, (band//2)*lh//2:(band//2+1)*lh//2, (band%2)*lw//2:(band%2+1)*lw//2]
+
+        lift_int_inverse_(x, -2)
+        lift_int_inverse_(x, -1)
+        ll = x
+
+    if out is None:
+        return ll.to(dtype).reshape(bs, -1, h, w)
+
+    out.view(-1, h, w).copy_(ll)
+
+    return out.reshape(bs, -1, h, w)
+
+
+# Float packed layout of wt(pixels * scale, filters, levels) from cached integer coefficients, scale=1/255 as ToTensor
+def int_to_float_coeffs(coeffs, filters, levels=1, scale=1. / 255, backend=None, dtype=torch.float32):
+    img = iwt_int(coeffs, levels, dtype=dtype).mul_(scale)
+
+    return wt(img, filters.to(dtype), levels, backend)
@@ -0,0 +1,19 @@
+import torch
+
+# Synthetic images shared by the benchmarks (bench_wt.py) and the tests: no dataset needed, statistics close enough to
+# natural images for the coefficient ranges, sparsity and float errors to be representative
+
+################# NATURAL IMAGES #################
+
+# Random (B, 3, size, size) images in [0, 1] with the 1/f amplitude spectrum of natural images
+# A seeded generator (on device) makes them reproducible
+def natural_images(batch_size, image_size, device='cpu', generator=None):
+    fy = torch.fft.fftfreq(image_size, device=device)[:, None]
+    fx = torch.fft.rfftfreq(image_size, device=device)[None]
+    amplitude = 1. / torch.clamp(torch.sqrt(fx**2 + fy**2), min=1. / image_size)
+    spectrum = torch.randn(batch_size, 3, image_size, image_size//2 + 1, dtype=torch.cfloat, device=device,
+                           generator=generator) * amplitude
+    img = torch.fft.irfft2(spectrum, s=(image_size, image_size))
+    img = img - img.amin((2, 3), keepdim=True)
+
+    return img / img.amax((2, 3), keepdim=True)
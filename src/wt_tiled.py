@@ -0,0 +1,194 @@
+import os
+import tempfile
+import numpy as np
+import torch
+
+from wt_engine import wt, iwt
+
+# Tiled WT/IWT for images too large for a single wt/iwt call (multi-thousand pixel scans)
+# Every level is computed tile by tile with a single level wt/iwt, on tiles read with a halo of TILE_HALO coefficients
+# (2 * TILE_HALO pixels) on every side, which covers the 6 taps of bior2.2, so the result is the untiled transform
+# Sources and outputs are (B, C, H, W) torch tensors or numpy arrays, including np.memmap and np.load(..., mmap_mode='r'):
+# only a few tiles are in memory at a time, the LL bands between levels go to a scratch buffer of the same kind as the output
+TILE_HALO = 2
+
+################# BUFFERS #################
+
+# Empty buffer of the same kind as like: a temporary memmap for memmaps (removed once unreferenced on POSIX), else in memory
+def _empty_like_buffer(like, shape, dtype=None):
+    if isinstance(like, np.memmap):
+        fd, path = tempfile.mkstemp(suffix='.wt_scratch', dir=os.path.dirname(like.filename) or None)
+        os.close(fd)
+        buf = np.memmap(path, dtype=dtype or like.dtype, mode='w+', shape=shape)
+        os.remove(path)
+        return buf
+    if isinstance(like, np.ndarray):
+        return np.empty(shape, dtype=dtype or like.dtype)
+
+    return torch.empty(shape, dtype=dtype or like.dtype, device=like.device)
+
+
+# Scratch buffer for the LL bands of the levels in between: LL of odd levels on the left, of even levels on the right
+def _scratch(like, bs, c, h, w, levels):
+    if levels < 2:
+        return None
+
+    return _empty_like_buffer(like, (bs, c, h // 2, w // 2 + w // 4))
+
+
+# LL band of level (h, w: input size), as a view of the scratch buffer
+def _scratch_ll(scratch, h, w, level):
+    lh = h >> level
+    lw = w >> level
+    left = 0 if level % 2 else w // 2
+
+    return scratch[:, :, :lh, left:left+lw]
+
+
+# buf[n, :, top:top+h, left:left+w] as a tensor on device, with zeros outside of buf
+def _read(buf, n, top, left, h, w, device, dtype):
+    tile = torch.zeros(1, buf.shape[1], h, w, device=device, dtype=dtype)
+    r0 = max(top, 0)
+    r1 = min(top + h, buf.shape[2])
+    c0 = max(left, 0)
+    c1 = min(left + w, buf.shape[3])
+    if r0 < r1 and c0 < c1:
+        data = buf[n, :, r0:r1, c0:c1]
+        if isinstance(data, np.ndarray):
+            data = torch.from_numpy(np.ascontiguousarray(data))
+        tile[0, :, r0-top:r1-top, c0-left:c1-left].copy_(data)
+
+    return tile
+
+
+def _write(buf, n, top, left, data):
+    h = data.shape[1]
+    w = data.shape[2]
+    if isinstance(buf, np.ndarray):
+        buf[n, :, top:top+h, left:left+w] = data.cpu().numpy()
+    else:
+        buf[n, :, top:top+h, left:left+w].copy_(data)
+
+
+# Tiles (top, left, h, w) covering h x w
+def _tiles(h, w, tile):
+    for top in range(0, h, tile):
+        for left in range(0, w, tile):
+            yield top, left, min(tile, h - top), min(tile, w - left)
+
+
+################# TILED WT #################
+
+# Same result as wt(src, filters, levels, backend), computed on tiles of tile x tile coefficients per level
+def wt_tiled(src, filters, levels=1, out=None, tile=512, backend=None):
+    bs, c, h, w = src.shape
+    if out is None:
+        out = _empty_like_buffer(src, src.shape)
+    scratch = _scratch(out, bs, c, h, w, levels)
+    halo = TILE_HALO
+
+    for level in range(levels):
+        inp = src if level == 0 else _scratch_ll(scratch, h, w, level)
+        lh = h >> (level + 1)
+        lw = w >> (level + 1)
+        ll = out[:, :, :lh, :lw] if level == levels - 1 else _scratch_ll(scratch, h, w, level + 1)
+
+        for n in range(bs):
+            for top, left, th, tw in _tiles(lh, lw, tile):
+                x = _read(inp, n, 2*(top-halo), 2*(left-halo), 2*(th+2*halo), 2*(tw+2*halo), filters.device, filters.dtype)
+                res = wt(x, filters, levels=1, backend=backend)[0]
+                qh = th + 2*halo
+                qw = tw + 2*halo
+
+                # Quadrant [r, c] of the tile result holds the sub-band r*2 + c of the coefficients top-halo.., left-halo..
+                for band in range(4):
+                    r = band // 2
+                    col = band % 2
+                    data = res[:, r*qh+halo:r*qh+halo+th, col*qw+halo:col*qw+halo+tw]
+                    if band == 0:
+                        _write(ll, n, top, left, data)
+                    else:
+                        _write(out, n, r*lh + top, col*lw + left, data)
+
+    return out
+
+
+################# TILED IWT #################
+
+# Same result as iwt(src, inv_filters, levels, backend), computed on tiles of tile x tile coefficients per level
+def iwt_tiled(src, inv_filters, levels=1, out=None, tile=512, backend=None):
+    bs, c, h, w = src.shape
+    if out is None:
+        out = _empty_like_buffer(src, src.shape)
+    scratch = _scratch(out, bs, c, h, w, levels)
+    halo = TILE_HALO
+
+    for level in range(levels, 0, -1):
+        lh = h >> level
+        lw = w >> level
+        ll = src[:, :, :lh, :lw] if level == levels else _scratch_ll(scratch, h, w, level)
+        bands = (ll, src[:, :, :lh, lw:2*lw], src[:, :, lh:2*lh, :lw], src[:, :, lh:2*lh, lw:2*lw])
+        recon = out if level == 1 else _scratch_ll(scratch, h, w, level - 1)
+
+        for n in range(bs):
+            for top, left, th, tw in _tiles(lh, lw, tile):
+                qh = th + 2*halo
+                qw = tw + 2*halo
+                res = torch.empty(1, c, 2*qh, 2*qw, device=inv_filters.device, dtype=inv_filters.dtype)
+                for band, data in enumerate(bands):
+                    r = band // 2
+                    col = band % 2
+                    res[:, :, r*qh:(r+1)*qh, col*qw:(col+1)*qw] = _read(data, n, top-halo, left-halo, qh, qw, res.device, res.dtype)
+
+                # Pixels of the tile coefficients start 2 * halo pixels into the result
+                x = iwt(res, inv_filters, levels=1, backend=backend)[0]
+                _write(recon, n, 2*top, 2*left, x[:, 2*halo:2*(halo+th), 2*halo:2*(halo+tw)])
+
+    return out
+
+
+################# ROI IWT #################
+
+# Coefficient range [start, stop) of the next level (size coefficients) whose single level IWT covers the pixels [start, stop)
+# Pixel n of a taps-tap synthesis takes coefficients ceil((n - taps + 1 + pad) / 2) to floor((n + pad) / 2), pad = (taps-2)/2
+def _roi_range(start, stop, size, taps):
+    pad = (taps - 2) // 2
+    first = -((taps - 1 - pad - start) // 2)
+    last = (stop - 1 + pad) // 2
+
+    return max(0, first), min(size, last + 1)
+
+
+# Pixels [top, top+height) x [left, left+width) of iwt(vres, inv_filters, levels, backend), from the coefficients that reach
+# them only: each level inverts the smallest block of sub-bands covering the region of the level above (filter support
+# included), so the cost follows the ROI size instead of the image size
+def iwt_roi(vres, inv_filters, levels, top, left, height, width, backend=None):
+    bs, c, h, w = vres.shape
+    taps = inv_filters.shape[-1]
+    rows = [(top, top + height)]
+    cols = [(left, left + width)]
+    for level in range(1, levels + 1):
+        rows.append(_roi_range(rows[-1][0], rows[-1][1], h >> level, taps))
+        cols.append(_roi_range(cols[-1][0], cols[-1][1], w >> level, taps))
+
+    recon = vres[:, :, rows[levels][0]:rows[levels][1], cols[levels][0]:cols[levels][1]]
+    for level in range(levels, 0, -1):
+        lh = h >> level
+        lw = w >> level
+        r0, r1 = rows[level]
+        c0, c1 = cols[level]
+        bh = r1 - r0
+        bw = c1 - c0
+
+        # Packed single level block: LL of the region from the level below, the 3 other sub-bands from vres
+        res = vres.new_empty(bs, c, 2*bh, 2*bw)
+        res[:, :, :bh, :bw] = recon
+        res[:, :, :bh, bw:] = vres[:, :, r0:r1, lw+c0:lw+c1]
+        res[:, :, bh:, :bw] = vres[:, :, lh+r0:lh+r1, c0:c1]
+        res[:, :, bh:, bw:] = vres[:, :, lh+r0:lh+r1, lw+c0:lw+c1]
+
+        # Pixel m of the block is pixel 2 * r0 + m of the level
+        x = iwt(res, inv_filters, levels=1, backend=backend)
+        recon = x[:, :, rows[level-1][0]-2*r0:rows[level-1][1]-2*r0, cols[level-1][0]-2*c0:cols[level-1][1]-2*c0]
+
+    return recon
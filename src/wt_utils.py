@@ -1,30 +1,40 @@
 import torch
-from torch.autograd import Variable
 import numpy as np
 import matplotlib.pyplot as plt
 import random
-import pywt
 import IPython
 from logger import Logger
+from filter_bank import get_filters, get_inv_filters
+from wt_engine import wt, iwt, set_wt_backend, get_wt_backend
+from wt_packets import wt_packets, iwt_packets, packets_wt, packets_tree, packets_crop, packets_128_3quads, packets_256_3quads
+from wt_packets import pyramid_levels, packets_pyramid, packets_masks, wt_lowpass
+from wt_packets import create_packet_synthesis, synthesize_packets, synthesize_packet_grid
+from wt_modules import WaveletTransform, InverseWaveletTransform
+from wt_tiled import wt_tiled, iwt_tiled, iwt_roi
+from wt_parallel import WTExecutor
+from wt_augment import invert_packets, flip_coeffs, transpose_coeffs, rot90_coeffs, CoeffAugment
+from frame_pool import FramePool, new_frame
+from wt_reversible import wt_int, iwt_int, int_to_float_coeffs
+from wt_samples import natural_images
 
 ################# ZERO FUNCTIONS #################
 
 # Zeroing out all other patches than the first for WT image: 4D: B * C * H * W
 def zero_patches(img, num_wt):
     padded = torch.zeros(img.shape, device=img.device)
-    patch_dim = img.shape[2] // np.power(2, num_wt)
+    patch_dim = img.shape[2] // 2 ** num_wt
     padded[:, :, :patch_dim, :patch_dim] = img[:, :, :patch_dim, :patch_dim]
     
     return padded
 
 
 # Create padding on patch so that this patch is formed into a square image with other patches as 0
-# 3 x 128 x 128 => 3 x target_dim x target_dim
-def zero_pad(img, target_dim, device='cpu'):
+# 3 x 128 x 128 => 3 x target_dim x target_dim, on the device of img by default (frame from pool if given)
+def zero_pad(img, target_dim, device=None, pool=None):
     batch_size = img.shape[0]
     num_channels = img.shape[1]
-    padded_img = torch.zeros((batch_size, num_channels, target_dim, target_dim), device=device)
-    padded_img[:, :, :img.shape[2], :img.shape[3]] = img.to(device)
+    padded_img = new_frame((batch_size, num_channels, target_dim, target_dim), img.dtype, device or img.device, pool, zero=True)
+    padded_img[:, :, :img.shape[2], :img.shape[3]] = img
     
     return padded_img
     
@@ -34,8 +44,8 @@ def zero_mask(mask, num_iwt, cur_iwt):
     padded = torch.zeros(mask.shape, device=mask.device)
     h = mask.shape[2]
 
-    inner_patch_h0 = h // (np.power(2, num_iwt-cur_iwt+1))
-    inner_patch_w0 = h // (np.power(2, num_iwt-cur_iwt+1))
+    inner_patch_h0 = h // (2 ** (num_iwt-cur_iwt+1))
+    inner_patch_w0 = h // (2 ** (num_iwt-cur_iwt+1))
 
     if len(mask.shape) == 3:
         padded[:, inner_patch_h0:, :] = mask[:, inner_patch_h0:, :]
@@ -49,109 +59,61 @@ def zero_mask(mask, num_iwt, cur_iwt):
 
 ################# WT FUNCTIONS #################
 def create_filters(device, wt_fn='bior2.2'):
-    w = pywt.Wavelet(wt_fn)
+    return get_filters(wt_fn, device)
 
-    dec_hi = torch.Tensor(w.dec_hi[::-1]).to(device)
-    dec_lo = torch.Tensor(w.dec_lo[::-1]).to(device)
 
-    filters = torch.stack([dec_lo.unsqueeze(0)*dec_lo.unsqueeze(1),
-                           dec_lo.unsqueeze(0)*dec_hi.unsqueeze(1),
-                           dec_hi.unsqueeze(0)*dec_lo.unsqueeze(1),
-                           dec_hi.unsqueeze(0)*dec_hi.unsqueeze(1)], dim=0)
+def create_inv_filters(device, wt_fn='bior2.2'):
+    return get_inv_filters(wt_fn, device)
 
-    return filters
+# Input is 256 x 256 or 128 x 128 (levels automatically adjusted), and outputs 128 x 128 will all patches WT'ed to 32 x 32
+def wt_128_3quads(img, filters, levels, backend=None):
+    spec = packets_128_3quads(img.shape[2], levels)
 
+    return wt_packets(img, filters, spec, backend)
 
-def create_inv_filters(device, wt_fn='bior2.2'):
-    w = pywt.Wavelet(wt_fn)
 
-    rec_hi = torch.Tensor(w.rec_hi).to(device)
-    rec_lo = torch.Tensor(w.rec_lo).to(device)
-    
-    inv_filters = torch.stack([rec_lo.unsqueeze(0)*rec_lo.unsqueeze(1),
-                               rec_lo.unsqueeze(0)*rec_hi.unsqueeze(1),
-                               rec_hi.unsqueeze(0)*rec_lo.unsqueeze(1),
-                               rec_hi.unsqueeze(0)*rec_hi.unsqueeze(1)], dim=0)
-
-    return inv_filters
-
-def wt(vimg, filters, levels=1):
-    bs = vimg.shape[0]
-    h = vimg.size(2)
-    w = vimg.size(3)
-    vimg = vimg.reshape(-1, 1, h, w)
-    padded = torch.nn.functional.pad(vimg,(2,2,2,2))
-    res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]),stride=2)
-    if levels>1:
-        res[:,:1] = wt(res[:,:1], filters, levels-1)
-        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
-        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
-        res[:,1:] = res[:,1:]*1.
-    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
-    return res.reshape(bs, -1, h, w)
-
-
-def iwt(vres, inv_filters, levels=1):
-    bs = vres.shape[0]
-    h = vres.size(2)
-    w = vres.size(3)
-    vres = vres.reshape(-1, 1, h, w)
-    res = vres.contiguous().view(-1, h//2, 2, w//2).transpose(1, 2).contiguous().view(-1, 4, h//2, w//2).clone()
-    if levels > 1:
-        res[:,:1] = iwt(res[:,:1], inv_filters, levels=levels-1)
-    res = torch.nn.functional.conv_transpose2d(res, Variable(inv_filters[:,None]),stride=2)
-    res = res[:,:,2:-2,2:-2] #removing padding
-
-    return res.reshape(bs, -1, h, w)
+def wt_256_3quads(data, filters, levels, backend=None):
+    spec = packets_256_3quads(data.shape[2], levels)
 
+    return wt_packets(data, filters, spec, backend)
 
-# Input is 256 x 256 or 128 x 128 (levels automatically adjusted), and outputs 128 x 128 will all patches WT'ed to 32 x 32
-def wt_128_3quads(img, filters, levels):
-    data = img.clone()
-        
-    data = wt(data, filters, levels)[:, :, :128, :128]
-    h = data.shape[2]
-    w = data.shape[3]
-    
-    tr = wt(data[:, :, :h//2, w//2:], filters, levels=1)
-    bl = wt(data[:, :, h//2:, :w//2], filters, levels=1)
-    br = wt(data[:, :, h//2:, w//2:], filters, levels=1)
-    
-    data[:, :, :h//2, w//2:] = tr
-    data[:, :, h//2:, :w//2] = bl
-    data[:, :, h//2:, w//2:] = br
-    
-    return data
+# Top-left size x size of wt(img, filters, levels), bit-identical to the crop of wt; with fused=True the sub-bands outside
+# of it are never computed (wt_lowpass, within a few 1e-6 of the crop)
+def wt_crop(img, filters, size, levels, backend=None, fused=False):
+    crop = pyramid_levels(img.shape[2], size) if size < img.shape[2] else 0
+    spec = packets_crop(packets_wt(levels - crop), crop)
 
+    return wt_packets(img, filters, spec, backend, fused)
 
-def wt_256_3quads(data, filters, levels):
-    h = data.shape[2]
-    w = data.shape[3]
-    
-    data = wt(data, filters, levels)[:, :, :256, :256]
+def apply_iwt_quads_128(img_quad, inv_filters, backend=None):
+    spec = packets_128_3quads(img_quad.shape[2], 2)
 
-    # Applying WT to 64x64 inner 3 quadrants
-    data[:, :, :64, 64:128] = wt(data[:, :, :64, 64:128], filters, levels=1)
-    data[:, :, 64:128, :64] = wt(data[:, :, 64:128, :64], filters, levels=1)
-    data[:, :, 64:128, 64:128] = wt(data[:, :, 64:128, 64:128], filters, levels=1)
-    
-    data[:, :, :h//2, w//2:] = wt_128_3quads(data[:, :, :h//2, w//2:], filters, levels=2)
-    data[:, :, h//2:, :w//2] = wt_128_3quads(data[:, :, h//2:, :w//2], filters, levels=2)
-    data[:, :, h//2:, w//2:] = wt_128_3quads(data[:, :, h//2:, w//2:], filters, levels=2)
-    
-    return data
+    return iwt_packets(img_quad, inv_filters, spec, backend)
 
-def apply_iwt_quads_128(img_quad, inv_filters):
-    h = img_quad.shape[2] // 2
-    w = img_quad.shape[3] // 2
-    
-    img_quad[:, :, :h, w:] = iwt(img_quad[:, :, :h, w:], inv_filters, levels=1)
-    img_quad[:, :, h:, :w] = iwt(img_quad[:, :, h:, :w], inv_filters, levels=1)
-    img_quad[:, :, h:, w:] = iwt(img_quad[:, :, h:, w:], inv_filters, levels=1)
-    
-    img_quad = iwt(img_quad, inv_filters, levels=2)
-    
-    return img_quad
+# Any image size: top-left target x target of the WT (whole image by default) with all sub-bands split to patch x patch
+# wt_pyramid(img, filters, 128) and wt_pyramid(img, filters, 256) are wt_128_3quads and wt_256_3quads with 32 x 32 patches
+def wt_pyramid(img, filters, target=None, patch=32, levels=None, backend=None):
+    spec = packets_pyramid(img.shape[2], target, patch, levels)
+
+    return wt_packets(img, filters, spec, backend)
+
+
+# Pixels of a size x size image from its pyramid, the sub-bands outside the pyramid are zeros
+# A pyramid of a mask quadrant is inverted at its own size (apply_iwt_quads_128 for a 4 x 4 grid of patches)
+def iwt_pyramid(Y, inv_filters, size=None, patch=32, levels=None, backend=None):
+    spec = packets_pyramid(size or Y.shape[2], Y.shape[2], patch, levels)
+
+    return iwt_packets(Y, inv_filters, spec, backend)
+
+
+# Pixels of a size x size image from the top-left corner of its WT (a plain WT with levels - log2(size / corner) levels)
+# Bit-identical to iwt(zero_pad(Y, size), inv_filters, levels); with fused=True the zero sub-bands are never built
+# (iwt_upsample, within a few 1e-7 of it)
+def iwt_lowpass(Y, inv_filters, size, levels, backend=None, fused=False):
+    crop = pyramid_levels(size, Y.shape[2]) if Y.shape[2] < size else 0
+    spec = packets_crop(packets_wt(levels - crop), crop)
+
+    return iwt_packets(Y, inv_filters, spec, backend, fused=fused)
 
 ################# COLLATE/SPLIT FUNCTIONS #################
 
@@ -188,93 +150,214 @@ def split_masks_from_channels(data):
     return data[:, :nc_mask, :, :], data[:, nc_mask:2*nc_mask, :, :], data[:, 2*nc_mask:, :, :]
 
 
+# Grid <-> patch layouts of depth d: the 4**d patches of a square grid, split into quadrants d times, in tl, tr, bl, br order at
+# every level (patch index q1*4**(d-1) + ... + qd). Each layout is a single permute of the grid seen as (2,)*d x patch rows and
+# columns, one copy and no per-quadrant slicing, at any depth (4, 16, 64 patches)
+
+# (B, C, H, W) grid as (B, C, r1..rd, h, c1..cd, w), r1/c1 the top level quadrant row/col
+def _grid_view(data, depth):
+    bs, c, h, w = data.shape
+    assert(h == w)
+
+    return data.view(bs, c, *((2,)*depth), h >> depth, *((2,)*depth), w >> depth)
+
+
+# Permutation of _grid_view to (B, r1, c1, ..., rd, cd, C, h, w)
+def _grid_order(depth):
+    quads = [d for r in range(2, 2+depth) for d in (r, r+depth+1)]
+
+    return [0] + quads + [1, 2+depth, 3+2*depth]
+
+
+# (B, C, H, W) => (B, 4**depth, C, H/2**depth, W/2**depth)
+def grid_to_patches(data, depth=1):
+    patches = _grid_view(data, depth).permute(_grid_order(depth))
+
+    return patches.reshape(data.shape[0], 4**depth, data.shape[1], data.size(2) >> depth, data.size(3) >> depth)
+
+
+# (B, C, H, W) => (B, 4**depth * C, H/2**depth, W/2**depth), the patches concatenated channel-wise
+def grid_to_channels(data, depth=1):
+    return grid_to_patches(data, depth).flatten(1, 2)
+
+
+# Inverse of grid_to_channels, the grid is written once on device (same device as the input by default)
+def channels_to_grid(img_channels, depth=1, device=None, pool=None):
+    bs = img_channels.shape[0]
+    c = img_channels.shape[1] >> (2*depth)
+    h = img_channels.shape[2] << depth
+    w = img_channels.shape[3] << depth
+
+    img = new_frame((bs, c, h, w), img_channels.dtype, device or img_channels.device, pool)
+    patches = img_channels.reshape(bs, *((2,)*(2*depth)), c, img_channels.shape[2], img_channels.shape[3])
+    _grid_view(img, depth).permute(_grid_order(depth)).copy_(patches)
+
+    return img
+
+
 # Splits four patches from a square/grid
 def create_patches_from_grid(data):
-    h = data.shape[2]
-    w = data.shape[3]
-    assert(h == w)
-    
-    tl = data[:, :, :h//2, :w//2]    
-    tr = data[:, :, :h//2, w//2:]
-    bl = data[:, :, h//2:, :w//2]
-    br = data[:, :, h//2:, w//2:]
-    
-    return torch.stack((tl, tr, bl, br), dim=1)
+    return grid_to_patches(data, 1)
 
 
 # From a square/grid, collate into channels (4 patches)
 def collate_channels_from_grid(data):
-    h = data.shape[2]
-    w = data.shape[3]
-    assert(h == w)
-    
-    tl = data[:, :, :h//2, :w//2]    
-    tr = data[:, :, :h//2, w//2:]
-    bl = data[:, :, h//2:, :w//2]
-    br = data[:, :, h//2:, w//2:]
-    
-    return torch.cat((tl, tr, bl, br), dim=1)
+    return grid_to_channels(data, 1)
 
 # Splits 16 patches from a square/grid
 def create_patches_from_grid_16(data):
-    h = data.shape[2]
-    w = data.shape[3]
-    assert(h == w)
-    
-    tl = data[:, :, :h//2, :w//2]
-    tl_patches = create_patches_from_grid(tl)
-    tr = data[:, :, :h//2, w//2:]
-    tr_patches = create_patches_from_grid(tr)
-    bl = data[:, :, h//2:, :w//2]
-    bl_patches = create_patches_from_grid(bl)
-    br = data[:, :, h//2:, w//2:]
-    br_patches = create_patches_from_grid(br)
-
-    return torch.cat((tl_patches, tr_patches, bl_patches, br_patches), dim=1)
-
-
-def collate_patches_to_img(tl, tr, bl, br, device='cpu'):
-    bs = tl.shape[0]
-    c = tl.shape[1]
-    h = tl.shape[2]
-    w = tl.shape[3]
+    return grid_to_patches(data, 2)
+
+
+# Frame of 4 quadrants on the device of tr by default, a None tl quadrant is zeros
+def collate_patches_to_img(tl, tr, bl, br, device=None, pool=None):
+    bs = tr.shape[0]
+    c = tr.shape[1]
+    h = tr.shape[2]
+    w = tr.shape[3]
     
-    frame = torch.empty((bs, c, 2*h, 2*w), device=device)
-    frame[:, :, :h, :w] = tl.to(device)
-    frame[:, :, :h, w:] = tr.to(device)
-    frame[:, :, h:, :w] = bl.to(device)
-    frame[:, :, h:, w:] = br.to(device)
+    frame = new_frame((bs, c, 2*h, 2*w), tr.dtype, device or tr.device, pool)
+    if tl is None:
+        frame[:, :, :h, :w].zero_()
+    else:
+        frame[:, :, :h, :w] = tl
+    frame[:, :, :h, w:] = tr
+    frame[:, :, h:, :w] = bl
+    frame[:, :, h:, w:] = br
     
     return frame
 
 
 # Assumes four patches concatenated channel-wise and converts into image
-def collate_channels_to_img(img_channels, device='cpu'):
-    bs = img_channels.shape[0]
-    c = img_channels.shape[1] // 4
-    h = img_channels.shape[2]
-    w = img_channels.shape[3]
-    
-    img = collate_patches_to_img(img_channels[:,:c], img_channels[:,c:2*c], img_channels[:, 2*c:3*c], img_channels[:, 3*c:], device)
-    
-    return img
+def collate_channels_to_img(img_channels, device=None, pool=None):
+    return channels_to_grid(img_channels, 1, device, pool)
 
 
 # Assumes 16 patches concatenated channel-wise and converts into image
-def collate_16_channels_to_img(img_channels, device='cpu'):
-    bs = img_channels.shape[0]
-    c = img_channels.shape[1] // 4
-    h = img_channels.shape[2]
-    w = img_channels.shape[3]
-    
-    tl = collate_channels_to_img(img_channels[:, :c], device)
-    tr = collate_channels_to_img(img_channels[:, c:2*c], device)
-    bl = collate_channels_to_img(img_channels[:, 2*c:3*c], device)
-    br = collate_channels_to_img(img_channels[:, 3*c:], device)
-    
-    img = collate_patches_to_img(tl, tr, bl, br, device)
-    
-    return img
+def collate_16_channels_to_img(img_channels, device=None, pool=None):
+    return channels_to_grid(img_channels, 2, device, pool)
+
+################# RECONSTRUCTION #################
+
+# Collates the 128 level patches (12 TL + 36 channels) and the 256 level masks (144 channels) into a 256 x 256 frame
+# Channels are grouped as (256 quadrant, 128 quadrant, 64 quadrant, color), each quadrant index in tl, tr, bl, br order
+# With transposed, the quadrant rows and columns are swapped at every level (the grid of synthesize_packet_grid)
+def collate_patches_256(Y_128_patches, recon_mask_256_all, transposed=False, pool=None):
+    bs = Y_128_patches.shape[0]
+    c = Y_128_patches.shape[1] // 16
+    h = Y_128_patches.shape[2]
+    w = Y_128_patches.shape[3]
+
+    frame = new_frame((bs, c, 8*h, 8*w), Y_128_patches.dtype, Y_128_patches.device, pool)
+    leaves = frame.view(bs, c, 2, 2, 2, h, 2, 2, 2, w)
+    if transposed:
+        leaves = leaves.permute(0, 6, 2, 7, 3, 8, 4, 1, 5, 9)
+    else:
+        leaves = leaves.permute(0, 2, 6, 3, 7, 4, 8, 1, 5, 9)
+
+    masks = recon_mask_256_all.view(bs, 3, 2, 2, 2, 2, c, h, w)
+    leaves[:, 0, 0].copy_(Y_128_patches.view(bs, 2, 2, 2, 2, c, h, w))
+    leaves[:, 0, 1].copy_(masks[:, 0])
+    leaves[:, 1].copy_(masks[:, 1:].view(bs, 2, 2, 2, 2, 2, c, h, w))
+
+    return frame
+
+
+# Maps the 128 level patches and the 256 level masks straight to the 256 x 256 image
+# Same result as collating the masks, iwt'ing each quadrant and running a 3 level iwt, up to float rounding
+def iwt_patches_256(Y_128_patches, recon_mask_256_all, synthesis):
+    grid = collate_patches_256(Y_128_patches, recon_mask_256_all, transposed=True)
+
+    return synthesize_packet_grid(grid, synthesis)
+
+################# COEFFICIENT PYRAMID #################
+
+# Packed coefficients of a batch (a wt_packets layout of spec) addressed by level, sub-band and packet instead of slices
+# Every accessor is a view of the single buffer: writing a level goes straight into the layout, which iwt then inverts
+# with no padded or collated frame in between
+# Sizes are corner sizes of the layout (corner(64) is Y[:, :, :64, :64]); level 1 is the outermost level of the layout
+class CoefficientPyramid(object):
+    __slots__ = ('data', 'spec')
+
+    def __init__(self, data, spec):
+        if data.size(2) != data.size(3):
+            raise ValueError('Coefficient pyramids are square, got {} x {}'.format(data.size(2), data.size(3)))
+        self.data = data
+        self.spec = spec
+
+    def __repr__(self):
+        return 'CoefficientPyramid(shape={}, spec={})'.format(tuple(self.data.shape), self.spec)
+
+    # Layout of spec for (batch_size, channels) images, from pool if given
+    @classmethod
+    def empty(cls, batch_size, channels, size, spec, device='cpu', dtype=torch.float32, pool=None):
+        return cls(new_frame((batch_size, channels, size, size), dtype, device, pool), spec)
+
+    @classmethod
+    def from_image(cls, img, filters, spec, backend=None):
+        return cls(wt_packets(img, filters, spec, backend), spec)
+
+    @property
+    def size(self):
+        return self.data.size(2)
+
+    # Top-left size x size of the layout
+    def corner(self, size):
+        return self.data[:, :, :size, :size]
+
+    # LL band after level levels of the layout
+    def ll(self, level):
+        return self.corner(self.size >> level)
+
+    # Sub-band 1, 2 or 3 of a level, in the quadrant [band // 2, band % 2] of the level above
+    def subband(self, level, band):
+        size = self.size >> level
+        r = band // 2
+        c = band % 2
+
+        return self.data[:, :, r*size:(r+1)*size, c*size:(c+1)*size]
+
+    # Masks (tr, bl, br) of the corner of the given size, as get_3masks
+    def masks(self, size):
+        half = size // 2
+        corner = self.corner(size)
+
+        return corner[:, :, :half, half:], corner[:, :, half:, :half], corner[:, :, half:, half:]
+
+    # (B, r1, c1, ..., rd, cd, C, patch, patch) view of the patch x patch packets of a corner, in grid_to_patches order
+    def packets(self, size, patch):
+        depth = pyramid_levels(size, patch)
+
+        return _grid_view(self.corner(size), depth).permute(_grid_order(depth))
+
+    # The 4 quadrants of a corner as decoder input channels (B, 4**depth * C, patch, patch), a single copy
+    def channels(self, size, patch):
+        return grid_to_channels(self.corner(size), pyramid_levels(size, patch))
+
+    # The 3 masks of a corner as channels, in the order of split_masks_from_channels
+    def mask_channels(self, size, patch):
+        packets = self.packets(size, patch)
+
+        return torch.cat([packets[:, r, c].reshape(self.data.shape[0], -1, patch, patch) for r, c in ((0, 1), (1, 0), (1, 1))], dim=1)
+
+    # Writes a corner in place (e.g. the real LL part of a decoder input)
+    def set_corner(self, value):
+        self.corner(value.size(2)).copy_(value)
+
+        return self
+
+    # Writes the 3 masks of a corner in place from the decoder output channels (tr, bl, br, packets in grid order)
+    def set_mask_channels(self, size, channels, patch):
+        packets = self.packets(size, patch)
+        masks = channels.view(channels.shape[0], 3, *packets.shape[3:-3], self.data.shape[1], patch, patch)
+        for i, (r, c) in enumerate(((0, 1), (1, 0), (1, 1))):
+            packets[:, r, c].copy_(masks[:, i])
+
+        return self
+
+    # Pixels of the layout, all the levels of spec (LL-only splits included) inverted at once
+    def iwt(self, inv_filters, backend=None):
+        return iwt_packets(self.data, inv_filters, self.spec, backend)
 
 ################# MISC #################
 
@@ -3,7 +3,8 @@ from torch.autograd import Variable
 import numpy as np
 import matplotlib.pyplot as plt
 import random
-import pywt
+from filter_bank import get_filters, get_inv_filters
+from wt_engine import wt, iwt
 import IPython
 #from logger import Logger
 
@@ -12,7 +13,7 @@ import IPython
 # Zeroing out all other patches than the first for WT image: 4D: B * C * H * W
 def zero_patches(img, num_wt):
     padded = torch.zeros(img.shape, device=img.device)
-    patch_dim = img.shape[2] // np.power(2, num_wt)
+    patch_dim = img.shape[2] // 2 ** num_wt
     padded[:, :, :patch_dim, :patch_dim] = img[:, :, :patch_dim, :patch_dim]
     
     return padded
@@ -34,8 +35,8 @@ def zero_mask(mask, num_iwt, cur_iwt):
     padded = torch.zeros(mask.shape, device=mask.device)
     h = mask.shape[2]
 
-    inner_patch_h0 = h // (np.power(2, num_iwt-cur_iwt+1))
-    inner_patch_w0 = h // (np.power(2, num_iwt-cur_iwt+1))
+    inner_patch_h0 = h // (2 ** (num_iwt-cur_iwt+1))
+    inner_patch_w0 = h // (2 ** (num_iwt-cur_iwt+1))
 
     if len(mask.shape) == 3:
         padded[:, inner_patch_h0:, :] = mask[:, inner_patch_h0:, :]
@@ -49,46 +50,11 @@ def zero_mask(mask, num_iwt, cur_iwt):
 
 ################# WT FUNCTIONS #################
 def create_filters(device, wt_fn='bior2.2'):
-    w = pywt.Wavelet(wt_fn)
-
-    dec_hi = torch.Tensor(w.dec_hi[::-1]).to(device)
-    dec_lo = torch.Tensor(w.dec_lo[::-1]).to(device)
-
-    filters = torch.stack([dec_lo.unsqueeze(0)*dec_lo.unsqueeze(1),
-                           dec_lo.unsqueeze(0)*dec_hi.unsqueeze(1),
-                           dec_hi.unsqueeze(0)*dec_lo.unsqueeze(1),
-                           dec_hi.unsqueeze(0)*dec_hi.unsqueeze(1)], dim=0)
-
-    return filters
+    return get_filters(wt_fn, device)
 
 
 def create_inv_filters(device, wt_fn='bior2.2'):
-    w = pywt.Wavelet(wt_fn)
-
-    rec_hi = torch.Tensor(w.rec_hi).to(device)
-    rec_lo = torch.Tensor(w.rec_lo).to(device)
-    
-    inv_filters = torch.stack([rec_lo.unsqueeze(0)*rec_lo.unsqueeze(1),
-                               rec_lo.unsqueeze(0)*rec_hi.unsqueeze(1),
-                               rec_hi.unsqueeze(0)*rec_lo.unsqueeze(1),
-                               rec_hi.unsqueeze(0)*rec_hi.unsqueeze(1)], dim=0)
-
-    return inv_filters
-
-def wt(vimg, filters, levels=1):
-    bs = vimg.shape[0]
-    h = vimg.size(2)
-    w = vimg.size(3)
-    vimg = vimg.reshape(-1, 1, h, w)
-    padded = torch.nn.functional.pad(vimg,(2,2,2,2))
-    res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]),stride=2)
-    if levels>1:
-        res[:,:1] = wt(res[:,:1], filters, levels-1)
-        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
-        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
-        res[:,1:] = res[:,1:]*1.
-    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
-    return res.reshape(bs, -1, h, w)
+    return get_inv_filters(wt_fn, device)
 
 def wt_successive(vimg, filters, levels=1):
     bs = vimg.shape[0]
@@ -96,7 +62,7 @@ def wt_successive(vimg, filters, levels=1):
     w = vimg.size(3)
     vimg = vimg.reshape(-1, 1, h, w)
     padded = torch.nn.functional.pad(vimg,(2,2,2,2))
-    res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]),stride=2)
+    res = torch.nn.functional.conv2d(padded, filters[:,None],stride=2)
 
     cnt = levels-1
     while(cnt>0):
@@ -104,14 +70,14 @@ def wt_successive(vimg, filters, levels=1):
         w = w//2
         res = res.reshape(-1, 1, h, w) #batch*3*4
         padded = torch.nn.functional.pad(res,(2,2,2,2))
-        res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]), stride=2)
+        res = torch.nn.functional.conv2d(padded, filters[:,None], stride=2)
         cnt-=1
     res = res.reshape(bs, -1, h//2, w//2)
 
     return res
 
 # Returns IWT of img with only TL patch (low frequency) zero-ed out
-def wt_hf(vimg, filters, levels=1):
+def wt_hf(vimg, filters, levels=1, wt_fn='bior2.2'):
     # Apply WT
     wt_img = wt(vimg, filters, levels)
 
@@ -119,13 +85,13 @@ def wt_hf(vimg, filters, levels=1):
     wt_img_hf = zero_mask(wt_img, levels, 1)
 
     # Apply IWT
-    inv_filters = create_inv_filters(wt_img_hf.device)
+    inv_filters = get_inv_filters(wt_fn, wt_img_hf.device, wt_img_hf.dtype)
     iwt_img_hf = iwt(wt_img_hf, inv_filters, levels)
 
     return iwt_img_hf
 
 # Returns IWT of img with only TL patch (low-frequency) -- high frequencies all zero-ed out
-def wt_lf(vimg, filters, levels=1):
+def wt_lf(vimg, filters, levels=1, wt_fn='bior2.2'):
     # Apply WT
     wt_img = wt(vimg, filters, levels)
     h = wt_img.shape[2]
@@ -137,42 +103,12 @@ def wt_lf(vimg, filters, levels=1):
     wt_img_padded = zero_pad(wt_img[:, :, :h // (2**levels), :w // (2 ** levels)], h, device=wt_img.device)
 
     # Apply IWT
-    inv_filters = create_inv_filters(wt_img_padded.device)
+    inv_filters = get_inv_filters(wt_fn, wt_img_padded.device, wt_img_padded.dtype)
     iwt_img_lf = iwt(wt_img_padded, inv_filters, levels)
 
     return iwt_img_lf
     
 
-def wt(vimg, filters, levels=1):
-    bs = vimg.shape[0]
-    h = vimg.size(2)
-    w = vimg.size(3)
-    vimg = vimg.reshape(-1, 1, h, w)
-    padded = torch.nn.functional.pad(vimg,(2,2,2,2))
-    res = torch.nn.functional.conv2d(padded, Variable(filters[:,None]),stride=2)
-    if levels>1:
-        res[:,:1] = wt(res[:,:1], filters, levels-1)
-        res[:,:1,32:,:] = res[:,:1,32:,:]*1.
-        res[:,:1,:,32:] = res[:,:1,:,32:]*1.
-        res[:,1:] = res[:,1:]*1.
-    res = res.view(-1,2,h//2,w//2).transpose(1,2).contiguous().view(-1,1,h,w)
-    return res.reshape(bs, -1, h, w)
-
-
-def iwt(vres, inv_filters, levels=1):
-    bs = vres.shape[0]
-    h = vres.size(2)
-    w = vres.size(3)
-    vres = vres.reshape(-1, 1, h, w)
-    res = vres.contiguous().view(-1, h//2, 2, w//2).transpose(1, 2).contiguous().view(-1, 4, h//2, w//2).clone()
-    if levels > 1:
-        res[:,:1] = iwt(res[:,:1], inv_filters, levels=levels-1)
-    res = torch.nn.functional.conv_transpose2d(res, Variable(inv_filters[:,None]),stride=2)
-    res = res[:,:,2:-2,2:-2] #removing padding
-
-    return res.reshape(bs, -1, h, w)
-
-
 # Input is 256 x 256 or 128 x 128 (levels automatically adjusted), and outputs 128 x 128 will all patches WT'ed to 32 x 32
 def wt_128_3quads(img, filters, levels):
     data = img.clone()
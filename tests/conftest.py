@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+import torch
+
+# The sources are flat scripts in src/, imported by module name as the scripts do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from wt_samples import natural_images as _natural_images
+
+
+# 1/f images of the benchmarks, seeded: natural_images(batch_size, image_size, seed=0)
+@pytest.fixture(scope='session')
+def natural_images():
+    return lambda batch_size, image_size, seed=0: _natural_images(batch_size, image_size,
+                                                                  generator=torch.Generator().manual_seed(seed))
@@ -0,0 +1,51 @@
+import types
+
+import pytest
+import torch
+
+for module in ('PIL', 'torchvision', 'h5py', 'matplotlib', 'IPython'):
+    pytest.importorskip(module)
+from datasets import WTCollate, create_collate_fn
+from wt_utils import wt_pyramid
+from filter_bank import get_filters
+
+
+@pytest.fixture(scope='module')
+def dataset(natural_images):
+    return torch.utils.data.TensorDataset(natural_images(8, 128), torch.arange(8))
+
+
+def collate_args(**kwargs):
+    args = dict(worker_wt=True, patch_size=16, wt_fn='bior2.2', wt_backend=None, worker_threads=1, workers=0,
+                device=torch.device('cpu'))
+    args.update(kwargs)
+
+    return types.SimpleNamespace(**args)
+
+
+# The coefficients of the batch are those the train loops compute on the device, for the wavelet and backend passed
+@pytest.mark.parametrize('wt_fn, backend', (('bior2.2', None), ('bior2.2', 'separable'), ('haar', 'haar')))
+def test_collate(dataset, wt_fn, backend):
+    batch = [dataset[i] for i in range(4)]
+    data, coeffs = WTCollate(64, 16, wt_fn, backend)(batch)
+
+    assert torch.equal(data, torch.stack([img for img, _ in batch]))
+    assert torch.equal(coeffs, wt_pyramid(data, get_filters(wt_fn), 64, 16, backend=backend))
+    assert not data.is_pinned() and not coeffs.is_pinned()
+
+
+# Same batches from the workers as from the main process
+@pytest.mark.parametrize('workers', (0, 2))
+def test_collate_loader(dataset, workers):
+    loader = torch.utils.data.DataLoader(dataset, batch_size=4, num_workers=workers,
+                                         collate_fn=create_collate_fn(collate_args(workers=workers), 64))
+
+    for data, coeffs in loader:
+        assert torch.equal(coeffs, wt_pyramid(data, get_filters('bior2.2'), 64, 16))
+
+
+def test_create_collate_fn():
+    assert create_collate_fn(collate_args(worker_wt=False), 64) is None
+    assert not create_collate_fn(collate_args(), 64).pin_memory
+    assert create_collate_fn(collate_args(device=torch.device('cuda')), 64).pin_memory
+    assert not create_collate_fn(collate_args(device=torch.device('cuda'), workers=4), 64).pin_memory
@@ -0,0 +1,67 @@
+import sys
+
+import pytest
+import torch
+
+from filter_bank import get_filters, get_inv_filters, clear_filter_cache, set_filter_cache_dir
+
+pywt = pytest.importorskip('pywt')
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    clear_filter_cache()
+    yield
+    set_filter_cache_dir(None)
+    clear_filter_cache()
+
+
+# create_filters/create_inv_filters of wt_utils as they were before the registry
+def outer_filters(lo, hi):
+    return torch.stack([lo.unsqueeze(0)*lo.unsqueeze(1), lo.unsqueeze(0)*hi.unsqueeze(1),
+                        hi.unsqueeze(0)*lo.unsqueeze(1), hi.unsqueeze(0)*hi.unsqueeze(1)], dim=0)
+
+
+@pytest.mark.parametrize('wt_fn', ('bior2.2', 'haar', 'db2'))
+def test_filters(wt_fn):
+    w = pywt.Wavelet(wt_fn)
+
+    assert torch.equal(get_filters(wt_fn), outer_filters(torch.Tensor(w.dec_lo[::-1]), torch.Tensor(w.dec_hi[::-1])))
+    assert torch.equal(get_inv_filters(wt_fn), outer_filters(torch.Tensor(w.rec_lo), torch.Tensor(w.rec_hi)))
+
+
+# One tensor per (kind, wavelet, device, dtype), shared by every caller
+def test_registry():
+    filters = get_filters('bior2.2')
+
+    assert get_filters('bior2.2', 'cpu') is filters
+    assert get_filters('bior2.2', torch.device('cpu')) is filters
+    assert get_inv_filters('bior2.2') is not filters
+    assert get_filters('haar') is not filters
+    half = get_filters('bior2.2', dtype=torch.float16)
+    assert half.dtype == torch.float16 and half is get_filters('bior2.2', dtype=torch.float16)
+    assert torch.equal(half, filters.half())
+
+
+# Cached filters modified in place are an error, not a silent change of every transform
+def test_modified_in_place():
+    get_filters('bior2.2').mul_(2)
+
+    with pytest.raises(RuntimeError):
+        get_filters('bior2.2')
+    clear_filter_cache()
+    assert torch.equal(get_filters('bior2.2'), outer_filters(torch.Tensor(pywt.Wavelet('bior2.2').dec_lo[::-1]),
+                                                             torch.Tensor(pywt.Wavelet('bior2.2').dec_hi[::-1])))
+
+
+# With a cache directory the taps are read from disk, pywt is only needed the first time
+def test_cache_dir(tmp_path, monkeypatch):
+    set_filter_cache_dir(str(tmp_path))
+    filters = get_filters('bior2.2').clone()
+    assert (tmp_path / 'wavelet_bior2.2.pt').exists()
+
+    clear_filter_cache()
+    monkeypatch.setitem(sys.modules, 'pywt', None)
+    assert torch.equal(get_filters('bior2.2'), filters)
+    with pytest.raises(ImportError):
+        get_filters('haar')
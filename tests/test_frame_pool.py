@@ -0,0 +1,77 @@
+import importlib
+
+import pytest
+import torch
+
+from frame_pool import FramePool, new_frame
+
+
+@pytest.fixture(scope='module')
+def wt_utils():
+    for module in ('matplotlib', 'IPython'):
+        pytest.importorskip(module)
+
+    return importlib.import_module('wt_utils')
+
+
+################# FRAME POOL #################
+
+# After the first step the same frames are handed out again and nothing is allocated
+def test_steady_state():
+    pool = FramePool(pin_memory=False)
+    shapes = [(2, 3, 64, 64), (2, 3, 64, 64), (2, 12, 32, 32)]
+
+    first = [pool.empty(shape) for shape in shapes]
+    assert pool.step() == (3, 4 * (2 * 2*3*64*64 + 2*12*32*32))
+    for _ in range(3):
+        frames = [pool.empty(shape) for shape in shapes]
+        assert [f.data_ptr() for f in frames] == [f.data_ptr() for f in first]
+        assert pool.step() == (0, 0)
+
+    assert pool.warm_allocations == 0
+    assert first[0].data_ptr() != first[1].data_ptr()
+
+
+def test_keys():
+    pool = FramePool(pin_memory=False)
+
+    assert pool.empty((4,)).data_ptr() != pool.empty((4,), dtype=torch.float64).data_ptr()
+    assert pool.zeros((4, 4)).eq(0).all()
+    x = torch.randn(3)
+    assert pool.copy(x) is x
+    pool.step()
+    frame = pool.empty((4, 4))
+    frame.fill_(1)
+    assert pool.step() == (0, 0)
+    assert pool.zeros((4, 4)).eq(0).all()
+
+
+def test_new_frame():
+    pool = FramePool(pin_memory=False)
+
+    assert new_frame((2, 2), torch.float32, 'cpu', zero=True).eq(0).all()
+    frame = new_frame((2, 2), torch.float32, 'cpu', pool)
+    pool.step()
+    assert new_frame((2, 2), torch.float32, 'cpu', pool).data_ptr() == frame.data_ptr()
+
+
+################# HELPERS #################
+
+# The collate/pad helpers give the same frames with a pool as without, batch after batch (stale frames are overwritten)
+def test_helpers(wt_utils):
+    pool = FramePool(pin_memory=False)
+    generator = torch.Generator().manual_seed(0)
+
+    for _ in range(3):
+        img = torch.randn(2, 3, 32, 32, generator=generator)
+        quads = [torch.randn(2, 3, 16, 16, generator=generator) for _ in range(4)]
+        channels = torch.randn(2, 48, 8, 8, generator=generator)
+
+        assert torch.equal(wt_utils.zero_pad(img, 64, pool=pool), wt_utils.zero_pad(img, 64))
+        assert torch.equal(wt_utils.collate_patches_to_img(*quads, pool=pool), wt_utils.collate_patches_to_img(*quads))
+        assert torch.equal(wt_utils.collate_patches_to_img(None, *quads[1:], pool=pool),
+                           wt_utils.collate_patches_to_img(None, *quads[1:]))
+        assert torch.equal(wt_utils.collate_16_channels_to_img(channels, pool=pool), wt_utils.collate_16_channels_to_img(channels))
+        pool.step()
+
+    assert pool.warm_allocations == 0
@@ -0,0 +1,60 @@
+import pytest
+import torch
+import torch.nn.functional as F
+
+pytest.importorskip('torchvision')
+from losses import MultiPatchMSELoss
+
+
+# The per-patch loop of the train scripts on the packed decoder output (B, 3 * patches * channels, patch, patch)
+def loop_loss(recon, real, channels=3):
+    bs = recon.shape[0]
+    recon_masks = [mask.reshape(bs, -1, channels, recon.shape[2], recon.shape[3]) for mask in recon.chunk(3, dim=1)]
+    real_masks = [mask.reshape(bs, -1, channels, real.shape[2], real.shape[3]) for mask in real.chunk(3, dim=1)]
+    loss = 0
+    for j in range(recon_masks[0].shape[1]):
+        for recon_patches, real_patches in zip(recon_masks, real_masks):
+            loss += F.mse_loss(recon_patches[:, j], real_patches[:, j])
+
+    return loss
+
+
+@pytest.mark.parametrize('bs, patches, patch', ((2, 4, 32), (3, 16, 32), (4, 16, 16), (2, 64, 16)))
+def test_matches_loop(bs, patches, patch):
+    generator = torch.Generator().manual_seed(0)
+    recon = torch.randn(bs, 3 * patches * 3, patch, patch, generator=generator, requires_grad=True)
+    real = torch.randn(bs, 3 * patches * 3, patch, patch, generator=generator)
+    criterion = MultiPatchMSELoss()
+
+    loss = criterion(recon, real)
+    grad, = torch.autograd.grad(loss, recon)
+    ref = loop_loss(recon, real)
+    ref_grad, = torch.autograd.grad(ref, recon)
+
+    assert torch.equal(loss, ref)
+    assert torch.allclose(grad, ref_grad)
+    assert torch.allclose(criterion.band_losses(), criterion.patch_losses.sum(dim=1))
+    assert not criterion.band_losses().requires_grad
+
+
+# A channels_last decoder output (grouped backend, Conv2d on channels_last inputs) is not viewable as patches
+def test_channels_last():
+    generator = torch.Generator().manual_seed(0)
+    conv = torch.nn.Conv2d(8, 3 * 4 * 3, 3, padding=1).to(memory_format=torch.channels_last)
+    x = torch.randn(2, 8, 32, 32, generator=generator).contiguous(memory_format=torch.channels_last)
+    recon = conv(x)
+    real = torch.randn(recon.shape, generator=generator)
+
+    assert not recon.is_contiguous()
+    assert torch.allclose(MultiPatchMSELoss()(recon, real), loop_loss(recon, real))
+
+
+def test_weights():
+    generator = torch.Generator().manual_seed(0)
+    recon = torch.randn(2, 3 * 4 * 3, 16, 16, generator=generator)
+    real = torch.randn(2, 3 * 4 * 3, 16, 16, generator=generator)
+    criterion = MultiPatchMSELoss(band_weights=(1., 2., 3.), patch_weights=(1., 0., 1., 0.5))
+    loss = criterion(recon, real)
+    weights = torch.tensor([1., 2., 3.])[:, None] * torch.tensor([1., 0., 1., 0.5])[None]
+
+    assert torch.allclose(loss, (criterion.patch_losses * weights).sum())
@@ -0,0 +1,87 @@
+import pytest
+import torch
+
+from filter_bank import get_filters
+from wt_packets import wt_packets, packets_wt, packets_pyramid, packets_128_3quads
+from wt_augment import invert_packets, flip_coeffs, transpose_coeffs, rot90_coeffs, CoeffAugment
+
+# The augmentations of cached coefficients against the transform of the augmented images (transform-then-augment against
+# augment-then-transform), on 1/f images. The coefficients reach a few units at 3 levels, TOL is a few float32 ulps of them
+TOL = 2e-5
+SIZE = 128
+LAYOUTS = {
+    'wt': packets_wt(3),
+    'pyramid': packets_pyramid(SIZE, None, 32),
+    '3quads': packets_128_3quads(SIZE, 3),
+}
+
+# The 8 flips/rotations of the square on the pixels
+DIHEDRAL = [lambda x, k=k, flip=flip: torch.rot90(x.flip(-1) if flip else x, k, (-2, -1)) for k in range(4) for flip in (False, True)]
+
+
+@pytest.fixture(scope='module')
+def images(natural_images):
+    return natural_images(4, SIZE)
+
+
+@pytest.fixture(scope='module')
+def filters():
+    return get_filters('bior2.2')
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_invert_packets(images, filters, layout):
+    spec = LAYOUTS[layout]
+
+    assert (invert_packets(wt_packets(images, filters, spec), filters, spec) - images).abs().max().item() < 1e-5
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+@pytest.mark.parametrize('dim', (-1, -2))
+def test_flip(images, filters, layout, dim):
+    spec = LAYOUTS[layout]
+    res = flip_coeffs(wt_packets(images, filters, spec), filters, spec, dim)
+
+    assert (res - wt_packets(images.flip(dim), filters, spec)).abs().max().item() < TOL
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+@pytest.mark.parametrize('k', (1, 2, 3))
+def test_rot90(images, filters, layout, k):
+    spec = LAYOUTS[layout]
+    res = rot90_coeffs(wt_packets(images, filters, spec), filters, spec, k)
+
+    assert (res - wt_packets(torch.rot90(images, k, (-2, -1)), filters, spec)).abs().max().item() < TOL
+
+
+# Transposes are exact on every layout, cropped ones included
+@pytest.mark.parametrize('spec', list(LAYOUTS.values()) + [packets_pyramid(SIZE, SIZE // 2, 16)])
+def test_transpose(images, filters, spec):
+    res = transpose_coeffs(wt_packets(images, filters, spec), spec)
+
+    assert (res - wt_packets(images.transpose(-2, -1), filters, spec)).abs().max().item() < TOL
+
+
+# Cropped layouts dropped the sub-bands a flip needs: flipping them is an error, not an approximation
+def test_cropped_flip_raises(images, filters):
+    spec = packets_pyramid(SIZE, SIZE // 2, 16)
+    Y = wt_packets(images, filters, spec)
+
+    with pytest.raises(ValueError):
+        flip_coeffs(Y, filters, spec)
+    with pytest.raises(ValueError):
+        CoeffAugment(filters, spec)
+    assert CoeffAugment(filters, spec, p_flip=0)(Y).shape == Y.shape
+
+
+# Every augmented image is the transform of one of the 8 flips/rotations of its image
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_coeff_augment(images, filters, layout):
+    spec = LAYOUTS[layout]
+    images = images.repeat(4, 1, 1, 1)
+    res = CoeffAugment(filters, spec)(wt_packets(images, filters, spec), torch.Generator().manual_seed(0))
+    targets = torch.stack([wt_packets(op(images), filters, spec) for op in DIHEDRAL])
+    errors = (res[None] - targets).abs().flatten(2).amax(dim=2)
+
+    assert (errors.amin(dim=0) < TOL).all()
+    assert len(set(errors.argmin(dim=0).tolist())) > 1
@@ -0,0 +1,51 @@
+import pytest
+import torch
+
+from wt_engine import wt, iwt, available_wt_backends
+from filter_bank import get_filters, get_inv_filters
+
+# wt/iwt differentiate through WTFunction/IWTFunction, whose backward is the adjoint transform: gradcheck compares it with
+# the numerical Jacobian of the forward, so a wrong adjoint (padding, crop, filter order) fails here
+
+LEVELS = (1, 2, 3)
+
+
+def _filters(backend):
+    wt_fn = 'haar' if backend == 'haar' else 'bior2.2'
+
+    return get_filters(wt_fn, dtype=torch.float64), get_inv_filters(wt_fn, dtype=torch.float64)
+
+
+@pytest.mark.parametrize('backend', available_wt_backends())
+@pytest.mark.parametrize('levels', LEVELS)
+def test_wt_gradcheck(backend, levels):
+    filters, _ = _filters(backend)
+    x = torch.rand(1, 2, 16, 16, dtype=torch.float64, requires_grad=True)
+
+    assert torch.autograd.gradcheck(lambda v: wt(v, filters, levels, backend), (x,))
+
+
+@pytest.mark.parametrize('backend', available_wt_backends())
+@pytest.mark.parametrize('levels', LEVELS)
+def test_iwt_gradcheck(backend, levels):
+    _, inv_filters = _filters(backend)
+    x = torch.rand(1, 2, 16, 16, dtype=torch.float64, requires_grad=True)
+
+    assert torch.autograd.gradcheck(lambda v: iwt(v, inv_filters, levels, backend), (x,))
+
+
+# The graph of wt/iwt holds the filters and nothing else: no padded input, conv input or intermediate level
+@pytest.mark.parametrize('backend', available_wt_backends())
+@pytest.mark.parametrize('levels', LEVELS)
+@pytest.mark.parametrize('inverse', (False, True))
+def test_no_saved_activations(backend, levels, inverse):
+    filters, inv_filters = _filters(backend)
+    x = torch.rand(2, 3, 32, 32, dtype=torch.float64, requires_grad=True)
+    saved = []
+
+    with torch.autograd.graph.saved_tensors_hooks(lambda t: saved.append(t) or t, lambda t: t):
+        y = iwt(x, inv_filters, levels, backend) if inverse else wt(x, filters, levels, backend)
+
+    assert y.grad_fn is not None
+    assert all(t.data_ptr() == (inv_filters if inverse else filters).data_ptr() for t in saved)
+    assert sum(t.numel() for t in saved) < x.numel()
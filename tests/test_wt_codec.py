@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import torch
+
+from wt_engine import wt
+from wt_codec import (CODEC_BITS, subband_rects, quantize_coeffs, pack_bits, unpack_bits, encode_coeffs, decode_coeffs,
+                      compression_ratio, CoeffFile, iter_coeffs)
+from filter_bank import get_filters
+
+LEVELS = 3
+
+
+@pytest.fixture(scope='module')
+def coeffs(natural_images):
+    return wt(natural_images(2, 128), get_filters('bior2.2'), LEVELS)
+
+
+################# SPARSE CODING #################
+
+# Lengths that are not multiples of 8 are padded with zero bits and cut back on unpacking
+@pytest.mark.parametrize('length', (1, 8, 13, 64, 1001))
+def test_pack_bits(length):
+    mask = torch.rand(3, length, generator=torch.Generator().manual_seed(length)) < 0.3
+    packed = pack_bits(mask)
+
+    assert packed.shape == (3, -(-length // 8)) and packed.dtype == torch.uint8
+    assert torch.equal(unpack_bits(packed, length), mask)
+    # bit i of byte j is element 8j + i
+    assert torch.equal(pack_bits(torch.tensor([[True] + [False] * 8 + [True]])), torch.tensor([[1, 2]], dtype=torch.uint8))
+
+
+################# CODEC #################
+
+# Every coefficient within half a quantization step of its sub-band (plus the float rounding of the dequantization) of the
+# float coefficients stored before the codec
+@pytest.mark.parametrize('bits', CODEC_BITS)
+def test_round_trip(coeffs, bits):
+    code = encode_coeffs(coeffs, LEVELS, bits)
+    Y = decode_coeffs(code)
+    _, scale, _ = quantize_coeffs(coeffs, LEVELS, bits)
+
+    assert Y.shape == coeffs.shape
+    for band, (top, left, h, w) in enumerate(subband_rects(coeffs.size(2), coeffs.size(3), LEVELS)):
+        err = (Y - coeffs)[:, :, top:top+h, left:left+w].abs().amax((2, 3))
+        assert (err <= scale[:, :, band] / 2 + 1e-6).all()
+
+
+# HF coefficients below the threshold are dropped, the LL band is kept, and the masks compress
+def test_threshold(coeffs):
+    threshold = 1e-2
+    Y = decode_coeffs(encode_coeffs(coeffs, LEVELS, 8, threshold))
+    ll = coeffs.size(2) >> LEVELS
+    hf = torch.ones_like(coeffs, dtype=torch.bool)
+    hf[:, :, :ll, :ll] = False
+
+    assert (Y[hf & (coeffs.abs() < threshold)] == 0).all()
+    assert (Y[:, :, :ll, :ll] != 0).any()
+    assert compression_ratio(encode_coeffs(coeffs, LEVELS, 8, threshold)) > compression_ratio(encode_coeffs(coeffs, LEVELS, 8))
+
+
+# levels=0 stores pixels (the TL patches) as a single band
+def test_pixels(natural_images):
+    img = natural_images(2, 64)
+
+    assert (decode_coeffs(encode_coeffs(img, 0, 16)) - img).abs().max().item() < 1e-4
+
+
+################# STORAGE #################
+
+# CoeffFile in place of the h5py datasets of the evals: numpy batches written by slice, decoded back in order
+def test_coeff_file(coeffs, tmp_path):
+    f = CoeffFile(str(tmp_path / 'masks'), LEVELS, 16)
+    dataset = f.create_dataset('data', coeffs.shape, dtype=np.float32)
+    dataset[0:1] = coeffs[:1].numpy()
+    dataset[1:2] = coeffs[1:].numpy()
+    f.close()
+
+    batches = list(iter_coeffs(str(tmp_path / 'masks')))
+    assert len(batches) == 2
+    for i, Y in enumerate(batches):
+        assert torch.equal(Y, decode_coeffs(encode_coeffs(coeffs[i:i+1], LEVELS, 16)))
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import torch
+
+from wt_engine import wt, iwt, available_wt_backends
+from filter_bank import get_filters, get_inv_filters
+
+# The wt/iwt backends against the dense transforms they replace, in float32 on 1/f images
+TOL = 1e-5
+SIZE = 128
+
+
+@pytest.fixture(scope='module')
+def images(natural_images):
+    return natural_images(2, SIZE)
+
+
+def max_diff(a, b):
+    return (torch.as_tensor(np.asarray(a)) - b).abs().max().item()
+
+
+@pytest.mark.parametrize('backend', available_wt_backends())
+@pytest.mark.parametrize('levels', (1, 2, 3))
+def test_backends(images, backend, levels):
+    wt_fn = 'haar' if backend == 'haar' else 'bior2.2'
+    filters = get_filters(wt_fn)
+    inv_filters = get_inv_filters(wt_fn)
+    ref_backend = 'haar' if backend == 'haar' else 'dense'
+    Y = wt(images, filters, levels, ref_backend)
+
+    assert max_diff(wt(images, filters, levels, backend), Y) < TOL
+    assert max_diff(iwt(Y, inv_filters, levels, backend), iwt(Y, inv_filters, levels, ref_backend)) < TOL
+
+
+# The grouped backend on channels_last inputs (the layout it converts to for its convs): same coefficients and pixels as the
+# dense backend, in the memory format of the input
+@pytest.mark.parametrize('levels', (1, 3))
+def test_grouped_channels_last(images, levels):
+    filters = get_filters('bior2.2')
+    inv_filters = get_inv_filters('bior2.2')
+    x = images.contiguous(memory_format=torch.channels_last)
+    Y = wt(x, filters, levels, 'grouped')
+    recon = iwt(Y, inv_filters, levels, 'grouped')
+
+    assert Y.is_contiguous(memory_format=torch.channels_last) and recon.is_contiguous(memory_format=torch.channels_last)
+    assert max_diff(Y, wt(images, filters, levels, 'dense')) < TOL
+    assert max_diff(recon, iwt(Y.contiguous(), inv_filters, levels, 'dense')) < TOL
@@ -0,0 +1,53 @@
+import pytest
+import torch
+
+from wt_engine import wt, iwt
+from wt_packets import wt_packets, iwt_packets, packets_wt, packets_128_3quads, packets_256_3quads
+from wt_modules import WaveletTransform, InverseWaveletTransform
+from filter_bank import get_filters, get_inv_filters
+
+# The modules (eager and scripted) against the functional transforms of each layout, in float32 on 1/f images
+TOL = 1e-5
+
+# layout => (levels, image size, spec of wt_packets)
+LAYOUTS = {
+    'plain': (3, 128, packets_wt(3)),
+    '128_3quads': (2, 128, packets_128_3quads(128, 2)),
+    '256_3quads': (3, 256, packets_256_3quads(256, 3)),
+}
+
+
+def max_diff(a, b):
+    return (a - b).abs().max().item()
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_modules(natural_images, layout):
+    levels, size, spec = LAYOUTS[layout]
+    images = natural_images(2, size)
+    Y = wt_packets(images, get_filters('bior2.2'), spec)
+    recon = iwt_packets(Y, get_inv_filters('bior2.2'), spec)
+    module = WaveletTransform(levels, layout=layout)
+    inv_module = InverseWaveletTransform(levels, layout=layout)
+
+    for m in (module, torch.jit.script(module)):
+        assert max_diff(m(images), Y) < TOL
+    for m in (inv_module, torch.jit.script(inv_module)):
+        assert max_diff(m(Y), recon) < TOL
+
+
+# The filters follow .to() and are left out of the checkpoints
+def test_buffers(natural_images):
+    images = natural_images(2, 64).double()
+    module = WaveletTransform(2).to(torch.float64)
+
+    assert module.filters.dtype == torch.float64
+    assert max_diff(module(images), wt(images, get_filters('bior2.2').double(), 2)) < 1e-12
+    assert 'filters' not in module.state_dict()
+    assert 'inv_filters' not in InverseWaveletTransform(2).state_dict()
+    assert max_diff(InverseWaveletTransform(2)(images.float()), iwt(images.float(), get_inv_filters('bior2.2'), 2)) < TOL
+
+
+def test_unknown_layout():
+    with pytest.raises(ValueError):
+        WaveletTransform(2, layout='64_3quads')
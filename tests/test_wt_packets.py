@@ -0,0 +1,93 @@
+import pytest
+import torch
+
+from wt_engine import wt, iwt
+from wt_packets import wt_packets, iwt_packets, iwt_upsample, packets_wt, packets_crop, packets_128_3quads, LOWPASS_CACHE_SIZE, _LOWPASS
+from filter_bank import get_filters, get_inv_filters
+
+# The packet engine against the chains of wt/iwt calls it replaces, in float32 on 1/f images. The default paths run the
+# same convs on the same inputs and are bit-identical, the fused low-pass cascades are within TOL
+TOL = 1e-5
+SIZE = 128
+
+
+@pytest.fixture(scope='module')
+def images(natural_images):
+    return natural_images(2, SIZE)
+
+
+################# PACKET WT #################
+
+@pytest.mark.parametrize('levels', (1, 2, 3))
+def test_packets_wt(images, levels):
+    filters = get_filters('bior2.2')
+
+    assert torch.equal(wt_packets(images, filters, packets_wt(levels)), wt(images, filters, levels))
+
+
+# wt_128_3quads as the chain of wt calls it replaced: the levels WT cropped to 128, then one more level on the 3 high
+# quadrants, bit-identical
+def test_packets_128_3quads(natural_images):
+    filters = get_filters('bior2.2')
+    images = natural_images(2, 256)
+    spec = packets_128_3quads(256, 3)
+    chain = wt(images, filters, 3)[:, :, :128, :128]
+    for top, left in ((0, 64), (64, 0), (64, 64)):
+        chain[:, :, top:top+64, left:left+64] = wt(chain[:, :, top:top+64, left:left+64], filters)
+
+    assert torch.equal(wt_packets(images, filters, spec), chain)
+
+
+# Inverse of the 128_3quads layout as apply_iwt_quads_128 did it: one level inverted on the 3 high quadrants, then a 2
+# level iwt of the whole, bit-identical
+def test_iwt_packets_128_3quads(images):
+    inv_filters = get_inv_filters('bior2.2')
+    spec = packets_128_3quads(SIZE, 2)
+    Y = wt_packets(images, get_filters('bior2.2'), spec)
+    chain = Y.clone()
+    for top, left in ((0, 64), (64, 0), (64, 64)):
+        chain[:, :, top:top+64, left:left+64] = iwt(chain[:, :, top:top+64, left:left+64], inv_filters)
+
+    assert torch.equal(iwt_packets(Y, inv_filters, spec), iwt(chain, inv_filters, 2))
+
+
+################# PARTIAL FORWARD #################
+
+# Top-left corner of a plain WT (wt_crop, the TL patches of eval_tl): bit-identical to the crop of wt by default, the fused
+# low-pass cascade within TOL
+@pytest.mark.parametrize('corner', (SIZE // 4, SIZE // 2))
+def test_wt_crop(images, corner):
+    filters = get_filters('bior2.2')
+    levels = 3
+    crop = (SIZE // corner).bit_length() - 1
+    spec = packets_crop(packets_wt(levels - crop), crop)
+    ref = wt(images, filters, levels)[:, :, :corner, :corner]
+
+    assert torch.equal(wt_packets(images, filters, spec), ref)
+    assert (wt_packets(images, filters, spec, fused=True) - ref).abs().max().item() < TOL
+
+
+################# SPARSE INVERSE #################
+
+# iwt of the top-left corner of a plain WT against iwt of the zero padded frame (the low images of the train/eval loops)
+@pytest.mark.parametrize('corner', (SIZE // 4, SIZE // 2))
+def test_iwt_lowpass(images, corner):
+    inv_filters = get_inv_filters('bior2.2')
+    levels = 3
+    crop = (SIZE // corner).bit_length() - 1
+    Y = wt(images, get_filters('bior2.2'), levels)[:, :, :corner, :corner]
+    spec = packets_crop(packets_wt(levels - crop), crop)
+    padded = iwt(torch.nn.functional.pad(Y, (0, SIZE - corner, 0, SIZE - corner)), inv_filters, levels)
+
+    assert torch.equal(iwt_packets(Y, inv_filters, spec), padded)
+    assert (iwt_packets(Y, inv_filters, spec, fused=True) - padded).abs().max().item() < TOL
+    assert (iwt_upsample(Y, inv_filters, crop) - iwt(torch.nn.functional.pad(Y, (0, SIZE - corner, 0, SIZE - corner)),
+                                                     inv_filters, crop)).abs().max().item() < TOL
+
+
+# Re-created filters do not grow the cascade cache past its bound
+def test_lowpass_cache_bound(images):
+    for _ in range(LOWPASS_CACHE_SIZE + 4):
+        iwt_upsample(images[:, :, :16, :16], get_inv_filters('bior2.2').clone(), 2)
+
+    assert len(_LOWPASS) <= LOWPASS_CACHE_SIZE
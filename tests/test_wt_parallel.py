@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+import pytest
+import torch
+
+from wt_engine import wt, iwt
+from wt_parallel import WTExecutor
+from filter_bank import get_filters, get_inv_filters
+
+TOL = 1e-5
+
+
+@pytest.fixture(scope='module')
+def images(natural_images):
+    return natural_images(8, 64)
+
+
+def test_executor(images):
+    filters = get_filters('bior2.2')
+    inv_filters = get_inv_filters('bior2.2')
+    Y = wt(images, filters, 3)
+
+    with WTExecutor(2, intra_threads=1, min_shard=1) as executor:
+        assert (executor.wt(images, filters, 3) - Y).abs().max().item() < TOL
+        assert (executor.iwt(Y, inv_filters, 3) - iwt(Y, inv_filters, 3)).abs().max().item() < TOL
+
+
+# Grad mode is per thread: the shards must not see the caller's grad mode on inputs requiring grad
+def test_executor_requires_grad(images):
+    filters = get_filters('bior2.2')
+    x = images.clone().requires_grad_()
+
+    with WTExecutor(4) as executor:
+        res = executor.wt(x, filters, 2)
+
+    assert not res.requires_grad
+    assert (res - wt(images, filters, 2)).abs().max().item() < TOL
+
+
+# Every shard runs on its own pool thread at intra_threads, all at the same time, and the caller's thread count is kept
+def test_executor_threads(images):
+    workers = 4
+    barrier = threading.Barrier(workers, timeout=10)
+    seen = []
+    threads = torch.get_num_threads()
+
+    def shard(x, out):
+        seen.append((threading.get_ident(), torch.get_num_threads()))
+        barrier.wait()
+        out.copy_(x)
+
+    with WTExecutor(workers, intra_threads=1) as executor:
+        assert torch.equal(executor.map(shard, images, torch.empty_like(images)), images)
+
+    assert len(set(ident for ident, _ in seen)) == workers
+    assert all(count == 1 for _, count in seen)
+    assert torch.get_num_threads() == threads
+
+
+# 1 => N cores: the sharded wt is faster than a single worker once there are cores to run the shards on
+@pytest.mark.skipif((os.cpu_count() or 1) < 4, reason='needs 4 cores')
+def test_executor_scaling(natural_images):
+    filters = get_filters('bior2.2')
+    images = natural_images(32, 256)
+
+    def run_time(workers):
+        with WTExecutor(workers, intra_threads=1) as executor:
+            executor.wt(images, filters, 3)
+            start = time.perf_counter()
+            for _ in range(3):
+                executor.wt(images, filters, 3)
+            return time.perf_counter() - start
+
+    assert run_time(1) / run_time(4) > 1.5
@@ -0,0 +1,33 @@
+import pytest
+import torch
+
+from wt_engine import wt
+from wt_reversible import wt_int, iwt_int, int_to_float_coeffs
+from filter_bank import get_filters
+
+TOL = 1e-5
+
+
+@pytest.fixture(scope='module')
+def pixels(natural_images):
+    return torch.round(natural_images(2, 128) * 255).to(torch.uint8)
+
+
+@pytest.mark.parametrize('levels', (1, 3))
+def test_lossless(pixels, levels):
+    coeffs = wt_int(pixels, levels)
+
+    assert torch.equal(iwt_int(coeffs, levels), pixels)
+    assert (int_to_float_coeffs(coeffs, get_filters('bior2.2'), levels) -
+            wt(pixels.float() / 255, get_filters('bior2.2'), levels)).abs().max().item() < TOL
+
+
+# The in-place lifting must not run on the caller's pixels, whatever their integer dtype
+@pytest.mark.parametrize('dtype', (torch.uint8, torch.int16, torch.int32), ids=lambda dtype: str(dtype).split('.')[1])
+def test_input_unchanged(pixels, dtype):
+    img = pixels.to(dtype)
+    saved = img.clone()
+    coeffs = wt_int(img, 1)
+
+    assert torch.equal(img, saved)
+    assert torch.equal(iwt_int(coeffs, 1, dtype=dtype), saved)
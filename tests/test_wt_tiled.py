@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import torch
+
+from wt_engine import wt, iwt
+from wt_tiled import wt_tiled, iwt_tiled, iwt_roi
+from filter_bank import get_filters, get_inv_filters
+
+# The tiled transforms against the untiled wt/iwt, in float32 on 1/f images
+TOL = 1e-5
+SIZE = 128
+
+
+@pytest.fixture(scope='module')
+def images(natural_images):
+    return natural_images(2, SIZE)
+
+
+def max_diff(a, b):
+    return (torch.as_tensor(np.asarray(a)) - b).abs().max().item()
+
+
+################# TILED #################
+
+# In-memory tensors, and memmaps for the source, the output and the scratch LL bands, with tiles that do not divide the
+# levels (halos crossing the image borders and partial tiles)
+@pytest.mark.parametrize('memmap', (False, True))
+@pytest.mark.parametrize('tile', (16, 24, 256))
+def test_tiled(images, tmp_path, memmap, tile):
+    filters = get_filters('bior2.2')
+    inv_filters = get_inv_filters('bior2.2')
+    Y = wt(images, filters, 3)
+    src = images
+    coeffs = Y
+    out = None
+    if memmap:
+        shape = tuple(images.shape)
+        np.save(str(tmp_path / 'src.npy'), images.numpy())
+        np.save(str(tmp_path / 'coeffs.npy'), Y.numpy())
+        src = np.load(str(tmp_path / 'src.npy'), mmap_mode='r')
+        coeffs = np.load(str(tmp_path / 'coeffs.npy'), mmap_mode='r')
+        out = np.lib.format.open_memmap(str(tmp_path / 'out.npy'), 'w+', np.float32, shape)
+
+    assert max_diff(wt_tiled(src, filters, 3, out=out, tile=tile), Y) < TOL
+    assert max_diff(iwt_tiled(coeffs, inv_filters, 3, out=out, tile=tile), iwt(Y, inv_filters, 3)) < TOL
+
+
+################# ROI #################
+
+# Centered squares of every size, rectangles and regions touching the borders: the crop of the full iwt
+@pytest.mark.parametrize('top, left, height, width', ((60, 60, 8, 8), (48, 48, 32, 32), (0, 0, SIZE, SIZE), (0, 0, 5, 7),
+                                                      (SIZE - 9, 3, 9, 40), (17, SIZE - 1, 30, 1)))
+@pytest.mark.parametrize('levels', (1, 3))
+def test_roi(images, top, left, height, width, levels):
+    inv_filters = get_inv_filters('bior2.2')
+    Y = wt(images, get_filters('bior2.2'), levels)
+    full = iwt(Y, inv_filters, levels)
+
+    assert max_diff(iwt_roi(Y, inv_filters, levels, top, left, height, width),
+                    full[:, :, top:top+height, left:left+width]) < TOL
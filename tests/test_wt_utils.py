@@ -0,0 +1,246 @@
+import importlib
+
+import pytest
+import torch
+
+for module in ('matplotlib', 'IPython'):
+    pytest.importorskip(module)
+from wt_utils import grid_to_patches, grid_to_channels, channels_to_grid, create_patches_from_grid, collate_channels_from_grid
+from wt_utils import create_patches_from_grid_16, collate_patches_to_img, collate_channels_to_img, collate_16_channels_to_img
+from wt_utils import split_masks_from_channels, collate_patches_256, iwt_patches_256
+from wt_utils import zero_pad, wt_pyramid, iwt_pyramid, apply_iwt_quads_128, get_4masks, CoefficientPyramid
+from wt_engine import wt, iwt
+from wt_packets import pyramid_levels, packets_pyramid, packets_masks, create_packet_synthesis
+from frame_pool import FramePool
+from filter_bank import get_filters, get_inv_filters
+
+# wt_utils against the slicing/chain code it replaced, kept in bench_wt as the benchmark baselines. Layouts are copies
+# and bit-identical, the fused reconstructions are within TOL of the chains
+TOL = 1e-5
+
+
+# bench_wt imports losses, which needs torchvision
+@pytest.fixture(scope='module')
+def bench_wt():
+    pytest.importorskip('torchvision')
+
+    return importlib.import_module('bench_wt')
+
+
+################# LAYOUTS #################
+
+@pytest.mark.parametrize('depth', (1, 2, 3))
+def test_grid_to_patches(bench_wt, depth):
+    data = torch.randn(2, 3, 64, 64)
+    patches = grid_to_patches(data, depth)
+
+    assert patches.shape == (2, 4**depth, 3, 64 >> depth, 64 >> depth)
+    assert torch.equal(patches, bench_wt.grid_to_patches_sliced(data, depth))
+    assert torch.equal(grid_to_channels(data, depth), patches.flatten(1, 2))
+
+
+@pytest.mark.parametrize('depth', (1, 2, 3))
+def test_channels_to_grid(bench_wt, depth):
+    channels = torch.randn(2, 3 * 4**depth, 8, 8)
+    grid = channels_to_grid(channels, depth)
+
+    assert grid.shape == (2, 3, 8 << depth, 8 << depth)
+    assert torch.equal(grid, bench_wt.channels_to_grid_sliced(channels, depth))
+    assert torch.equal(grid_to_channels(grid, depth), channels)
+
+
+# The wrappers as the baseline quadrant slicing: stack/cat of (tl, tr, bl, br), 16 patches as the patches of each quadrant
+def test_grid_wrappers():
+    data = torch.randn(2, 3, 32, 32)
+    quads = (data[:, :, :16, :16], data[:, :, :16, 16:], data[:, :, 16:, :16], data[:, :, 16:, 16:])
+    patches_16 = torch.cat([torch.stack((q[:, :, :8, :8], q[:, :, :8, 8:], q[:, :, 8:, :8], q[:, :, 8:, 8:]), dim=1) for q in quads], dim=1)
+
+    assert torch.equal(create_patches_from_grid(data), torch.stack(quads, dim=1))
+    assert torch.equal(collate_channels_from_grid(data), torch.cat(quads, dim=1))
+    assert torch.equal(create_patches_from_grid_16(data), patches_16)
+    assert torch.equal(collate_channels_to_img(torch.cat(quads, dim=1)), data)
+    assert torch.equal(collate_16_channels_to_img(patches_16.flatten(1, 2)), data)
+
+
+################# RECONSTRUCTION #################
+
+@pytest.fixture(scope='module')
+def decoder_outputs():
+    generator = torch.Generator().manual_seed(0)
+
+    return torch.randn(2, 48, 32, 32, generator=generator), torch.randn(2, 144, 32, 32, generator=generator)
+
+
+# The frame of the eval loops before iwt_patches_256: the 64 grid, the 128 masks as quadrants, the 256 masks as 16 patches
+def test_collate_patches_256(decoder_outputs):
+    Y_128_patches, recon_mask_256_all = decoder_outputs
+    masks_128 = [collate_channels_to_img(mask) for mask in split_masks_from_channels(Y_128_patches[:, 12:])]
+    masks_256 = [collate_16_channels_to_img(mask) for mask in split_masks_from_channels(recon_mask_256_all)]
+    frame = collate_patches_to_img(collate_patches_to_img(collate_channels_to_img(Y_128_patches[:, :12]), *masks_128), *masks_256)
+
+    assert torch.equal(collate_patches_256(Y_128_patches, recon_mask_256_all), frame)
+
+
+def test_iwt_patches_256(bench_wt, decoder_outputs):
+    inv_filters = get_inv_filters('bior2.2')
+    Y_128_patches, recon_mask_256_all = decoder_outputs
+    chain = bench_wt.reconstruct_256_chain(Y_128_patches, recon_mask_256_all, inv_filters, 'cpu')
+
+    assert torch.allclose(iwt_patches_256(Y_128_patches, recon_mask_256_all, create_packet_synthesis(inv_filters)), chain, atol=TOL)
+
+
+################# PYRAMID #################
+
+QUADS = ((0, 1), (1, 0), (1, 1))
+
+
+# The packet tree of a quadrant as a chain of 1 level wt calls on each quadrant of the level above
+def tree_chain(x, filters, depth):
+    if depth == 0:
+        return x
+    x = wt(x, filters, levels=1)
+    h = x.shape[2] // 2
+    for r, c in ((0, 0),) + QUADS:
+        x[:, :, r*h:(r+1)*h, c*h:(c+1)*h] = tree_chain(x[:, :, r*h:(r+1)*h, c*h:(c+1)*h], filters, depth - 1)
+
+    return x
+
+
+def itree_chain(x, inv_filters, depth):
+    if depth == 0:
+        return x
+    x = x.clone()
+    h = x.shape[2] // 2
+    for r, c in ((0, 0),) + QUADS:
+        x[:, :, r*h:(r+1)*h, c*h:(c+1)*h] = itree_chain(x[:, :, r*h:(r+1)*h, c*h:(c+1)*h], inv_filters, depth - 1)
+
+    return iwt(x, inv_filters, levels=1)
+
+
+# wt_pyramid as the crop of a plain WT with the 3 outer quadrants of every corner split by tree_chain down to patch
+def pyramid_chain(img, filters, target, patch):
+    Y = wt(img, filters, pyramid_levels(img.shape[2], patch))[:, :, :target, :target]
+    h = target // 2
+    while h >= patch:
+        for r, c in QUADS:
+            Y[:, :, r*h:(r+1)*h, c*h:(c+1)*h] = tree_chain(Y[:, :, r*h:(r+1)*h, c*h:(c+1)*h], filters, (h // patch).bit_length() - 1)
+        h //= 2
+
+    return Y
+
+
+def ipyramid_chain(Y, inv_filters, size, patch):
+    Y = Y.clone()
+    h = patch
+    while h < Y.shape[2]:
+        for r, c in QUADS:
+            Y[:, :, r*h:(r+1)*h, c*h:(c+1)*h] = itree_chain(Y[:, :, r*h:(r+1)*h, c*h:(c+1)*h], inv_filters, (h // patch).bit_length() - 1)
+        h *= 2
+
+    return iwt(zero_pad(Y, size), inv_filters, levels=pyramid_levels(size, patch))
+
+
+@pytest.mark.parametrize('size, target, patch', ((128, 128, 32), (128, 64, 16), (256, 128, 16), (512, 256, 32), (512, 128, 32), (512, 512, 64)))
+def test_wt_pyramid(natural_images, size, target, patch):
+    filters = get_filters('bior2.2')
+    images = natural_images(1, size)
+
+    assert torch.equal(wt_pyramid(images, filters, target, patch), pyramid_chain(images, filters, target, patch))
+
+
+# The 256 layouts of the train/eval loops, at the sizes wt_128_3quads/wt_256_3quads take
+@pytest.mark.parametrize('size', (256, 512))
+def test_wt_pyramid_3quads(bench_wt, natural_images, size):
+    filters = get_filters('bior2.2')
+    images = natural_images(2, size)
+    levels = pyramid_levels(size, 32)
+
+    assert torch.equal(wt_pyramid(images, filters, 128), bench_wt.wt_128_3quads_chain(images, filters, levels))
+    if size == 256:
+        assert torch.equal(wt_pyramid(images, filters, 256), bench_wt.wt_256_3quads_chain(images, filters, levels))
+
+
+@pytest.mark.parametrize('size, target, patch', ((64, 64, 16), (128, 128, 32), (128, 64, 16), (256, 128, 16), (256, 256, 64),
+                                                (512, 256, 32), (512, 512, 64)))
+def test_iwt_pyramid(size, target, patch):
+    inv_filters = get_inv_filters('bior2.2')
+    Y = torch.randn(2, 3, target, target, generator=torch.Generator().manual_seed(0))
+
+    assert torch.equal(iwt_pyramid(Y, inv_filters, size, patch), ipyramid_chain(Y, inv_filters, size, patch))
+
+
+# A mask quadrant of the 256 masks (4 x 4 patches of 32) inverted at its own size, as the train loops did with
+# apply_iwt_quads_128; other patch sizes are the 4*patch cases of test_iwt_pyramid
+def test_iwt_pyramid_quads():
+    inv_filters = get_inv_filters('bior2.2')
+    quad = torch.randn(2, 3, 128, 128, generator=torch.Generator().manual_seed(0))
+
+    assert torch.equal(iwt_pyramid(quad, inv_filters, patch=32), apply_iwt_quads_128(quad, inv_filters))
+
+
+################# COEFFICIENT PYRAMID #################
+
+# The 3 outer quadrants of a corner, sliced as get_3masks does (without its squeeze)
+def sliced_masks(Y, size):
+    h = size // 2
+
+    return Y[:, :, :h, h:size], Y[:, :, h:size, :h], Y[:, :, h:size, h:size]
+
+
+def test_pyramid_views(natural_images):
+    filters = get_filters('bior2.2')
+    images = natural_images(2, 256)
+    Y = CoefficientPyramid.from_image(images, filters, packets_pyramid(256, 128))
+    data = Y.data.clone()
+
+    assert torch.equal(Y.data, wt_pyramid(images, filters, 128))
+    assert Y.size == 128
+    assert torch.equal(Y.corner(64), data[:, :, :64, :64])
+    assert torch.equal(Y.ll(2), data[:, :, :32, :32])
+    assert torch.equal(Y.subband(1, 1), data[:, :, :64, 64:])
+    assert torch.equal(Y.subband(1, 2), data[:, :, 64:, :64])
+    assert torch.equal(Y.subband(2, 3), data[:, :, 32:64, 32:64])
+    for mask, sliced in zip(Y.masks(64), sliced_masks(data, 64)):
+        assert torch.equal(mask, sliced)
+
+    # Views write through to the layout
+    Y.subband(2, 3).zero_()
+    Y.ll(2).fill_(1)
+    data[:, :, 32:64, 32:64] = 0
+    data[:, :, :32, :32] = 1
+    assert torch.equal(Y.data, data)
+
+
+# The decoder inputs as the train/eval loops sliced them: the 4 patches of the 64 corner, then the 128 level masks
+# split into patches (collate_channels_from_grid); the 256 level masks as 16 patches each
+@pytest.mark.parametrize('size, patch', ((256, 32), (512, 32), (256, 16)))
+def test_pyramid_channels(bench_wt, natural_images, size, patch):
+    filters = get_filters('bior2.2')
+    Y = CoefficientPyramid.from_image(natural_images(2, size), filters, packets_pyramid(size, 8*patch, patch))
+    data = Y.data
+    Y_64_patches = torch.cat(get_4masks(data[:, :, :2*patch, :2*patch], patch), dim=1)
+    masks_128 = [collate_channels_from_grid(mask) for mask in sliced_masks(data, 4*patch)]
+    masks_256 = [bench_wt.grid_to_patches_sliced(mask, 2).flatten(1, 2) for mask in sliced_masks(data, 8*patch)]
+
+    assert torch.equal(Y.channels(2*patch, patch), Y_64_patches)
+    assert torch.equal(Y.channels(4*patch, patch), torch.cat([Y_64_patches] + masks_128, dim=1))
+    assert torch.equal(Y.mask_channels(4*patch, patch), torch.cat(masks_128, dim=1))
+    assert torch.equal(Y.mask_channels(8*patch, patch), torch.cat(masks_256, dim=1))
+    assert Y.packets(8*patch, patch).shape == (2, 2, 2, 2, 2, 2, 2, 3, patch, patch)
+
+
+# Decoder outputs written in place read back unchanged, and invert as the eval chain that collated, inverted and
+# padded the quadrants one by one
+@pytest.mark.parametrize('size, target, patch', ((256, 128, 32), (256, 256, 32), (512, 256, 32), (256, 128, 16)))
+def test_pyramid_iwt(bench_wt, size, target, patch):
+    inv_filters = get_inv_filters('bior2.2')
+    generator = torch.Generator().manual_seed(0)
+    Y_corner = torch.randn(2, 3, target//2, target//2, generator=generator)
+    recon_mask_all = torch.randn(2, 9 * (target // 2 // patch)**2, patch, patch, generator=generator)
+    Y = CoefficientPyramid.empty(2, 3, target, packets_masks(size, target, patch), pool=FramePool())
+    Y.set_corner(Y_corner).set_mask_channels(target, recon_mask_all, patch)
+
+    assert torch.equal(Y.corner(target//2), Y_corner)
+    assert torch.equal(Y.mask_channels(target, patch), recon_mask_all)
+    assert torch.equal(Y.iwt(inv_filters), bench_wt.reconstruct_masks_chain(Y_corner, recon_mask_all, inv_filters, size,
+                                                                          pyramid_levels(size, patch), patch))